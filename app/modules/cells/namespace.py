@@ -32,22 +32,26 @@ class CellsNamespace(Namespace):
         code = payload['code']
         language = payload['language']
         cell_type = payload['cellType']
+        # Clients able to decode binary `code_result` frames ask for them with `framing: 'binary'`
+        framing = payload.get('framing')
         # If cell type is a file send to file handler
         sid = request.sid
         try:
             if cell_type == 'file':
                 file_path = payload['filePath']
-                resp = requests.get('http://{}:1111/file?path={}'.format(kernel_id, file_path)).json()
-                emit(EmittedCellEvents.CODE_RESULT, {
-                    'id': cell_id,
-                    'error': resp['error'],
-                    'output': resp['output']
+                # The kernel streams the output of the file to the cell as it arrives
+                requests.get('http://{}:1111/file'.format(kernel_id), params={
+                    'path': file_path,
+                    'cellId': cell_id,
+                    'channel': sid,
+                    'framing': framing
                 })
             else:
                 requests.post('http://{}:1111/repl?language={}'.format(kernel_id, language), json={
                     'code': code,
                     'cellId': cell_id,
-                    'channel': sid
+                    'channel': sid,
+                    'framing': framing
                 })
         except requests.exceptions.ConnectionError:
             emit(EmittedCellEvents.CODE_RESULT, {
@@ -56,6 +60,29 @@ class CellsNamespace(Namespace):
                'output': ''
             }, namespace=self.namespace, room=sid)
 
+    def _signal_cell(self, action, payload):
+        """Ask the kernel to interrupt or cancel the execution of a cell"""
+        cell_id = payload['cellId']
+        kernel_id = payload['kernelId']
+        try:
+            requests.post('http://{}:1111/{}'.format(kernel_id, action), params={
+                'cellId': cell_id
+            })
+        except requests.exceptions.ConnectionError:
+            emit(EmittedCellEvents.CODE_RESULT, {
+               'id': cell_id,
+               'error': 'Cannot find kernel {}'.format(kernel_id),
+               'output': ''
+            }, namespace=self.namespace, room=request.sid)
+
+    def on_code_interrupt(self, payload):
+        """Raise `KeyboardInterrupt` in, or send SIGINT to, the running cell"""
+        self._signal_cell('interrupt', payload)
+
+    def on_code_cancel(self, payload):
+        """Stop the cell, killing it if it does not exit within the grace period of the kernel"""
+        self._signal_cell('cancel', payload)
+
     def on_endpoint_create(self, payload):
         """Create a new endpoint for the given kernel."""
         cell_id = payload['cellId']
@@ -1,5 +1,6 @@
 # encoding: utf-8
 import re
+import requests
 from flask import request
 from urllib.parse import urlparse, parse_qs
 from flask_restplus_patched import Resource
@@ -7,7 +8,8 @@ from flask_socketio import SocketIO
 from slugify import slugify
 from app.extensions.api import Namespace
 
-from app.modules.cells.utils import get_path_configs, hydrate_path_configs, hydrate_query_configs, get_query_configs
+from app.modules.cells.utils import get_path_configs, hydrate_path_configs, hydrate_query_configs, get_query_configs, \
+    encode_frame, BINARY
 
 __author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
 
@@ -21,12 +23,35 @@ socketio = SocketIO(message_queue='redis://redis:6379')
 class CellOutputResource(Resource):
     def post(self):
         data = request.json
-        socketio.emit('code_result', {
+        payload = {
             'id': data['cellId'],
             'output': ''.join(data['lines']),
             'error': '',
             'streamType': data['streamType']
-        }, room=data['channel'], namespace='/cells')
+        }
+        if data.get('framing') == BINARY:
+            # Sent as a binary attachment, see `repl/common/frames.py`
+            payload = encode_frame(payload)
+        socketio.emit('code_result', payload, room=data['channel'], namespace='/cells')
+
+
+@api.route('/<string:kernel_id>/output/<string:cell_id>')
+class CellSpooledOutputResource(Resource):
+    def get(self, kernel_id, cell_id):
+        """Fetch a range of the output a kernel spooled to disk, for cells that printed more than the live preview"""
+        try:
+            resp = requests.get('http://{}:1111/output/{}'.format(kernel_id, cell_id), params={
+                key: request.args[key] for key in ('token', 'offset', 'length') if key in request.args
+            })
+        except requests.exceptions.ConnectionError:
+            return {
+                'message': 'Cannot find kernel {}'.format(kernel_id)
+            }, 404
+        if resp.status_code != 200:
+            return {
+                'message': resp.reason
+            }, resp.status_code
+        return resp.json()
 
 
 @api.route('/internal-endpoints/parse')
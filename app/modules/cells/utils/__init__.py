@@ -1,4 +1,5 @@
 # encoding: utf-8
 from .endpoint_uri_utils import *
+from repl.common.frames import *
 
 __author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
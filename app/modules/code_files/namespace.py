@@ -12,6 +12,8 @@ allows us to execute code and import modules and functions from other code files
 The files are always mounted at a specific root path in the container. Attempts to use relative path for file mounting
 will fail.
 """
+import gzip
+import json
 import logging
 import requests
 from flask import request
@@ -19,6 +21,7 @@ from flask_socketio import Namespace, emit
 
 
 from app.modules.cells.namespace import EmittedCellEvents
+from .utils import DELTA_MIN_SIZE, compute_delta, content_digest, delta_size
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +32,32 @@ class EmittedCodeFileEvents:
     CODE_FILE_NAME = 'code_file_name'
 
 
+def send_file_delta(kernel, file_path, content):
+    """Send only the chunks of content the kernel does not have. Returns the response of the kernel, or `None` if
+    the file must be sent in full.
+    """
+    resp = requests.get('http://{}:1111/file/chunks'.format(kernel), params={
+        'path': file_path
+    })
+    if resp.status_code != 200:
+        return None
+    base = resp.json()
+    if base['digest'] is None:
+        return None
+    ops = compute_delta(content, base['chunks'])
+    # Not worth it if most of the file changed
+    if delta_size(ops) > len(content) // 2:
+        return None
+    resp = requests.post('http://{}:1111/file/delta'.format(kernel), json={
+        'filePath': file_path,
+        'baseDigest': base['digest'],
+        'digest': content_digest(content),
+        'ops': ops
+    })
+    # 409 when the file changed in the meantime
+    return resp if resp.status_code == 200 else None
+
+
 class CodeFilesNamespace(Namespace):
     def __init__(self):
         super().__init__('/code-files')
@@ -59,12 +88,17 @@ class CodeFilesNamespace(Namespace):
         # Route the request to the container so that it can create the file
 
         try:
-            resp = requests.post('http://{}:1111/file'.format(kernel), json={
-                'content': content,
-                'filePath': file_path,
-                'cellId': cell_id,
-                'channel': sid
-            })
+            resp = None
+            if len(content) >= DELTA_MIN_SIZE:
+                # Large files are usually saved after small edits
+                resp = send_file_delta(kernel, file_path, content)
+            if resp is None:
+                resp = requests.post('http://{}:1111/file'.format(kernel), json={
+                    'content': content,
+                    'filePath': file_path,
+                    'cellId': cell_id,
+                    'channel': sid
+                })
             if resp.status_code == 200:
                 self.emit(EmittedCodeFileEvents.CODE_FILE_NAME, {
                     'id': payload['cellId'],
@@ -77,4 +111,48 @@ class CodeFilesNamespace(Namespace):
                'output': ''
             }, namespace=self.namespace, room=sid)
 
+    def on_code_files_create(self, payload):
+        """Mount many code files in a kernel with a single request, e.g. when a notebook is opened"""
+        sid = request.sid
+        kernel = payload['kernel']
+        files = payload['files']
+
+        logger.info('Mounting {count} files in kernel {kernel}'.format(
+            count=len(files),
+            kernel=kernel
+        ))
+
+        # The kernel skips the files whose content did not change, and code compresses well
+        body = gzip.compress(json.dumps({
+            'files': [{
+                'filePath': item['filePath'],
+                'content': item['content']
+            } for item in files]
+        }).encode('utf-8'))
 
+        try:
+            resp = requests.post('http://{}:1111/files'.format(kernel), data=body, headers={
+                'Content-Type': 'application/json',
+                'Content-Encoding': 'gzip'
+            })
+            if resp.status_code == 200:
+                for item, result in zip(files, resp.json()['files']):
+                    self.emit(EmittedCodeFileEvents.CODE_FILE_NAME, {
+                        'id': item['cellId'],
+                        'filePath': result['filePath']
+                    }, namespace=self.namespace, room=sid)
+            else:
+                for item in files:
+                    emit(EmittedCellEvents.CODE_RESULT, {
+                       'id': item['cellId'],
+                       'error': 'Could not mount {} in kernel {}: {} {}'.format(
+                           item['filePath'], kernel, resp.status_code, resp.reason),
+                       'output': ''
+                    }, namespace=self.namespace, room=sid)
+        except requests.exceptions.ConnectionError:
+            for item in files:
+                emit(EmittedCellEvents.CODE_RESULT, {
+                   'id': item['cellId'],
+                   'error': 'Cannot find kernel {}'.format(kernel),
+                   'output': ''
+                }, namespace=self.namespace, room=sid)
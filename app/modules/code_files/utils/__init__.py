@@ -0,0 +1,4 @@
+# encoding: utf-8
+from repl.common.file_delta import *
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
@@ -1,12 +1,104 @@
 # encoding: utf-8
+"""
+Kernel creators start the containers of kernels.
+
+Kernel containers used to run a plain base image (e.g. `python:3.6`) whose `start.sh` pip installed the dependencies
+of the kernel on every start, which took tens of seconds and failed without network. Creators now run the kernel in
+a runtime image, built once per kernel, base image and `requirements.txt` of the kernel, and reused afterwards:
+
+    FROM <base image>
+    RUN pip install --no-index --find-links <wheelhouse> -r requirements.txt
+
+Dependencies are installed from the wheelhouse, `repl/wheelhouse` or the directory named by `KERNEL_WHEELHOUSE`,
+falling back to the package index for anything missing. Populate it with wheels built for the base images, e.g.
+
+    docker run --rm -v $PWD/repl:/repl python:3.6 pip wheel -r /repl/python3/requirements.txt -w /repl/wheelhouse
+
+If the runtime image can not be built, the kernel runs on the base image and `start.sh` installs the dependencies as
+before. The time spent getting the image, starting the container and waiting for the kernel to answer is recorded in
+`BaseKernelCreator.boot_timings` and logged.
+"""
+import io
+import os
+import time
+import tarfile
+import hashlib
+import logging
+import threading
+
+from collections import deque
+from docker import errors as docker_errors, types as docker_types
+
+from app.utils import get_host_path
 
 __author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
 
 
+logger = logging.getLogger(__name__)
+
+
+# Kernel sources, mounted into the kernel containers
+REPL_ROOT = os.path.normpath(os.path.join(os.path.abspath(__file__), '../../../../../repl'))
+
+# Modules shared by the kernels and the app, mounted at `/opt/common` next to the kernel
+COMMON_ROOT = os.path.join(REPL_ROOT, 'common')
+
+RUNTIME_DOCKERFILE = """FROM {base_image}
+COPY requirements.txt /opt/kernel-runtime/requirements.txt
+COPY wheelhouse /opt/kernel-runtime/wheelhouse
+RUN pip install --no-index --find-links /opt/kernel-runtime/wheelhouse -r /opt/kernel-runtime/requirements.txt \\
+    || pip install --find-links /opt/kernel-runtime/wheelhouse -r /opt/kernel-runtime/requirements.txt
+"""
+
+# One build per runtime image at a time, kernels of other images start meanwhile
+_build_locks = {}
+_build_locks_lock = threading.Lock()
+
+
+def _image_exists(client, tag):
+    try:
+        client.images.get(tag)
+        return True
+    except docker_errors.ImageNotFound:
+        return False
+
+
+def _build_lock(tag):
+    with _build_locks_lock:
+        return _build_locks.setdefault(tag, threading.Lock())
+
+
+def _add_file(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+
+def _build_context(dockerfile, requirements, wheelhouse):
+    """Return the build context of a runtime image as a tar archive"""
+    context = io.BytesIO()
+    with tarfile.open(fileobj=context, mode='w') as tar:
+        _add_file(tar, 'Dockerfile', dockerfile)
+        _add_file(tar, 'requirements.txt', requirements)
+        info = tarfile.TarInfo('wheelhouse')
+        info.type = tarfile.DIRTYPE
+        info.mode = 0o755
+        tar.addfile(info)
+        if os.path.isdir(wheelhouse):
+            for name in sorted(os.listdir(wheelhouse)):
+                if name.endswith(('.whl', '.tar.gz', '.zip')):
+                    tar.add(os.path.join(wheelhouse, name), arcname='wheelhouse/' + name)
+    context.seek(0)
+    return context
+
+
 class BaseKernelCreator:
 
     registry = {}
 
+    # Boot timings of the last kernels, most recent last
+    boot_timings = deque(maxlen=100)
+
     @staticmethod
     def register_kernel_creator(image):
         def wrapper(cls):
@@ -35,6 +127,64 @@ class BaseKernelCreator:
             return container
         return None
 
+    @staticmethod
+    def common_mount(container_id):
+        """Mount of `repl/common`, read only, for a kernel started from the container with container_id, if any"""
+        common_path = COMMON_ROOT
+        if container_id:
+            common_path = get_host_path(container_id, common_path)
+        return docker_types.Mount('/opt/common', common_path, 'bind', read_only=True)
+
+    @staticmethod
+    def runtime_image_tag(kernel_dir, base_image, dockerfile, requirements):
+        """Tag of the runtime image, which changes with the base image, the Dockerfile or the requirements"""
+        digest = hashlib.sha1(dockerfile + requirements).hexdigest()[:12]
+        return 'runbook-kernel-{}:{}-{}'.format(kernel_dir, base_image.replace('/', '-').replace(':', '-'), digest)
+
+    @staticmethod
+    def ensure_runtime_image(client, kernel_dir, base_image):
+        """Return the runtime image of the kernel in `repl/<kernel_dir>` on top of base_image, building it if needed.
+        Returns base_image if the runtime image can not be built.
+        """
+        try:
+            with open(os.path.join(REPL_ROOT, kernel_dir, 'requirements.txt'), 'rb') as f:
+                requirements = f.read()
+        except FileNotFoundError:
+            return base_image
+        dockerfile = RUNTIME_DOCKERFILE.format(base_image=base_image).encode('utf-8')
+        tag = BaseKernelCreator.runtime_image_tag(kernel_dir, base_image, dockerfile, requirements)
+
+        # Built already, the common case, needs no lock
+        if _image_exists(client, tag):
+            return tag
+        with _build_lock(tag):
+            # Built by another kernel while waiting for the lock
+            if _image_exists(client, tag):
+                return tag
+            try:
+                if not _image_exists(client, base_image):
+                    client.images.pull(base_image)
+                logger.info('Building kernel runtime image {}'.format(tag))
+                wheelhouse = os.environ.get('KERNEL_WHEELHOUSE', os.path.join(REPL_ROOT, 'wheelhouse'))
+                client.images.build(fileobj=_build_context(dockerfile, requirements, wheelhouse),
+                                    custom_context=True, tag=tag, rm=True)
+                return tag
+            except (docker_errors.BuildError, docker_errors.APIError):
+                logger.exception('Could not build kernel runtime image {}, using {}'.format(tag, base_image))
+                return base_image
+
+    @staticmethod
+    def record_boot_timing(container_name, **phases):
+        """Record the seconds spent in the phases of the boot of a kernel"""
+        entry = {
+            'container': container_name,
+            'recordedAt': time.time()
+        }
+        entry.update({phase: round(seconds, 3) for phase, seconds in phases.items()})
+        BaseKernelCreator.boot_timings.append(entry)
+        logger.info('Kernel {} boot timings: {}'.format(container_name, ', '.join(
+            '{} {}s'.format(phase, entry[phase]) for phase in sorted(phases))))
+
     @staticmethod
     def create(kernel_def):
         raise NotImplementedError()
@@ -1,6 +1,7 @@
 # encoding: utf-8
 import os
-from docker import from_env, types as docker_types, errors as docker_errors
+import time
+from docker import from_env, types as docker_types
 
 from app.utils import get_container_id, get_host_path, get_container_network
 from .base import BaseKernelCreator
@@ -26,9 +27,11 @@ class PythonKernelCreator(BaseKernelCreator):
         # Names must be scoped to notebook as well to allow imports
         container_name = kernel_def['notebook_id'] + '_' + kernel_def['name']
 
+        started = time.monotonic()
         container = PythonKernelCreator.start_container_if_exited(client, container_name)
 
         if container:
+            PythonKernelCreator.record_boot_timing(container_name, restart=time.monotonic() - started)
             return container
         first_part = version.split('.')[0]
         if str(version) == 'latest':
@@ -38,11 +41,9 @@ class PythonKernelCreator(BaseKernelCreator):
         else:
             folder_tag = '2'
         tag = image + folder_tag
-        try:
-            client.images.get('{}:{}'.format(image, version))
-        except docker_errors.ImageNotFound:
-            # Pull the image / We don't support custom Dockerfile currently
-            client.images.pull('{}:{}'.format(image, version))
+        # The base image with the dependencies of the kernel installed, built once and reused
+        runtime_image = PythonKernelCreator.ensure_runtime_image(client, tag, '{}:{}'.format(image, version))
+        image_ready = time.monotonic()
 
         basedir = os.path.abspath(__file__)
         final_path = os.path.normpath(os.path.join(basedir, '../../../../../repl/{}'.format(tag)))
@@ -58,13 +59,13 @@ class PythonKernelCreator(BaseKernelCreator):
         # Spawn a container with given image that uses the same network as current container.
         # What if we are running `bare-metal` ? In this case, the ports need to be exposed,
         # and the details must be stored in the notebook state.
-        return client.containers.run('{}:{}'.format(
-            kernel_def['image'],
-            kernel_def.get('version', 'latest')),
+        container = client.containers.run(
+            runtime_image,
             '/bin/sh /opt/current/start.sh',
             detach=True,
             mounts=[
-                docker_types.Mount('/opt/current', final_path, 'bind')
+                docker_types.Mount('/opt/current', final_path, 'bind'),
+                PythonKernelCreator.common_mount(container_id)
             ],
             environment={
                 'SERVER_URI': 'http://internal-api:8763'
@@ -74,3 +75,6 @@ class PythonKernelCreator(BaseKernelCreator):
             network=get_container_network(container_id),
             name=container_name
         )
+        PythonKernelCreator.record_boot_timing(container_name, image=image_ready - started,
+                                               container=time.monotonic() - image_ready)
+        return container
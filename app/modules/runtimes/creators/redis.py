@@ -1,5 +1,6 @@
 # encoding: utf-8
 import os
+import time
 from docker import from_env, types as docker_types, errors as docker_errors
 
 from app.utils import get_container_id, get_host_path, get_container_network
@@ -28,6 +29,7 @@ class RedisKernelCreator(BaseKernelCreator):
 
         redis_container_name = container_name + '_' + 'dbi'
 
+        started = time.monotonic()
         main_container = RedisKernelCreator.start_container_if_exited(client, container_name)
         db_container = RedisKernelCreator.start_container_if_exited(client, redis_container_name)
 
@@ -60,14 +62,19 @@ class RedisKernelCreator(BaseKernelCreator):
             )
 
         if main_container:
+            RedisKernelCreator.record_boot_timing(container_name, restart=time.monotonic() - started)
             return main_container
         else:
-            return client.containers.run(
-                'python:3.5',
+            # Python with the dependencies of the kernel installed, built once and reused
+            runtime_image = RedisKernelCreator.ensure_runtime_image(client, 'redis', 'python:3.5')
+            image_ready = time.monotonic()
+            container = client.containers.run(
+                runtime_image,
                 '/bin/sh /opt/current/start.sh',
                 detach=True,
                 mounts=[
-                    docker_types.Mount('/opt/current', final_path, 'bind')
+                    docker_types.Mount('/opt/current', final_path, 'bind'),
+                    RedisKernelCreator.common_mount(container_id)
                 ],
                 environment={
                     'REDIS_HOST': redis_container_name,
@@ -77,3 +84,6 @@ class RedisKernelCreator(BaseKernelCreator):
                 network=get_container_network(container_id),
                 name=container_name
             )
+            RedisKernelCreator.record_boot_timing(container_name, image=image_ready - started,
+                                                  container=time.monotonic() - image_ready)
+            return container
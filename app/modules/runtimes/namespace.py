@@ -17,6 +17,7 @@ projects, and can create server endpoints which can block REPL code execution.
 """
 import logging
 import requests
+from time import monotonic
 from flask import request, current_app
 from flask_socketio import Namespace, emit, SocketIO
 
@@ -94,6 +95,7 @@ class RuntimeNamespace(Namespace):
         with app.app_context():
             offset = 0
             time = 0
+            started = monotonic()
             sio = SocketIO(message_queue='redis://redis:6379')
             while True:
                 if time > timeout:
@@ -119,6 +121,7 @@ class RuntimeNamespace(Namespace):
                     resp = requests.get('http://{}:1111/ping'.format(kernel_name))
                     if resp.status_code == 200:
                         logger.info('Kernel {} is ready'.format(kernel_name))
+                        BaseKernelCreator.record_boot_timing(kernel_name, ready=monotonic() - started)
                         emit(EmittedKernelEvents.KERNEL_STATUS, {
                             'id': unique_name,
                             'status': 'ready'
@@ -0,0 +1,92 @@
+# encoding: utf-8
+"""
+Path and query templates of endpoints.
+
+Endpoint configs describe their arguments with templates, e.g. a path of `/users/<int:user_id>` and a query of
+`<bool:verbose=false>`. The backend (`app.modules.cells.utils.endpoint_uri_utils`) and the endpoint router of the
+Python kernel parse them with this module, so both agree on the arguments of an endpoint.
+
+Modules of `repl/common` are shared by the kernels and the app. They are mounted at `/opt/common` in the kernel
+containers and must only import the standard library.
+"""
+import re
+import unicodedata
+
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+DATA_TYPE_MAPPING = {
+    'string': str,
+    'int': int,
+    'number': float,
+    'bool': bool
+}
+
+# An argument of a template, e.g. `<int:user_id=1>`
+PARAM_PATTERN = re.compile(r"(<[^<>/]+>)")
+
+
+def slugify(value):
+    """Same output as `slugify(value, separator='_')` of `python-slugify` for the argument names we support"""
+    value = unicodedata.normalize('NFKD', value).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', '_', value.lower()).strip('_')
+
+
+def typecast_value(value, klass):
+    if value is None:
+        return value
+    if isinstance(value, list):
+        return [typecast_value(v, klass) for v in value]
+    try:
+        if klass == bool:
+            return False if (not value or (value and value.lower() == 'false')) else True
+        return klass(value)
+    except ValueError:
+        raise ValueError('Incorrect value {} supplied for type {}'.format(value, klass))
+
+
+def parse_arg_and_default_value(config):
+    """Parse default value from param config"""
+    parts = config.split('=')
+    if len(parts) == 1:
+        return slugify(parts[0]), None
+    else:
+        return slugify(parts[0]), parts[1]
+
+
+def parse_param_config(original_config, param_name='path'):
+    """Parse a path or query string config and return type and default value."""
+    config = re.sub(r'[<>]', '', original_config)
+    data_type = str
+    if not len(config):
+        raise ValueError('{} config parameter cannot be empty'.format(param_name))
+    parts = config.split(':')
+    if len(parts) == 1:
+        # Check if default value is provided
+        arg, default_value = parse_arg_and_default_value(parts[0])
+    else:
+        try:
+            data_type = DATA_TYPE_MAPPING[parts[0].strip()]
+        except KeyError:
+            raise ValueError('Invalid datatype supplied in {} config {}'.format(param_name, parts[0]))
+        arg, default_value = parse_arg_and_default_value(parts[1].strip())
+    if not arg:
+        raise ValueError('Invalid name supplied for {}'.format(param_name))
+    return {
+        'dataType': data_type,
+        'raw': original_config,
+        'arg': arg,
+        'defaultValue': typecast_value(default_value, data_type)
+    }
+
+
+def parse_template(template, param_name='path'):
+    """Return the configs of the arguments of a path or query template. Raises `ValueError` if a name is repeated."""
+    configs = [parse_param_config(item, param_name) for item in PARAM_PATTERN.findall(template or '')]
+    names = set()
+    for config in configs:
+        if config['arg'] in names:
+            raise ValueError('Argument {} appears more than once in {} config'.format(config['arg'], param_name))
+        names.add(config['arg'])
+    return configs
@@ -0,0 +1,106 @@
+# encoding: utf-8
+"""
+Delta updates of code files.
+
+Saving a code file used to send its whole content to the kernel, even for a one character edit to a large file.
+Large files are now synced with a delta negotiated by hashes:
+
+1. The backend asks the kernel for the chunks of the file on disk (`GET /file/chunks?path=...`). The kernel replies
+   with the digest of the file and the hashes of its chunks.
+2. The backend splits the new content the same way and sends only the chunks the kernel does not have
+   (`POST /file/delta`), as a list of operations:
+
+       ['copy', index, count]  Copy count chunks of the file on disk, starting at index
+       ['data', text]          Insert text
+
+3. The kernel checks the digest of the file on disk against `baseDigest`, rebuilds the content, checks it against
+   `digest` and writes it atomically. If either check fails it replies with 409 and the backend sends the full file.
+
+Chunks are made of whole lines. A line ends a chunk when its CRC matches `CHUNK_MASK`, so chunk boundaries depend on
+the content and not on offsets: inserting a line only changes the chunk it lands in. The backend
+(`app.modules.code_files.utils`) and the Python kernel share this module, so they always split files the same way.
+"""
+import zlib
+import hashlib
+
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+__all__ = ['DELTA_MIN_SIZE', 'split_chunks', 'chunk_hash', 'content_digest', 'compute_delta', 'delta_size',
+           'apply_delta']
+
+
+# Files smaller than this are always sent in full, a delta would not save a round trip
+DELTA_MIN_SIZE = 64 * 1024
+
+# A line whose CRC has these bits unset ends a chunk, giving chunks of 32 lines on average
+CHUNK_MASK = 0x1f
+
+# Upper bound of the number of lines in a chunk
+MAX_CHUNK_LINES = 256
+
+
+def split_chunks(content):
+    """Split content into chunks of whole lines at content defined boundaries"""
+    chunks = []
+    lines = []
+    for line in content.splitlines(True):
+        lines.append(line)
+        if not zlib.crc32(line.encode('utf-8')) & CHUNK_MASK or len(lines) >= MAX_CHUNK_LINES:
+            chunks.append(''.join(lines))
+            lines = []
+    if lines:
+        chunks.append(''.join(lines))
+    return chunks
+
+
+def chunk_hash(chunk):
+    return hashlib.sha1(chunk.encode('utf-8')).hexdigest()[:16]
+
+
+def content_digest(content):
+    """Digest of a whole file"""
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def compute_delta(content, base_chunks):
+    """Return the operations building content out of the chunks, given by hash, of the file in the kernel"""
+    index = {}
+    for i, chunk in enumerate(base_chunks):
+        index.setdefault(chunk, i)
+    ops = []
+    for chunk in split_chunks(content):
+        i = index.get(chunk_hash(chunk))
+        if i is None:
+            if ops and ops[-1][0] == 'data':
+                ops[-1][1] += chunk
+            else:
+                ops.append(['data', chunk])
+        elif ops and ops[-1][0] == 'copy' and ops[-1][1] + ops[-1][2] == i:
+            # Extend the run of consecutive chunks
+            ops[-1][2] += 1
+        else:
+            ops.append(['copy', i, 1])
+    return ops
+
+
+def delta_size(ops):
+    """Number of characters of content sent by ops"""
+    return sum(len(op[1]) for op in ops if op[0] == 'data')
+
+
+def apply_delta(base_content, ops):
+    """Return the content described by ops over the chunks of base_content. Raises `ValueError` on invalid ops."""
+    chunks = split_chunks(base_content)
+    parts = []
+    for op in ops:
+        if op[0] == 'copy':
+            start, count = op[1], op[2]
+            if start < 0 or count < 1 or start + count > len(chunks):
+                raise ValueError('Chunks {} to {} are out of range'.format(start, start + count))
+            parts.extend(chunks[start:start + count])
+        elif op[0] == 'data':
+            parts.append(op[1])
+        else:
+            raise ValueError('Unknown delta operation {}'.format(op[0]))
+    return ''.join(parts)
@@ -0,0 +1,121 @@
+# encoding: utf-8
+"""
+Binary framing of `code_result` events.
+
+`code_result` events are JSON objects, so every chunk of output is escaped on the way out and decoded again by the
+browser, and bytes can not be sent at all. Channels can opt into binary frames instead, by passing
+`framing=binary` with the execution request. Every `code_result` event on the channel is then a single binary
+Socket.IO attachment:
+
+    <msgpack envelope><output bytes><error bytes>
+
+The envelope is a msgpack map holding the fields of the JSON event, except that `output` and `error`, when they are
+text or bytes, are replaced by the byte lengths of the raw payloads following it:
+
+    {'version': 1, 'id': ..., 'outputLength': 5, 'errorLength': 0, 'done': True, ...}
+
+Any msgpack decoder reads the envelope, the payloads are sliced from the rest of the frame without any decoding. The
+kernels and the app use the `msgpack` package.
+
+The default framing of channels is read from the environment:
+
+    KERNEL_CODE_RESULT_FRAMING  `json` or `binary`. (json)
+
+The kernels and the app share this module, see `repl/common`.
+"""
+import io
+import os
+
+from collections import OrderedDict
+
+import msgpack
+
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+__all__ = ['JSON', 'BINARY', 'packb', 'unpackb', 'encode_frame', 'decode_frame', 'ChannelFraming']
+
+JSON = 'json'
+BINARY = 'binary'
+
+FRAME_VERSION = 1
+
+# Number of channels whose framing is remembered
+MAX_CHANNELS = 1024
+
+
+def packb(obj):
+    """Serialize obj with msgpack"""
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def unpackb(data, offset=0):
+    """Deserialize the msgpack object at offset of data. Returns `(obj, end_offset)`."""
+    stream = io.BytesIO(data)
+    stream.seek(offset)
+    unpacker = msgpack.Unpacker(stream, raw=False)
+    return unpacker.unpack(), offset + unpacker.tell()
+
+
+def _payload(value):
+    if isinstance(value, str):
+        return value.encode('utf-8')
+    return bytes(value)
+
+
+def encode_frame(payload):
+    """Encode the fields of a `code_result` event as a binary frame"""
+    envelope = dict(payload, version=FRAME_VERSION)
+    payloads = []
+    # Output first, then error
+    for key in ('output', 'error'):
+        if isinstance(envelope.get(key), (str, bytes, bytearray)):
+            data = _payload(envelope.pop(key))
+            envelope[key + 'Length'] = len(data)
+            payloads.append(data)
+    return packb(envelope) + b''.join(payloads)
+
+
+def decode_frame(frame):
+    """Decode a binary frame back into the fields of the event, with `output` and `error` as bytes"""
+    envelope, offset = unpackb(frame)
+    envelope.pop('version', None)
+    for key in ('output', 'error'):
+        length = envelope.pop(key + 'Length', None)
+        if length is not None:
+            envelope[key] = bytes(frame[offset:offset + length])
+            offset += length
+    return envelope
+
+
+class ChannelFraming:
+    """Framing of the `code_result` events of each channel, as requested by its executions"""
+    def __init__(self, default=JSON, max_channels=MAX_CHANNELS):
+        self.default = default
+        self.max_channels = max_channels
+        self._channels = OrderedDict()
+
+    @classmethod
+    def from_environ(cls, environ=None):
+        environ = os.environ if environ is None else environ
+        return cls(environ.get('KERNEL_CODE_RESULT_FRAMING', JSON))
+
+    def set(self, channel, framing):
+        """Remember the framing requested for the channel, if any"""
+        if framing is None:
+            return
+        if framing not in (JSON, BINARY):
+            raise ValueError('Unknown framing {}'.format(framing))
+        self._channels.pop(channel, None)
+        self._channels[channel] = framing
+        while len(self._channels) > self.max_channels:
+            self._channels.popitem(last=False)
+
+    def get(self, channel):
+        return self._channels.get(channel, self.default)
+
+    def encode(self, channel, payload):
+        """Return the data of a `code_result` event for the channel"""
+        if self.get(channel) == BINARY:
+            return encode_frame(payload)
+        return payload
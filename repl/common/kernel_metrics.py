@@ -0,0 +1,61 @@
+# encoding: utf-8
+"""
+Prometheus metrics shared by the kernels, served at `/metrics`:
+
+    kernel_execution_seconds{kind}      Histogram of the wall time of executions, by kind of execution
+    kernel_socketio_emit_seconds        Histogram of the time spent emitting `code_result` events
+    kernel_socketio_emit_bytes_total    Bytes of `code_result` payloads emitted
+
+Binary frames count their length. JSON messages are serialized by the message queue, so they count the UTF-8 bytes of
+the output and error they carry rather than being serialized twice.
+"""
+import time
+
+from prometheus_client import Histogram, Counter, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+EXECUTION_SECONDS = Histogram(
+    'kernel_execution_seconds',
+    'Wall time of executions',
+    ['kind'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, float('inf')))
+
+EMIT_SECONDS = Histogram('kernel_socketio_emit_seconds', 'Time spent emitting code_result events')
+
+EMIT_BYTES = Counter('kernel_socketio_emit_bytes_total', 'Bytes of code_result payloads emitted')
+
+
+def _text_size(value):
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        # The Redis kernel outputs lists for array replies
+        return sum(_text_size(item) for item in value)
+    return len(str(value).encode('utf-8'))
+
+
+def payload_size(message):
+    """Bytes of a `code_result` message: the length of a binary frame, the output and error of a JSON message"""
+    if isinstance(message, (bytes, bytearray)):
+        return len(message)
+    return _text_size(message.get('output')) + _text_size(message.get('error'))
+
+
+def observe_execution(kind, seconds):
+    EXECUTION_SECONDS.labels(kind).observe(seconds)
+
+
+def observe_emit(started, message):
+    """Record the emit of message that started at `started` (`time.monotonic()`)"""
+    EMIT_SECONDS.observe(time.monotonic() - started)
+    EMIT_BYTES.inc(payload_size(message))
+
+
+def render_metrics():
+    """Return the content type and the body of a scrape"""
+    return CONTENT_TYPE_LATEST, generate_latest(REGISTRY)
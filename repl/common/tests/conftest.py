@@ -0,0 +1,10 @@
+# encoding: utf-8
+import os
+import sys
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+# Shared modules are not packaged. The kernels import them from `/opt/common`, where this directory is mounted, so make
+# it importable for the tests.
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
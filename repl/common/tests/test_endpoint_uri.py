@@ -0,0 +1,41 @@
+# encoding: utf-8
+import pytest
+
+from endpoint_uri import slugify, parse_param_config, parse_template
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('args', [
+    ('a_1', 'a_1'),
+    ('b a', 'b_a'),
+    (' User-Id ', 'user_id')
+])
+def test_slugify(args):
+    assert slugify(args[0]) == args[1]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('args', [
+    ('<string:a_1>', {'dataType': str, 'arg': 'a_1', 'defaultValue': None}),
+    ('<int:a 1=2>', {'dataType': int, 'arg': 'a_1', 'defaultValue': 2}),
+    ('<bool:a 1=false>', {'dataType': bool, 'arg': 'a_1', 'defaultValue': False}),
+    ('<string:name=abc>', {'dataType': str, 'arg': 'name', 'defaultValue': 'abc'})
+])
+def test_parse_param_config(args):
+    config = parse_param_config(args[0])
+    assert {k: config[k] for k in args[1]} == args[1]
+
+
+@pytest.mark.unit
+def test_parse_template():
+    configs = parse_template('<string:name> <number:ratio=0.5>', 'query')
+    assert [(config['arg'], config['defaultValue']) for config in configs] == [('name', None), ('ratio', 0.5)]
+    assert parse_template(None) == []
+
+
+@pytest.mark.unit
+def test_parse_template_repeated_name():
+    with pytest.raises(ValueError):
+        parse_template('/<int:user_id>/<string:user id>')
@@ -0,0 +1,64 @@
+# encoding: utf-8
+import pytest
+
+from file_delta import split_chunks, chunk_hash, compute_delta, delta_size, apply_delta
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+BASE = ''.join('value_{} = {}\n'.format(i, i * i) for i in range(2000))
+
+
+@pytest.mark.unit
+def test_insertion_changes_one_chunk():
+    chunks = split_chunks(BASE)
+    edited = split_chunks(BASE.replace('value_1000 = ', 'value_1000 = 1 + '))
+    assert len(set(edited) - set(chunks)) == 1
+
+
+@pytest.mark.unit
+def test_apply_delta():
+    count = len(split_chunks(BASE))
+    ops = [['data', 'import os\n'], ['copy', 0, count]]
+    assert apply_delta(BASE, ops) == 'import os\n' + BASE
+    assert apply_delta(BASE, [['copy', 1, count - 1]]) == ''.join(split_chunks(BASE)[1:])
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('ops', [
+    [['copy', 0, 100000]],
+    [['copy', -1, 1]],
+    [['copy', 0, 0]],
+    [['move', 0, 1]]
+])
+def test_apply_invalid_delta(ops):
+    with pytest.raises(ValueError):
+        apply_delta(BASE, ops)
+
+
+@pytest.mark.unit
+def test_split_chunks_keeps_content():
+    chunks = split_chunks(BASE + 'no newline at the end')
+    assert ''.join(chunks) == BASE + 'no newline at the end'
+    assert 20 < len(chunks) < 200
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('content', [
+    BASE,
+    'import os\n' + BASE,
+    BASE.replace('value_1000 = ', 'value_1000 = 1 + '),
+    BASE[:len(BASE) // 2] + BASE[len(BASE) // 2 + 100:],
+    BASE.replace('\n', '\r\n', 10)
+])
+def test_compute_delta(content):
+    base_chunks = [chunk_hash(chunk) for chunk in split_chunks(BASE)]
+    ops = compute_delta(content, base_chunks)
+    assert apply_delta(BASE, ops) == content
+    # Small edits only send a few chunks
+    assert delta_size(ops) < len(content) // 10
+
+
+@pytest.mark.unit
+def test_compute_delta_of_new_content():
+    assert compute_delta('a\nb\n', []) == [['data', 'a\nb\n']]
@@ -0,0 +1,75 @@
+# encoding: utf-8
+import pytest
+
+pytest.importorskip('msgpack')
+
+from frames import unpackb, encode_frame, decode_frame, ChannelFraming, JSON, BINARY
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+@pytest.mark.unit
+def test_frame_round_trip():
+    payload = {
+        'id': 'cell',
+        'output': 'héllo\n',
+        'error': b'\x00\x01',
+        'done': True,
+        'usage': {'wallTime': 0.5, 'maxRss': None}
+    }
+    frame = encode_frame(payload)
+    envelope, offset = unpackb(frame)
+    assert envelope['outputLength'] == 7
+    assert envelope['errorLength'] == 2
+    # The payloads follow the envelope as they are
+    assert frame[offset:] == 'héllo\n'.encode('utf-8') + b'\x00\x01'
+    assert decode_frame(frame) == dict(payload, output='héllo\n'.encode('utf-8'))
+
+
+@pytest.mark.unit
+def test_frame_keeps_structured_output():
+    # The Redis kernel outputs lists for array replies
+    assert decode_frame(encode_frame({'id': 'a', 'output': ['1', 'b'], 'error': ''})) == {
+        'id': 'a',
+        'output': ['1', 'b'],
+        'error': b''
+    }
+
+
+@pytest.mark.unit
+def test_channel_framing_set():
+    framing = ChannelFraming(max_channels=2)
+    framing.set('one', BINARY)
+    # Executions that do not ask for a framing keep the one of the channel
+    framing.set('one', None)
+    assert framing.get('one') == BINARY
+    assert framing.get('other') == JSON
+    with pytest.raises(ValueError):
+        framing.set('one', 'xml')
+    assert framing.get('one') == BINARY
+
+
+@pytest.mark.unit
+def test_channel_framing_forgets_the_least_recently_set_channel():
+    framing = ChannelFraming(max_channels=2)
+    framing.set('one', BINARY)
+    framing.set('two', BINARY)
+    framing.set('one', BINARY)
+    framing.set('three', BINARY)
+    assert (framing.get('one'), framing.get('two'), framing.get('three')) == (BINARY, JSON, BINARY)
+
+
+@pytest.mark.unit
+def test_channel_framing_encode():
+    framing = ChannelFraming()
+    payload = {'id': 'a', 'output': 'x', 'error': ''}
+    framing.set('binary', BINARY)
+    assert decode_frame(framing.encode('binary', payload)) == {'id': 'a', 'output': b'x', 'error': b''}
+    # JSON messages are serialized by the message queue
+    assert framing.encode('json', payload) is payload
+
+
+@pytest.mark.unit
+def test_channel_framing_from_environ():
+    assert ChannelFraming.from_environ({}).get('a') == JSON
+    assert ChannelFraming.from_environ({'KERNEL_CODE_RESULT_FRAMING': BINARY}).get('a') == BINARY
@@ -0,0 +1,20 @@
+# encoding: utf-8
+import pytest
+
+pytest.importorskip('prometheus_client')
+
+from kernel_metrics import payload_size
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('args', [
+    (b'\x81\xa2id\xa1a', 6),
+    ({'id': 'a', 'output': 'héllo', 'error': ''}, 6),
+    ({'id': 'a', 'output': '', 'error': '€'}, 3),
+    ({'id': 'a', 'output': ['1', ['é', 'b']], 'error': ''}, 4),
+    ({'id': 'a', 'done': True}, 0)
+])
+def test_payload_size(args):
+    assert payload_size(args[0]) == args[1]
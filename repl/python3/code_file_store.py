@@ -0,0 +1,77 @@
+# encoding: utf-8
+"""
+Code files mounted into the kernel.
+
+Every code file written to the kernel goes through `CodeFileStore`, which writes it below the file path root and
+tells the interested parties (e.g. the endpoint registry) which files changed.
+
+Opening a notebook mounts all of its code files at once. `write_many` writes a batch of files in one pass, skipping
+the files whose content already matches the file on disk, and notifies listeners once for the whole batch.
+"""
+import os
+import logging
+
+from endpoint_worker import content_digest
+from result_cache import FileDigests
+
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+logger = logging.getLogger(__name__)
+
+
+class CodeFileStore:
+    """Write code files below file_path_root and notify listeners of the changes"""
+    def __init__(self, file_path_root, file_digests=None):
+        self.file_path_root = file_path_root
+        self.file_digests = file_digests or FileDigests()
+        self._listeners = []
+
+    def full_path(self, file_path):
+        return os.path.normpath(os.path.join(self.file_path_root, file_path))
+
+    def add_listener(self, listener):
+        """Register a callable that receives the list of full paths changed by every write"""
+        self._listeners.append(listener)
+
+    def _write(self, full_path, content):
+        base_dir = os.path.dirname(full_path)
+        if not os.path.exists(base_dir):
+            os.makedirs(base_dir)
+        # Write to a temporary file and move it in place, so readers never see a partially written file
+        tmp_path = '{}.{}.tmp'.format(full_path, os.getpid())
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, full_path)
+
+    def write(self, file_path, content):
+        """Write content to file_path, relative to the root. Returns the full path."""
+        full_path = self.full_path(file_path)
+        self._write(full_path, content)
+        self.notify([full_path])
+        return full_path
+
+    def write_many(self, files):
+        """Write `(file_path, content)` pairs, skipping unchanged files. Returns `(full_path, written)` pairs."""
+        results = []
+        changed = []
+        for file_path, content in files:
+            full_path = self.full_path(file_path)
+            # Digests of files on disk are cached by mtime and size, so unchanged files are not read again
+            if self.file_digests.get(full_path) == content_digest(content):
+                results.append((full_path, False))
+                continue
+            self._write(full_path, content)
+            changed.append(full_path)
+            results.append((full_path, True))
+        if changed:
+            self.notify(changed)
+        return results
+
+    def notify(self, full_paths):
+        for listener in self._listeners:
+            try:
+                listener(full_paths)
+            except Exception:
+                logger.exception('Error while notifying code file change')
@@ -0,0 +1,126 @@
+# encoding: utf-8
+"""
+In-memory registry of endpoints.
+
+Serving an endpoint request used to open and parse `endpoints/<name>.config` and read the whole endpoint source on
+every request. The registry keeps the config, its compiled router and the digest of the endpoint source in memory.
+It is populated eagerly when an endpoint is registered, and kept up to date in two ways:
+
+* Writes made through the kernel (`CodeFileStore`) refresh the entries of the files they touch right away.
+* Files changed behind the back of the kernel (e.g. by a shell cell) are caught by comparing the mtime and size of
+  the config and the source, at most once every `check_interval` seconds per endpoint.
+
+When nothing has changed, looking up an endpoint does no disk I/O.
+"""
+import os
+import json
+import time
+
+from endpoint_router import CompiledEndpoint
+from endpoint_worker import content_digest
+from result_cache import parse_cache_config
+
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+def _stat_key(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class EndpointEntry:
+    """A registered endpoint"""
+    def __init__(self, config, config_path, source_path):
+        self.config = config
+        self.name = config['name']
+        self.signature = config['signature']
+        self.route = CompiledEndpoint(config)
+        # Seconds results are cached for, `None` if the endpoint is not cached
+        self.cache_ttl = parse_cache_config(config)
+        self.config_path = config_path
+        self.source_path = source_path
+        self.config_stat = None
+        self.source_stat = None
+        # Digest of the endpoint source, `None` if the source file is missing
+        self.digest = None
+        self.checked_at = 0
+
+    def read_source(self):
+        self.source_stat = _stat_key(self.source_path)
+        try:
+            with open(self.source_path, 'rb') as f:
+                self.digest = content_digest(f.read())
+        except FileNotFoundError:
+            self.digest = None
+        self.checked_at = time.monotonic()
+
+
+class EndpointRegistry:
+    """Endpoint configs, routes and source digests, keyed by endpoint name"""
+    def __init__(self, file_path_root, check_interval=1.0):
+        self.file_path_root = file_path_root
+        self.check_interval = check_interval
+        self._entries = {}
+
+    def _config_path(self, name):
+        return os.path.normpath(os.path.join(self.file_path_root, 'endpoints', '{}.config'.format(name)))
+
+    def _create_entry(self, config, config_path):
+        entry = EndpointEntry(
+            config,
+            config_path,
+            os.path.normpath(os.path.join(self.file_path_root, config['filePath'])))
+        entry.config_stat = _stat_key(config_path)
+        entry.read_source()
+        self._entries[entry.name] = entry
+        return entry
+
+    def register(self, config):
+        """Compile and store the endpoint config. Raises `ValueError` if its templates or cache options are invalid."""
+        config_path = self._config_path(config['name'])
+        # Compile before anything is written, so an invalid config does not replace a valid one
+        CompiledEndpoint(config)
+        parse_cache_config(config)
+        base_dir = os.path.dirname(config_path)
+        if not os.path.exists(base_dir):
+            os.makedirs(base_dir)
+        # The endpoint configuration is persisted, so endpoints survive a kernel restart
+        with open(config_path, 'w') as f:
+            f.write(json.dumps(config))
+        return self._create_entry(config, config_path)
+
+    def _load(self, name):
+        config_path = self._config_path(name)
+        try:
+            with open(config_path, 'r') as f:
+                config = json.loads(f.read())
+        except FileNotFoundError:
+            self._entries.pop(name, None)
+            raise KeyError(name)
+        return self._create_entry(config, config_path)
+
+    def get(self, name):
+        """Return the entry of the endpoint. Raises `KeyError` if the endpoint is not defined."""
+        entry = self._entries.get(name)
+        if entry is None:
+            # Registered before the kernel restarted
+            return self._load(name)
+        now = time.monotonic()
+        if now - entry.checked_at >= self.check_interval:
+            if _stat_key(entry.config_path) != entry.config_stat:
+                return self._load(name)
+            if _stat_key(entry.source_path) != entry.source_stat:
+                entry.read_source()
+            entry.checked_at = now
+        return entry
+
+    def on_files_changed(self, full_paths):
+        """`CodeFileStore` listener. Refresh the digests of the endpoints wrapping the changed files."""
+        full_paths = set(full_paths)
+        for entry in self._entries.values():
+            if entry.source_path in full_paths:
+                entry.read_source()
@@ -0,0 +1,67 @@
+# encoding: utf-8
+"""
+In-kernel endpoint router.
+
+Endpoint configs describe their arguments with templates, e.g. a path of `/users/<int:user_id>` and a query of
+`<bool:verbose=false>`. The kernel used to ask the backend (`/api/v1/cells/internal-endpoints/parse`) to extract
+the arguments from every request, which added a network hop per request and made the backend a bottleneck for all
+endpoint traffic.
+
+The templates are now compiled once, when the endpoint is registered, into a `CompiledEndpoint` holding the path
+regex and the typecasters of each argument. Requests are matched in process. Templates are parsed by `endpoint_uri`,
+shared with the backend.
+"""
+import re
+
+from urllib.parse import urlparse, parse_qs
+
+from endpoint_uri import typecast_value, parse_template
+
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+class CompiledEndpoint:
+    """The path and query templates of an endpoint, compiled into a matcher"""
+    def __init__(self, config):
+        self.name = config['name']
+        self.path_template = config.get('path') or ''
+        self.prefix = '/endpoints/{}'.format(self.name)
+        self.path_configs = parse_template(self.path_template)
+        self.query_configs = parse_template(config.get('query'), 'query')
+        repeated = {item['arg'] for item in self.path_configs} & {item['arg'] for item in self.query_configs}
+        if repeated:
+            raise ValueError('Arguments {} appear in both the path and the query config'.format(
+                ', '.join(sorted(repeated))))
+        pattern = self.path_template
+        for item in self.path_configs:
+            pattern = pattern.replace(item['raw'], '(?P<{}>[^/]+)'.format(item['arg']))
+        try:
+            self.path_pattern = re.compile('/?' + pattern)
+        except re.error as e:
+            raise ValueError('Invalid path config {}: {}'.format(self.path_template, e))
+
+    def match(self, request_uri):
+        """Return the arguments of request_uri keyed by name. Raises `ValueError` if the request does not match."""
+        result = urlparse(request_uri)
+        args = {}
+
+        match = self.path_pattern.search(result.path.replace(self.prefix, ''))
+        if not match:
+            raise ValueError('Invalid path supplied. Path must match format {}'.format(self.path_template))
+        for config in self.path_configs:
+            value = typecast_value(match.group(config['arg']), config['dataType'])
+            args[config['arg']] = config['defaultValue'] if value is None else value
+
+        parsed_query = parse_qs(result.query)
+        for config in self.query_configs:
+            if config['defaultValue'] is None:
+                if config['arg'] not in parsed_query:
+                    raise ValueError('Missing query argument {}'.format(config['arg']))
+                value = parsed_query[config['arg']]
+            else:
+                value = parsed_query.get(config['arg'], config['defaultValue'])
+            if isinstance(value, list) and len(value) == 1:
+                value = value[0]
+            args[config['arg']] = typecast_value(value, config['dataType'])
+        return args
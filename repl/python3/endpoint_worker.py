@@ -0,0 +1,178 @@
+# encoding: utf-8
+"""
+Persistent endpoint workers.
+
+An endpoint wraps a code file. Its config names the file and a `signature`, a call expression such as
+`get_user(user_id)` whose arguments are bound from the path and query of the request. Endpoints used to be served
+by appending the arguments and a `print(<signature>)` to a copy of the file and running it in a fresh interpreter.
+
+An endpoint worker instead imports the file once, keeps its namespace alive and evaluates the signature for every
+request with the parsed arguments received over a `multiprocessing.Pipe`:
+
+    server -> worker: {'args': {...}}
+    worker -> server: {'output': ..., 'error': ..., 'imports': [...]}
+
+Output has the same shape as before, i.e. anything printed while the signature is evaluated followed by the
+printed result. `imports` lists the code files below the file path root imported by the worker, so the server can
+tell when they change. The worker is replaced when the content of the file or of its imports changes. The worker
+being replaced is stopped once the requests it is serving are done.
+
+Workers are started in a fresh interpreter (see `kernel_process`), so the endpoint file imports its own code files
+rather than modules of the kernel server with the same name.
+"""
+import os
+import sys
+import runpy
+import hashlib
+import logging
+import threading
+import traceback
+import contextlib
+import multiprocessing
+
+from io import StringIO
+
+from kernel_process import start_process
+
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+logger = logging.getLogger(__name__)
+
+
+def content_digest(content):
+    """Return the digest used to detect changes to an endpoint file"""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.sha1(content).hexdigest()
+
+
+def _load(file_path, file_path_root, signature):
+    """Import the endpoint file and compile its signature. Returns `(namespace, expression, error)`."""
+    os.chdir(file_path_root)
+    sys.path[0:0] = [os.path.dirname(file_path), file_path_root]
+    sys.argv = [file_path]
+    out = StringIO()
+    err = StringIO()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        try:
+            # Run as `__main__`, like the script the endpoint used to be run as. The file runs once, when the worker
+            # starts, and what it prints then is not part of any response.
+            namespace = runpy.run_path(file_path, run_name='__main__')
+            expression = compile(signature, '<signature>', 'eval')
+            return namespace, expression, None
+        except BaseException:
+            traceback.print_exc()
+    return None, None, err.getvalue()
+
+
+def _imported_files(file_path, file_path_root):
+    """Return the code files below file_path_root imported by the endpoint, other than the endpoint file itself"""
+    root = os.path.join(os.path.abspath(file_path_root), '')
+    files = set()
+    for module in list(sys.modules.values()):
+        path = getattr(module, '__file__', None)
+        if path and path.endswith('.py'):
+            path = os.path.abspath(path)
+            if path.startswith(root) and path != os.path.abspath(file_path):
+                files.add(path)
+    return sorted(files)
+
+
+def run_endpoint(conn, file_path, file_path_root, signature):
+    """Main loop of the endpoint worker process"""
+    namespace, expression, load_error = _load(file_path, file_path_root, signature)
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            break
+        if request is None:
+            break
+        if load_error:
+            conn.send({'output': '', 'error': load_error, 'imports': []})
+            continue
+        out = StringIO()
+        err = StringIO()
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            try:
+                # Arguments shadow module level names, like the assignments appended to the file used to
+                print(eval(expression, namespace, dict(request['args'])))
+            except BaseException:
+                # Skip the frame of the worker itself
+                e_type, e, tb = sys.exc_info()
+                traceback.print_exception(e_type, e, tb.tb_next)
+        # Functions may import modules lazily, so imports are collected after every call
+        conn.send({'output': out.getvalue(), 'error': err.getvalue(),
+                   'imports': _imported_files(file_path, file_path_root)})
+    conn.close()
+
+
+class EndpointWorker:
+    """Server side handle of an endpoint worker process"""
+    def __init__(self, name, file_path, file_path_root, signature, digest):
+        self.name = name
+        self.file_path = file_path
+        self.file_path_root = file_path_root
+        self.signature = signature
+        self.digest = digest
+        # Code files below the root imported by the worker, and their digests when first seen by the server
+        self.imported_files = []
+        self.import_digests = {}
+        self._conn = None
+        self._process = None
+        # One request at a time per worker
+        self._lock = threading.Lock()
+        # Requests holding the worker, see `serving`
+        self._requests = 0
+        self._stopping = False
+
+    @property
+    def alive(self):
+        return self._process is not None and self._process.is_alive()
+
+    @property
+    def pid(self):
+        return self._process.pid if self._process else None
+
+    def start(self):
+        self._conn, child_conn = multiprocessing.Pipe()
+        self._process = start_process('endpoint_worker', 'run_endpoint',
+                                      child_conn, self.file_path, self.file_path_root, self.signature)
+        child_conn.close()
+        logger.info('Started endpoint worker {} for {}'.format(self._process.pid, self.name))
+
+    def _terminate(self):
+        if self._process is not None and self._process.is_alive():
+            self._process.terminate()
+
+    def stop(self):
+        """Stop the worker once the requests holding it are done"""
+        self._stopping = True
+        if not self._requests:
+            self._terminate()
+
+    @contextlib.contextmanager
+    def serving(self):
+        """Hold the worker for the duration of a request, so that it is not stopped while the request uses it.
+        Use on the IOLoop, along with `stop`.
+        """
+        self._requests += 1
+        try:
+            yield self
+        finally:
+            self._requests -= 1
+            if self._stopping and not self._requests:
+                self._terminate()
+
+    def call(self, args):
+        """Evaluate the signature with args. Blocks until the worker replies, returns `(error, output)`."""
+        with self._lock:
+            try:
+                self._conn.send({'args': args})
+                response = self._conn.recv()
+            except (EOFError, OSError):
+                return 'Endpoint worker for {} exited unexpectedly\n'.format(self.name), ''
+        self.imported_files = response['imports']
+        return response['error'], response['output']
@@ -0,0 +1,536 @@
+# encoding: utf-8
+"""
+Warm interpreter pool for file execution.
+
+Running `python <file>` for every `/file` request pays the full interpreter startup, and re-imports heavy libraries
+such as numpy and pandas on each run. The pool keeps a `zygote` process around that has already imported a
+configurable list of modules. The zygote keeps a few pre-forked idle children waiting for work. A file run is handed
+to an idle child, which shares the already imported modules with the zygote through copy-on-write memory, and the
+zygote forks a replacement right away.
+
+The zygote is started in a fresh interpreter (see `kernel_process`), so its children hold the modules preloaded
+for user code, not those of the kernel server: a file importing its own `metrics` module gets it, as with
+`python <file>`.
+
+The kernel server and the zygote talk over a `SOCK_SEQPACKET` unix socket pair. The server creates the stdout/stderr
+pipes of a run and passes their write ends along with the request (`SCM_RIGHTS`), so the output of the child goes
+straight to the server without being relayed by the zygote.
+
+    server -> zygote: {'id': ..., 'path': ..., 'cwd': ..., 'env': {...}}  + [stdout, stderr]
+    zygote -> server: {'id': ..., 'event': 'started', 'pid': ...}
+    zygote -> server: {'id': ..., 'event': 'exited', 'returncode': ..., 'rusage': {...}}
+
+Recycling policy
+
+* Children are single use. A child exits once its file has run, so no state leaks between runs.
+* Idle children older than `max_idle_age` seconds are replaced.
+* The zygote is replaced after `max_executions` runs, so upgraded packages (e.g. `pip install -U pandas` from a
+  shell cell) are eventually picked up by file runs. `restart()` replaces it immediately.
+
+Configuration is read from the environment by `WarmInterpreterPool.from_environ`:
+
+    KERNEL_FILE_POOL_SIZE            Number of idle children kept ready. `0` disables the pool. (2)
+    KERNEL_FILE_POOL_PRELOAD         Comma separated modules imported by the zygote. (numpy,pandas)
+    KERNEL_FILE_POOL_MAX_IDLE_AGE    Seconds after which an idle child is replaced. (600)
+    KERNEL_FILE_POOL_MAX_EXECUTIONS  Runs after which the zygote is replaced. (500)
+    KERNEL_FILE_POOL_START_TIMEOUT   Seconds to wait for the zygote to start a run. (10)
+
+A run the zygote does not start in time raises `TimeoutError`, and the zygote is replaced. The caller runs the file in
+a new interpreter instead (see `file_runner`).
+"""
+import os
+import sys
+import json
+import array
+import runpy
+import time
+import select
+import signal
+import socket
+import logging
+import selectors
+import threading
+import importlib
+import traceback
+
+from collections import deque
+
+from kernel_process import start_process
+
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+logger = logging.getLogger(__name__)
+
+
+# Maximum size of a control message
+MAX_MESSAGE_SIZE = 64 * 1024
+
+
+def send_message(sock, message, fds=()):
+    """Send a JSON message, optionally passing file descriptors along with it"""
+    data = json.dumps(message).encode('utf-8')
+    if fds:
+        sock.sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))])
+    else:
+        sock.send(data)
+
+
+def recv_message(sock, max_fds=0):
+    """Receive a JSON message and the file descriptors passed along with it. Returns `(None, [])` on EOF."""
+    fds = array.array('i')
+    data, ancdata, flags, addr = sock.recvmsg(MAX_MESSAGE_SIZE, socket.CMSG_LEN(max_fds * fds.itemsize))
+    for level, kind, cmsg_data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(cmsg_data[:len(cmsg_data) - (len(cmsg_data) % fds.itemsize)])
+    if not data:
+        for fd in fds:
+            os.close(fd)
+        return None, []
+    return json.loads(data.decode('utf-8')), list(fds)
+
+
+def _rusage_to_dict(rusage):
+    return {
+        'cpuUser': rusage.ru_utime,
+        'cpuSystem': rusage.ru_stime,
+        # Linux reports kilobytes
+        'maxRss': rusage.ru_maxrss * 1024
+    }
+
+
+def _exit_code(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+"""
+Zygote side
+"""
+
+
+def _run_file(job, fds):
+    """Runs inside a pooled child. Execute the file in job as `__main__` and exit."""
+    os.dup2(fds[0], 1)
+    os.dup2(fds[1], 2)
+    for fd in fds:
+        os.close(fd)
+    os.chdir(job['cwd'])
+    # Like the environment of `python <file>` started by the kernel, nothing of the environment of the kernel
+    os.environ.clear()
+    os.environ.update(job['env'])
+    # Mimic `python <file>`: the directory of the script comes first in the module search path
+    python_path = [p for p in job['env'].get('PYTHONPATH', '').split(os.pathsep) if p]
+    sys.path[0:0] = [os.path.dirname(job['path'])] + python_path
+    sys.argv = [job['path']]
+    returncode = 0
+    try:
+        runpy.run_path(job['path'], run_name='__main__')
+    except SystemExit as e:
+        if e.code is None:
+            returncode = 0
+        elif isinstance(e.code, int):
+            returncode = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            returncode = 1
+    except BaseException:
+        # Hide the frames of the pool, like the interpreter does for its own frames
+        e_type, e, tb = sys.exc_info()
+        while tb is not None and tb.tb_frame.f_code.co_filename != job['path']:
+            tb = tb.tb_next
+        traceback.print_exception(e_type, e, tb)
+        returncode = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(returncode)
+
+
+def _idle_child(sock):
+    """Runs inside a pooled child. Wait for a job from the zygote."""
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    job, fds = recv_message(sock, max_fds=2)
+    sock.close()
+    # The zygote ignores interrupts, the file being run should see them as usual
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    if job is None:
+        # Recycled by the zygote
+        os._exit(0)
+    _run_file(job, fds)
+
+
+class _Zygote:
+    """Fork and hand out pre-warmed children. Runs in its own process."""
+    def __init__(self, sock, size, max_idle_age):
+        self.sock = sock
+        self.size = size
+        self.max_idle_age = max_idle_age
+        # (pid, socket, time forked) of children waiting for work
+        self.idle = deque()
+        # pid -> request id of children running a file
+        self.running = {}
+
+    def fork_child(self):
+        parent_sock, child_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        # Make sure nothing buffered in the zygote is written twice
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                # Each run gets its own process group, so it can be signalled along with anything it spawns
+                os.setpgid(0, 0)
+                parent_sock.close()
+                self.sock.close()
+                for _, sock, _ in self.idle:
+                    sock.close()
+                _idle_child(child_sock)
+            finally:
+                os._exit(1)
+        child_sock.close()
+        try:
+            # Also set from the parent, so the group exists before the run is handed out
+            os.setpgid(pid, pid)
+        except OSError:
+            pass
+        self.idle.append((pid, parent_sock, time.monotonic()))
+
+    def fill(self):
+        while len(self.idle) < max(self.size, 1):
+            self.fork_child()
+
+    def recycle(self):
+        """Replace idle children that have been waiting for too long"""
+        now = time.monotonic()
+        while self.idle and now - self.idle[0][2] > self.max_idle_age:
+            pid, sock, _ = self.idle.popleft()
+            # Closing the socket makes the child exit
+            sock.close()
+        self.fill()
+
+    def reap(self, block=False):
+        while True:
+            try:
+                pid, status, rusage = os.wait4(-1, 0 if block else os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            request_id = self.running.pop(pid, None)
+            if request_id is not None:
+                send_message(self.sock, {
+                    'id': request_id,
+                    'event': 'exited',
+                    'returncode': _exit_code(status),
+                    'rusage': _rusage_to_dict(rusage)
+                })
+
+    def dispatch(self, job, fds):
+        try:
+            if not self.idle:
+                self.fork_child()
+            pid, sock, _ = self.idle.popleft()
+            send_message(sock, job, fds)
+            sock.close()
+            self.running[pid] = job['id']
+            send_message(self.sock, {'id': job['id'], 'event': 'started', 'pid': pid})
+        except Exception as e:
+            send_message(self.sock, {'id': job['id'], 'event': 'failed', 'error': str(e)})
+        finally:
+            for fd in fds:
+                os.close(fd)
+        self.fill()
+
+    def shutdown(self):
+        while self.idle:
+            self.idle.popleft()[1].close()
+        # Let running children finish and report their exit, they own their output pipes
+        while self.running:
+            self.reap(block=True)
+
+    def serve(self):
+        wakeup_r, wakeup_w = os.pipe()
+        os.set_blocking(wakeup_w, False)
+        signal.set_wakeup_fd(wakeup_w)
+        # A handler must be installed for SIGCHLD to wake up `select`
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        self.fill()
+        while True:
+            try:
+                readable, _, _ = select.select([self.sock, wakeup_r], [], [], max(self.max_idle_age / 2, 1))
+            except InterruptedError:
+                continue
+            if wakeup_r in readable:
+                os.read(wakeup_r, 512)
+            self.reap()
+            self.recycle()
+            if self.sock in readable:
+                job, fds = recv_message(self.sock, max_fds=2)
+                if job is None:
+                    break
+                self.dispatch(job, fds)
+        self.shutdown()
+
+
+def run_zygote(sock, preload, size, max_idle_age):
+    """Entry point of the zygote process"""
+    # The server handles interrupts, the zygote is shut down by closing its socket
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for module in preload:
+        try:
+            importlib.import_module(module)
+        except Exception:
+            logger.warning('Could not preload {} in file execution pool'.format(module))
+    _Zygote(sock, size, max_idle_age).serve()
+
+
+"""
+Server side
+"""
+
+
+class PooledProcess:
+    """A file run handed to a pooled child. Mirrors the parts of `subprocess.Popen` the kernel uses."""
+    def __init__(self, request_id, stdout, stderr):
+        self.request_id = request_id
+        self.stdout = stdout
+        self.stderr = stderr
+        self.pid = None
+        self.returncode = None
+        self.rusage = None
+        self.error = None
+        self._started = threading.Event()
+        self._exited = threading.Event()
+        self._lock = threading.Lock()
+        self._exit_callbacks = []
+        # Set if the run was given up on before it started
+        self._abandoned = False
+
+    def _set_started(self, pid):
+        with self._lock:
+            self.pid = pid
+            self._started.set()
+            abandoned = self._abandoned
+        if abandoned:
+            self.kill()
+
+    def abandon(self):
+        """Give up on a run that did not start in time. The child is killed if it starts after all."""
+        with self._lock:
+            self._abandoned = True
+            pid = self.pid
+        for fd in (self.stdout, self.stderr):
+            os.close(fd)
+        if pid is not None:
+            self.kill()
+
+    def _set_exited(self, returncode, rusage=None, error=None):
+        with self._lock:
+            self.returncode = returncode
+            self.rusage = rusage
+            self.error = error
+            self._started.set()
+            self._exited.set()
+            callbacks, self._exit_callbacks = self._exit_callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def add_exit_callback(self, callback):
+        """Call `callback(process)` once the child exits. The callback runs on the pool reader thread."""
+        with self._lock:
+            if not self._exited.is_set():
+                self._exit_callbacks.append(callback)
+                return
+        callback(self)
+
+    def wait_started(self, timeout=None):
+        """Return the pid of the child. Raises `TimeoutError` if it is not started within timeout, `RuntimeError` if
+        the pool could not start it.
+        """
+        if not self._started.wait(timeout):
+            raise TimeoutError('File execution pool did not start the run within {} seconds'.format(timeout))
+        if self.error:
+            raise RuntimeError(self.error)
+        return self.pid
+
+    def wait(self, timeout=None):
+        self._exited.wait(timeout)
+        return self.returncode
+
+    def send_signal(self, signum):
+        """Signal the process group of the child"""
+        if self.pid is not None and self.returncode is None:
+            try:
+                os.killpg(self.pid, signum)
+            except ProcessLookupError:
+                try:
+                    os.kill(self.pid, signum)
+                except ProcessLookupError:
+                    pass
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def communicate(self):
+        """Read stdout and stderr until EOF and wait for the child to exit. Returns `(stdout, stderr)` bytes."""
+        chunks = {self.stdout: [], self.stderr: []}
+        with selectors.DefaultSelector() as selector:
+            for fd in chunks:
+                selector.register(fd, selectors.EVENT_READ)
+            while selector.get_map():
+                for key, _ in selector.select():
+                    data = os.read(key.fd, 65536)
+                    if data:
+                        chunks[key.fd].append(data)
+                    else:
+                        selector.unregister(key.fd)
+                        os.close(key.fd)
+        self.wait()
+        return b''.join(chunks[self.stdout]), b''.join(chunks[self.stderr])
+
+
+class WarmInterpreterPool:
+    """Server side handle of the zygote process"""
+    def __init__(self, size=2, preload=(), max_idle_age=600, max_executions=500, start_timeout=10.0):
+        self.size = size
+        self.preload = list(preload)
+        self.max_idle_age = max_idle_age
+        self.max_executions = max_executions
+        self.start_timeout = start_timeout
+        self.executions = 0
+        self._sock = None
+        self._process = None
+        self._lock = threading.Lock()
+        self._next_id = 0
+        # request id -> PooledProcess, for the runs handed to the current zygote
+        self._processes = {}
+
+    @classmethod
+    def from_environ(cls, environ=None):
+        environ = os.environ if environ is None else environ
+        preload = environ.get('KERNEL_FILE_POOL_PRELOAD', 'numpy,pandas')
+        return cls(
+            size=int(environ.get('KERNEL_FILE_POOL_SIZE', 2)),
+            preload=[m.strip() for m in preload.split(',') if m.strip()],
+            max_idle_age=float(environ.get('KERNEL_FILE_POOL_MAX_IDLE_AGE', 600)),
+            max_executions=int(environ.get('KERNEL_FILE_POOL_MAX_EXECUTIONS', 500)),
+            start_timeout=float(environ.get('KERNEL_FILE_POOL_START_TIMEOUT', 10))
+        )
+
+    @property
+    def enabled(self):
+        return self.size > 0 and hasattr(os, 'fork')
+
+    @property
+    def alive(self):
+        return self._process is not None and self._process.is_alive()
+
+    def start(self):
+        """Start the zygote process"""
+        if not self.enabled:
+            return
+        server_sock, zygote_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        process = start_process('file_pool', 'run_zygote', zygote_sock, self.preload, self.size, self.max_idle_age)
+        zygote_sock.close()
+        self._sock = server_sock
+        self._process = process
+        self._processes = {}
+        self.executions = 0
+        reader = threading.Thread(target=self._read_messages, args=(server_sock, process, self._processes),
+                                  daemon=True)
+        reader.start()
+        logger.info('Started file execution pool {} (preload={})'.format(process.pid, ','.join(self.preload)))
+
+    def stop(self):
+        """Ask the zygote to exit once the runs it started have finished"""
+        if self._sock is not None:
+            # The zygote sees EOF, the reader keeps receiving exit events until the zygote closes its end
+            try:
+                self._sock.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+            self._sock = None
+            self._process = None
+
+    def restart(self):
+        """Replace the zygote. Runs in flight are not affected."""
+        with self._lock:
+            self.stop()
+            self.start()
+
+    def spawn(self, path, cwd, env=None):
+        """Run the file at path in a pooled child. Returns a `PooledProcess`.
+
+        Raises `TimeoutError` if the zygote does not start the run within `start_timeout`.
+        """
+        with self._lock:
+            if not self.alive or self.executions >= self.max_executions:
+                self.stop()
+                self.start()
+            self.executions += 1
+            self._next_id += 1
+            stdout_r, stdout_w = os.pipe()
+            stderr_r, stderr_w = os.pipe()
+            process = PooledProcess(self._next_id, stdout_r, stderr_r)
+            self._processes[process.request_id] = process
+            try:
+                send_message(self._sock, {
+                    'id': process.request_id,
+                    'path': path,
+                    'cwd': cwd,
+                    'env': env or {}
+                }, [stdout_w, stderr_w])
+            except OSError:
+                self._processes.pop(process.request_id, None)
+                os.close(stdout_r)
+                os.close(stderr_r)
+                raise
+            finally:
+                # The child owns the write ends now, EOF is seen once it exits
+                os.close(stdout_w)
+                os.close(stderr_w)
+        try:
+            process.wait_started(self.start_timeout)
+        except TimeoutError:
+            process.abandon()
+            # The zygote is stuck, the next run gets a new one
+            logger.warning('File execution pool did not start a run in time, replacing it')
+            self.restart()
+            raise
+        return process
+
+    def _read_messages(self, sock, zygote, processes):
+        """Runs in a background thread. Track the life cycle of the children forked by one zygote."""
+        while True:
+            try:
+                message, _ = recv_message(sock)
+            except InterruptedError:
+                continue
+            except OSError:
+                break
+            if message is None:
+                break
+            process = processes.get(message['id'])
+            if process is None:
+                continue
+            if message['event'] == 'started':
+                process._set_started(message['pid'])
+            elif message['event'] == 'exited':
+                processes.pop(message['id'], None)
+                process._set_exited(message['returncode'], message['rusage'])
+            elif message['event'] == 'failed':
+                processes.pop(message['id'], None)
+                process._set_exited(-1, error=message['error'])
+        sock.close()
+        zygote.wait()
+        # The zygote is gone. Children it forked are reparented, so their exit status is lost.
+        for request_id, process in list(processes.items()):
+            processes.pop(request_id, None)
+            process._set_exited(-1, error='File execution pool exited unexpectedly')
@@ -0,0 +1,168 @@
+# encoding: utf-8
+"""
+Asynchronous file execution.
+
+File runs used to call `Popen(...).communicate()` inside the Tornado handler, which blocked the event loop for the
+whole run. `FileRunner` runs files on the asyncio loop the kernel server is already running on:
+
+* The child is a pooled interpreter (see `file_pool`) or, when the pool is disabled or can not start the run, a process
+  started with `asyncio.create_subprocess_exec`. Either way its output is read from non-blocking pipes.
+* Output is handed to a `display(lines, stream_type)` callback as it arrives, batched into frames by
+  `streams.OutputCoalescer`.
+* Each run can have a wall-clock timeout, after which its process group is killed.
+
+The number of files running at once is limited by the scheduler of the kernel (see `scheduler`).
+
+Configuration is read from the environment by `FileRunner.from_environ`:
+
+    KERNEL_FILE_TIMEOUT  Default wall-clock timeout of a run in seconds, `0` for none. (0)
+"""
+import os
+import sys
+import time
+import signal
+import asyncio
+import logging
+
+import tornado.ioloop
+
+from asyncio.subprocess import PIPE
+
+from streams import read_stream_and_display
+from usage import make_usage
+
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+logger = logging.getLogger(__name__)
+
+
+def _set_result(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+async def _open_reader(fd):
+    """Wrap a pipe file descriptor in an asyncio stream reader"""
+    loop = asyncio.get_event_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, 'rb', 0))
+    return reader
+
+
+class _SubprocessRun:
+    """A file run in a regular child process"""
+    def __init__(self, process):
+        self.process = process
+        self.pid = process.pid
+        self.stdout = process.stdout
+        self.stderr = process.stderr
+
+    async def wait(self):
+        return await self.process.wait()
+
+    @property
+    def rusage(self):
+        # The child is reaped by asyncio, its usage is not known
+        return None
+
+    def send_signal(self, signum):
+        try:
+            os.killpg(self.pid, signum)
+        except ProcessLookupError:
+            pass
+
+
+class _PooledRun:
+    """A file run in a pooled interpreter"""
+    def __init__(self, process, stdout, stderr):
+        self.process = process
+        self.pid = process.pid
+        self.stdout = stdout
+        self.stderr = stderr
+        loop = asyncio.get_event_loop()
+        self._exited = loop.create_future()
+        # Exit is reported on the pool reader thread
+        process.add_exit_callback(lambda p: loop.call_soon_threadsafe(_set_result, self._exited, p.returncode))
+
+    async def wait(self):
+        return await self._exited
+
+    @property
+    def rusage(self):
+        return self.process.rusage
+
+    def send_signal(self, signum):
+        self.process.send_signal(signum)
+
+
+class FileRunner:
+    """Run files below file_path_root on the current event loop"""
+    def __init__(self, file_path_root, file_pool, timeout=None):
+        self.file_path_root = file_path_root
+        self.file_pool = file_pool
+        self.timeout = timeout
+
+    @classmethod
+    def from_environ(cls, file_path_root, file_pool, environ=None):
+        environ = os.environ if environ is None else environ
+        return cls(
+            file_path_root,
+            file_pool,
+            timeout=float(environ.get('KERNEL_FILE_TIMEOUT', 0)) or None
+        )
+
+    async def _start(self, file_path):
+        env = {
+            # Module discovery
+            'PYTHONPATH': self.file_path_root
+        }
+        if self.file_pool.enabled:
+            # Fork a pre-warmed interpreter instead of paying the interpreter startup
+            try:
+                process = await tornado.ioloop.IOLoop.current().run_in_executor(
+                    None, self.file_pool.spawn, os.path.join(self.file_path_root, file_path), self.file_path_root, env)
+            except (OSError, RuntimeError) as e:
+                # Among them `TimeoutError`, the pool replaces its zygote
+                logger.warning('File execution pool could not run {}, starting a new interpreter: {}'.format(
+                    file_path, e))
+            else:
+                stdout = await _open_reader(process.stdout)
+                stderr = await _open_reader(process.stderr)
+                return _PooledRun(process, stdout, stderr)
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, file_path, env=env, stdout=PIPE, stderr=PIPE, cwd=self.file_path_root,
+            start_new_session=True)
+        return _SubprocessRun(process)
+
+    async def run(self, file_path, display, timeout=None, on_start=None):
+        """Run the file at file_path, relative to the root. Returns the exit code and the usage of the run.
+
+        `on_start(run)` is called once the process is started. The run can be signalled with `run.send_signal`.
+        """
+        timeout = timeout or self.timeout
+        started = time.monotonic()
+        run = await self._start(file_path)
+        if on_start is not None:
+            on_start(run)
+        timer = None
+        if timeout:
+            def on_timeout():
+                display(['Execution timed out after {} seconds\n'.format(timeout)], 'stderr')
+                run.send_signal(signal.SIGKILL)
+            timer = asyncio.get_event_loop().call_later(timeout, on_timeout)
+        try:
+            await asyncio.gather(
+                read_stream_and_display(run.stdout, display, 'stdout'),
+                read_stream_and_display(run.stderr, display, 'stderr'))
+        except Exception as e:
+            run.send_signal(signal.SIGKILL)
+            display([str(e)], 'stderr')
+        finally:
+            returncode = await run.wait()
+            if timer is not None:
+                timer.cancel()
+        rusage = run.rusage or {}
+        return returncode, make_usage(
+            time.monotonic() - started, rusage.get('cpuUser'), rusage.get('cpuSystem'), rusage.get('maxRss'))
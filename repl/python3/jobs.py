@@ -0,0 +1,145 @@
+# encoding: utf-8
+"""
+Cell executions known to the kernel, so that they can be interrupted or cancelled.
+
+A runaway cell used to be stoppable only by killing the container. Every REPL, shell and file execution is now
+recorded in the `JobTable` under its cell id, from the moment it is queued by the scheduler until it finishes.
+Once it runs, the job holds a process-like object with a `send_signal(signum)` method: the REPL worker, the bash
+coprocess or the file run.
+
+* Interrupting a job sends it SIGINT. The REPL raises `KeyboardInterrupt` in the cell, the shell aborts the cell,
+  and files get the usual `KeyboardInterrupt`.
+* Cancelling a job sends it SIGTERM, and SIGKILL if it is still running after `grace_period` seconds. For the REPL,
+  the escalation restarts the worker, which resets its namespace.
+* Interrupting or cancelling a job that is still queued removes it from the queue.
+
+A job that raises would never emit its result, leaving the cell running forever. The table calls its `on_failure`
+callback with the job and the traceback instead, so that the cell can be closed with the error.
+
+The grace period is read from the environment by `JobTable.from_environ`:
+
+    KERNEL_CANCEL_GRACE_PERIOD  Seconds between SIGTERM and SIGKILL when cancelling a job. (5)
+"""
+import os
+import signal
+import asyncio
+import logging
+import traceback
+
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+logger = logging.getLogger(__name__)
+
+
+# Outcome of interrupting or cancelling a job
+DEQUEUED = 'dequeued'
+SIGNALLED = 'signalled'
+
+
+class Job:
+    """A queued or running execution of a cell"""
+    def __init__(self, cell_id, channel):
+        self.cell_id = cell_id
+        self.channel = channel
+        self.task = None
+        self.queued = True
+        # Set once the job runs, an object with a `send_signal(signum)` method
+        self.process = None
+        # Signal received while the process was starting
+        self._pending_signal = None
+
+    def leave_queue(self):
+        """Mark the job as taken out of the queue by the scheduler, its process is being started"""
+        self.queued = False
+
+    def attach(self, process):
+        """Mark the job as running in process"""
+        self.queued = False
+        self.process = process
+        if self._pending_signal is not None:
+            process.send_signal(self._pending_signal)
+
+    def send_signal(self, signum):
+        if self.process is None:
+            # Delivered once the process is attached. SIGKILL is never downgraded.
+            if self._pending_signal != signal.SIGKILL:
+                self._pending_signal = signum
+            return
+        self.process.send_signal(signum)
+
+
+class JobTable:
+    """Queued and running jobs keyed by cell id"""
+    def __init__(self, grace_period=5.0, on_failure=None):
+        self.grace_period = grace_period
+        # Called with the job and the traceback when a job raises
+        self.on_failure = on_failure
+        self._jobs = {}
+
+    @classmethod
+    def from_environ(cls, environ=None, on_failure=None):
+        environ = os.environ if environ is None else environ
+        return cls(float(environ.get('KERNEL_CANCEL_GRACE_PERIOD', 5)), on_failure)
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def get(self, cell_id):
+        return self._jobs.get(cell_id)
+
+    def add(self, cell_id, channel, coroutine_function, *args):
+        """Run `coroutine_function(job, *args)` as the job of the cell. It must call `job.attach` once it runs."""
+        job = Job(cell_id, channel)
+        self._jobs[cell_id] = job
+        job.task = asyncio.ensure_future(self._run(job, coroutine_function, args))
+        return job
+
+    async def _run(self, job, coroutine_function, args):
+        try:
+            await coroutine_function(job, *args)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logger.exception('Error while running cell {}'.format(job.cell_id))
+            if self.on_failure is not None:
+                try:
+                    self.on_failure(job, traceback.format_exc())
+                except Exception:
+                    logger.exception('Could not report the failure of cell {}'.format(job.cell_id))
+        finally:
+            # The cell may have been run again in the meantime
+            if self._jobs.get(job.cell_id) is job:
+                del self._jobs[job.cell_id]
+
+    def _dequeue(self, job):
+        job.task.cancel()
+        del self._jobs[job.cell_id]
+        return DEQUEUED
+
+    def interrupt(self, cell_id):
+        """Send SIGINT to the job of the cell. Returns the outcome, `None` if the cell has no job."""
+        job = self._jobs.get(cell_id)
+        if job is None:
+            return None
+        if job.queued:
+            return self._dequeue(job)
+        job.send_signal(signal.SIGINT)
+        return SIGNALLED
+
+    def cancel(self, cell_id):
+        """Send SIGTERM to the job of the cell, then SIGKILL after the grace period. Returns the outcome."""
+        job = self._jobs.get(cell_id)
+        if job is None:
+            return None
+        if job.queued:
+            return self._dequeue(job)
+        job.send_signal(signal.SIGTERM)
+
+        def kill():
+            if self._jobs.get(cell_id) is job:
+                logger.warning('Cell {} did not stop within {} seconds, killing it'.format(cell_id, self.grace_period))
+                job.send_signal(signal.SIGKILL)
+        asyncio.get_event_loop().call_later(self.grace_period, kill)
+        return SIGNALLED
@@ -0,0 +1,107 @@
+# encoding: utf-8
+"""
+Worker processes started in fresh interpreters.
+
+Workers of the kernel used to be `multiprocessing` forks of the server. A fork inherits every module the server
+imported, and the modules of the kernel have plain top level names (`metrics`, `jobs`, `shell` ...), so a code file
+or cell importing its own `metrics` got the one of the kernel instead. Forks also inherited the sockets of the server.
+
+`start_process` calls a function of a kernel module in a new interpreter, started with `sys.executable` and this
+file as its script:
+
+* The module of the function, and the kernel modules it imports, are loaded from the kernel directory.
+* They are then removed from `sys.modules`, and the kernel directory from `sys.path`, before the function is called.
+  The function keeps working off the globals of its module, while imports made by user code resolve as they do for
+  `python <file>`.
+
+Arguments are passed as JSON, except for `multiprocessing` connections and sockets, which are passed as file
+descriptors.
+"""
+import os
+import sys
+import json
+import socket
+import importlib
+import subprocess
+
+from multiprocessing.connection import Connection
+
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+# Directory of the kernel modules, mounted at `/opt/current` in the kernel container
+KERNEL_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Flags Linux may report as part of the type of a socket
+_SOCKET_TYPE_FLAGS = getattr(socket, 'SOCK_NONBLOCK', 0) | getattr(socket, 'SOCK_CLOEXEC', 0)
+
+
+class KernelProcess(subprocess.Popen):
+    """A worker process. Mirrors the parts of `multiprocessing.Process` the kernel uses."""
+    def is_alive(self):
+        return self.poll() is None
+
+    def join(self, timeout=None):
+        try:
+            self.wait(timeout)
+        except subprocess.TimeoutExpired:
+            pass
+
+
+def _encode_argument(argument, fds):
+    if isinstance(argument, Connection):
+        fds.append(argument.fileno())
+        return {'connection': argument.fileno()}
+    if isinstance(argument, socket.socket):
+        fds.append(argument.fileno())
+        return {'socket': argument.fileno(), 'family': int(argument.family),
+                'type': int(argument.type) & ~_SOCKET_TYPE_FLAGS}
+    return {'value': argument}
+
+
+def _decode_argument(argument):
+    if 'connection' in argument:
+        return Connection(argument['connection'])
+    if 'socket' in argument:
+        return socket.socket(argument['family'], argument['type'], 0, argument['socket'])
+    return argument['value']
+
+
+def start_process(module, function, *args):
+    """Call `module.function(*args)` in a fresh interpreter. Returns a `KernelProcess`.
+
+    Connections and sockets in args are shared with the process, the caller should close its copies.
+    """
+    fds = []
+    spec = {
+        'module': module,
+        'function': function,
+        'args': [_encode_argument(argument, fds) for argument in args]
+    }
+    # stdin is not inherited, like for `multiprocessing` processes. Neither is any other file descriptor of the
+    # server, e.g. its listening socket.
+    return KernelProcess([sys.executable, os.path.abspath(__file__), json.dumps(spec)],
+                         stdin=subprocess.DEVNULL, pass_fds=fds)
+
+
+def _forget_kernel_modules():
+    """Remove the kernel modules from `sys.modules` and the kernel directory from `sys.path`"""
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, '__file__', None)
+        if name != '__main__' and path and os.path.dirname(os.path.abspath(path)) == KERNEL_ROOT:
+            del sys.modules[name]
+    sys.path[:] = [path for path in sys.path if os.path.abspath(path or os.curdir) != KERNEL_ROOT]
+
+
+def _main(spec):
+    target = getattr(importlib.import_module(spec['module']), spec['function'])
+    args = [_decode_argument(argument) for argument in spec['args']]
+    _forget_kernel_modules()
+    # Like an interactive interpreter, workers set their own arguments when they run user code
+    sys.argv = ['']
+    target(*args)
+
+
+if __name__ == '__main__':
+    _main(json.loads(sys.argv[1]))
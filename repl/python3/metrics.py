@@ -0,0 +1,82 @@
+# encoding: utf-8
+"""
+Prometheus metrics of the kernel, served at `/metrics`.
+
+Besides the process metrics of `prometheus_client` (among them `process_resident_memory_bytes` of the server) and the
+metrics shared with the other kernels (see `kernel_metrics`), the kernel reports:
+
+    kernel_jobs_queued{job_class}                 Jobs waiting for a slot of the scheduler
+    kernel_jobs_running{job_class}                Jobs holding a slot of the scheduler
+    kernel_subprocesses{kind}                     Live worker processes of the kernel
+    kernel_worker_resident_memory_bytes{worker}   Resident memory of the REPL worker, the shell and endpoint workers
+
+Gauges are computed when the metrics are scraped, so they cost nothing in between.
+"""
+import os
+
+from prometheus_client import REGISTRY
+from prometheus_client.core import GaugeMetricFamily
+
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+def resident_memory(pid):
+    """Return the resident memory of the process in bytes, `None` if it is gone"""
+    try:
+        with open('/proc/{}/statm'.format(pid), 'r') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+class KernelCollector:
+    """Gauges read from the live state of the kernel server when scraped"""
+    def __init__(self, repl_server):
+        self.repl_server = repl_server
+
+    def _workers(self):
+        """Yield `(kind, name, pid)` of the live worker processes"""
+        server = self.repl_server
+        if server.repl_worker.pid is not None:
+            yield 'repl', 'repl', server.repl_worker.pid
+        if server.shell.alive:
+            yield 'shell', 'shell', server.shell.pid
+        for name, worker in list(server._endpoint_workers.items()):
+            if worker.alive:
+                yield 'endpoint', 'endpoint:{}'.format(name), worker.pid
+
+    def collect(self):
+        status = self.repl_server.scheduler.status()
+        queued = GaugeMetricFamily('kernel_jobs_queued', 'Jobs waiting for a slot of the scheduler',
+                                   labels=['job_class'])
+        running = GaugeMetricFamily('kernel_jobs_running', 'Jobs holding a slot of the scheduler',
+                                    labels=['job_class'])
+        for name, job_class in status['classes'].items():
+            queued.add_metric([name], job_class['queued'])
+            running.add_metric([name], job_class['running'])
+        yield queued
+        yield running
+
+        subprocesses = GaugeMetricFamily('kernel_subprocesses', 'Live worker processes of the kernel',
+                                         labels=['kind'])
+        memory = GaugeMetricFamily('kernel_worker_resident_memory_bytes', 'Resident memory of worker processes',
+                                   labels=['worker'])
+        counts = {'repl': 0, 'shell': 0, 'endpoint': 0}
+        for kind, name, pid in self._workers():
+            counts[kind] += 1
+            rss = resident_memory(pid)
+            if rss is not None:
+                memory.add_metric([name], rss)
+        # Files running hold a slot of the scheduler each
+        counts['file'] = status['classes']['file']['running']
+        for kind, count in counts.items():
+            subprocesses.add_metric([kind], count)
+        yield subprocesses
+        yield memory
+
+
+def register_kernel_collector(repl_server):
+    REGISTRY.register(KernelCollector(repl_server))
+
@@ -0,0 +1,200 @@
+# encoding: utf-8
+"""
+Selective reloading of code files imported by the REPL.
+
+The console keeps the modules it imported in `sys.modules`, so rewriting a code file used to have no effect until the
+kernel was restarted, losing the whole namespace. The REPL worker now reloads the modules below the file path root
+whenever their files are written:
+
+1. The modules below the root are found in `sys.modules` by their `__file__`.
+2. Their dependency graph is built from the import statements of their sources (parsed once per mtime).
+3. The changed modules and every module depending on them, directly or not, are reloaded with `importlib.reload`,
+   dependencies first, so a dependent picks up the new version of what it imports.
+4. Names bound in the console by `from module import name` are rebound to the reloaded objects.
+
+Reloading keeps the module objects, so `import module` bindings stay valid. Instances created before the reload keep
+their old classes, as with any reload. A module that fails to reload keeps its previous contents, and its dependents
+are left alone.
+
+The file path root is on the `sys.path` of the worker, so cells can import code files directly. Reloading can be
+turned off through the environment:
+
+    KERNEL_MODULE_RELOAD  Set to `0` to keep stale modules until the kernel restarts. (1)
+"""
+import os
+import ast
+import sys
+import types
+import importlib
+import importlib.util
+import traceback
+
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+def _resolve_import(module_name, is_package, node):
+    """Yield the absolute names an import statement of module_name may refer to"""
+    if isinstance(node, ast.Import):
+        for alias in node.names:
+            # `import a.b.c` imports a, a.b and a.b.c
+            parts = alias.name.split('.')
+            for i in range(1, len(parts) + 1):
+                yield '.'.join(parts[:i])
+        return
+    if node.level:
+        package = module_name if is_package else module_name.rpartition('.')[0]
+        parts = package.split('.') if package else []
+        if node.level - 1 > len(parts):
+            return
+        parts = parts[:len(parts) - (node.level - 1)]
+        if node.module:
+            parts.append(node.module)
+        base = '.'.join(parts)
+    else:
+        base = node.module
+    if not base:
+        return
+    yield base
+    # `from package import module`
+    for alias in node.names:
+        yield '{}.{}'.format(base, alias.name)
+
+
+class ModuleReloader:
+    """Track the modules imported from file_path_root and reload them when their files change"""
+    def __init__(self, file_path_root):
+        self.root = os.path.join(os.path.realpath(file_path_root), '')
+        # Imports of each source file, keyed by path, with the mtime they were read at
+        self._imports = {}
+
+    def tracked_modules(self):
+        """Return the modules loaded from below the root, as a dict of module name to real path of the file"""
+        modules = {}
+        for name, module in list(sys.modules.items()):
+            path = getattr(module, '__file__', None)
+            if not path or not path.endswith('.py'):
+                continue
+            path = os.path.realpath(path)
+            if path.startswith(self.root):
+                modules[name] = path
+        return modules
+
+    def _read_imports(self, name, path):
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return set()
+        cached = self._imports.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        is_package = os.path.basename(path) == '__init__.py'
+        imports = set()
+        try:
+            with open(path, 'rb') as f:
+                tree = ast.parse(f.read(), path)
+        except (OSError, SyntaxError, ValueError):
+            # Reloading will report the error
+            tree = None
+        if tree is not None:
+            for node in ast.walk(tree):
+                if isinstance(node, (ast.Import, ast.ImportFrom)):
+                    imports.update(_resolve_import(name, is_package, node))
+        self._imports[path] = (mtime, imports)
+        return imports
+
+    def dependency_graph(self, modules=None):
+        """Return the tracked modules each tracked module imports"""
+        modules = self.tracked_modules() if modules is None else modules
+        graph = {}
+        for name, path in modules.items():
+            imports = self._read_imports(name, path) & set(modules)
+            # A submodule needs its package, which is imported first
+            package = name.rpartition('.')[0]
+            if package in modules:
+                imports.add(package)
+            imports.discard(name)
+            graph[name] = imports
+        return graph
+
+    def affected_modules(self, paths):
+        """Return the tracked modules to reload after paths changed, in the order they must be reloaded"""
+        paths = set(os.path.realpath(path) for path in paths)
+        modules = self.tracked_modules()
+        graph = self.dependency_graph(modules)
+        dependents = {}
+        for name, imports in graph.items():
+            for imported in imports:
+                dependents.setdefault(imported, set()).add(name)
+        affected = set()
+        stack = [name for name, path in modules.items() if path in paths]
+        while stack:
+            name = stack.pop()
+            if name not in affected:
+                affected.add(name)
+                stack.extend(dependents.get(name, ()))
+
+        # Dependencies first. Import cycles are broken arbitrarily.
+        order = []
+        visited = set()
+
+        def visit(name):
+            if name in visited:
+                return
+            visited.add(name)
+            for imported in sorted(graph[name] & affected):
+                visit(imported)
+            order.append(name)
+
+        for name in sorted(affected):
+            visit(name)
+        return order
+
+    def reload(self, paths, namespace=None):
+        """Reload the modules affected by the changed paths and rebind the names namespace imported from them.
+        Returns `(reloaded, errors)`, the names of the reloaded modules and the tracebacks of the failed ones.
+        """
+        order = self.affected_modules(paths)
+        if not order:
+            return [], {}
+        # Remember which module attribute each name of the namespace was bound to
+        bindings = {}
+        if namespace is not None:
+            origins = {}
+            for name in order:
+                for attribute, value in list(vars(sys.modules[name]).items()):
+                    # Only what the module defines, a shared `1` or `None` must not be rebound
+                    if not attribute.startswith('__') and (isinstance(value, types.ModuleType)
+                                                           or getattr(value, '__module__', None) == name):
+                        origins.setdefault(id(value), (name, attribute))
+            for local_name, value in namespace.items():
+                origin = origins.get(id(value))
+                if origin is not None and not local_name.startswith('__'):
+                    bindings[local_name] = origin
+
+        importlib.invalidate_caches()
+        reloaded = []
+        errors = {}
+        failed = set()
+        graph = self.dependency_graph()
+        for name in order:
+            if graph.get(name, set()) & failed:
+                # Would see the stale version of its dependency
+                failed.add(name)
+                continue
+            module = sys.modules[name]
+            try:
+                # Bytecode is validated by mtime and size, a quick same-size edit could load the stale one
+                cached = importlib.util.cache_from_source(module.__file__)
+                if os.path.exists(cached):
+                    os.remove(cached)
+                importlib.reload(module)
+                reloaded.append(name)
+            except BaseException:
+                failed.add(name)
+                errors[name] = traceback.format_exc()
+
+        for local_name, (name, attribute) in bindings.items():
+            if name in reloaded and hasattr(sys.modules[name], attribute):
+                namespace[local_name] = getattr(sys.modules[name], attribute)
+        return reloaded, errors
@@ -0,0 +1,216 @@
+# encoding: utf-8
+"""
+Spooling of oversized cell output.
+
+Output is streamed to cells in bounded frames, but every frame still ends up in the browser, so a `print(df)` of a
+huge frame could exhaust the memory of the page. Each execution of a cell now emits at most `preview_size` characters
+of output live. Past that point its output is appended to a spool file in the kernel instead:
+
+* The head of the output, which was emitted live, is written to the spool file first, so offsets into the spool
+  are offsets into the whole output of the execution.
+* The last `tail_size` characters are kept in memory and emitted when the execution finishes, followed by the final
+  frame carrying `spool`:
+
+      {'token': ..., 'size': 104857600, 'headBytes': 262144, 'tailOffset': 104792064}
+
+  `size` is the size of the spool in bytes. The client renders the head, a gap and the tail, and fetches the gap
+  from `/output/<cellId>?token=...&offset=...&length=...`.
+
+Memory use is therefore bounded by the preview and tail sizes, however much a cell prints. The spools of the last
+finished executions are kept on disk, older ones are deleted. Configuration is read from the environment:
+
+    KERNEL_OUTPUT_PREVIEW_SIZE  Characters emitted live per execution, `0` to never spool. (262144)
+    KERNEL_OUTPUT_TAIL_SIZE     Characters of the end of spooled output emitted when the execution finishes. (65536)
+    KERNEL_OUTPUT_SPOOL_DIR     Directory of the spool files. (/tmp/cell-outputs)
+    KERNEL_OUTPUT_SPOOLS_KEPT   Number of spools of finished executions kept. (20)
+"""
+import os
+import uuid
+
+from collections import OrderedDict, deque
+
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+# Largest range of a spool served by a single request
+MAX_READ_LENGTH = 1024 * 1024
+
+
+def _utf8_range(data, final):
+    """Return the number of bytes to skip at the start of data, and its length without a cut off trailing character,
+    so that the range decodes cleanly
+    """
+    start = 0
+    # Continuation bytes are 0b10xxxxxx
+    while start < len(data) and start < 3 and data[start] & 0xc0 == 0x80:
+        start += 1
+    end = len(data)
+    if not final:
+        # Walk back to the first byte of the last character and drop it if it is incomplete
+        i = end - 1
+        while i > start and end - i < 4 and data[i] & 0xc0 == 0x80:
+            i -= 1
+        if i >= start:
+            lead = data[i]
+            needed = 1 if lead < 0x80 else 2 if lead >> 5 == 0x6 else 3 if lead >> 4 == 0xe else 4
+            if end - i < needed:
+                end = i
+    return start, end
+
+
+class CellOutput:
+    """Output of one execution of a cell"""
+    def __init__(self, cell_id, spool_dir, preview_size, tail_size):
+        self.cell_id = cell_id
+        self.token = uuid.uuid4().hex
+        self.path = os.path.join(spool_dir, '{}.log'.format(self.token))
+        self.preview_size = preview_size
+        self.tail_size = tail_size
+        self.spooled = False
+        self.done = False
+        # Output emitted live, kept until it is written to the spool or the execution ends
+        self._head = []
+        self._emitted = 0
+        # `(stream_type, text)` pairs of the end of the output, once spooling
+        self._tail = deque()
+        self._tail_length = 0
+        self._file = None
+        # Sizes in bytes of the spool, of the head and of the tail emitted at the end
+        self.size = 0
+        self.head_bytes = 0
+        self.tail_bytes = 0
+
+    def write(self, stream_type, text):
+        """Record text written to the stream. Returns the part of it to emit now."""
+        live = ''
+        if not self.spooled:
+            live = text[:max(0, self.preview_size - self._emitted)]
+            self._head.append(live)
+            self._emitted += len(live)
+            text = text[len(live):]
+            if not text:
+                return live
+            self._start_spool()
+        self._spool(text)
+        self._tail.append((stream_type, text))
+        self._tail_length += len(text)
+        # Drop whole frames that fell out of the tail
+        while len(self._tail) > 1 and self._tail_length - len(self._tail[0][1]) >= self.tail_size:
+            self._tail_length -= len(self._tail.popleft()[1])
+        return live
+
+    def _start_spool(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.spooled = True
+        self._file = open(self.path, 'ab')
+        self._spool(''.join(self._head))
+        self.head_bytes = self.size
+        self._head = []
+
+    def _spool(self, text):
+        data = text.encode('utf-8')
+        self._file.write(data)
+        # Ranges of the spool can be read while the cell runs
+        self._file.flush()
+        self.size += len(data)
+
+    def finish(self):
+        """Mark the execution as finished. Returns the `(stream_type, text)` frames of the tail to emit."""
+        self.done = True
+        self._head = []
+        if not self.spooled:
+            return []
+        self._file.close()
+        self._file = None
+        tail = list(self._tail)
+        excess = self._tail_length - self.tail_size
+        if excess > 0:
+            tail[0] = (tail[0][0], tail[0][1][excess:])
+        self._tail = deque()
+        self.tail_bytes = sum(len(text.encode('utf-8')) for _, text in tail)
+        return tail
+
+    def info(self):
+        """Describe the spool for the final frame of the execution"""
+        return {
+            'token': self.token,
+            'size': self.size,
+            'headBytes': self.head_bytes,
+            'tailOffset': self.size - self.tail_bytes
+        }
+
+    def read(self, offset, length):
+        """Return `(data, next_offset)` for a range of the spool, adjusted to whole characters"""
+        length = max(0, min(length, MAX_READ_LENGTH))
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+        start, end = _utf8_range(data, self.done and offset + len(data) >= self.size)
+        return data[start:end].decode('utf-8', 'replace'), offset + end
+
+    def delete(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class OutputSpools:
+    """Output of the running executions, and the spools of the last finished ones, keyed by cell id"""
+    def __init__(self, spool_dir='/tmp/cell-outputs', preview_size=256 * 1024, tail_size=64 * 1024, kept=20):
+        self.spool_dir = spool_dir
+        self.preview_size = preview_size
+        self.tail_size = tail_size
+        self.kept = kept
+        self._running = {}
+        self._finished = OrderedDict()
+
+    @classmethod
+    def from_environ(cls, environ=None):
+        environ = os.environ if environ is None else environ
+        return cls(
+            environ.get('KERNEL_OUTPUT_SPOOL_DIR', '/tmp/cell-outputs'),
+            int(environ.get('KERNEL_OUTPUT_PREVIEW_SIZE', 256 * 1024)),
+            int(environ.get('KERNEL_OUTPUT_TAIL_SIZE', 64 * 1024)),
+            int(environ.get('KERNEL_OUTPUT_SPOOLS_KEPT', 20)))
+
+    @property
+    def enabled(self):
+        return self.preview_size > 0
+
+    def get(self, cell_id):
+        """Return the running or last spooled output of the cell"""
+        return self._running.get(cell_id) or self._finished.get(cell_id)
+
+    def write(self, cell_id, stream_type, text):
+        """Record output of the cell. Returns the part of it to emit now."""
+        if not self.enabled:
+            return text
+        output = self._running.get(cell_id)
+        if output is None:
+            # A new execution replaces the spool of the previous one
+            previous = self._finished.pop(cell_id, None)
+            if previous is not None:
+                previous.delete()
+            output = self._running[cell_id] = CellOutput(cell_id, self.spool_dir, self.preview_size, self.tail_size)
+        return output.write(stream_type, text)
+
+    def finish(self, cell_id):
+        """End the execution of the cell. Returns the tail frames to emit and the spool info, `None` if the output
+        was emitted in full.
+        """
+        output = self._running.pop(cell_id, None)
+        if output is None:
+            return [], None
+        tail = output.finish()
+        if not output.spooled:
+            return [], None
+        self._finished[cell_id] = output
+        while len(self._finished) > self.kept:
+            _, evicted = self._finished.popitem(last=False)
+            evicted.delete()
+        return tail, output.info()
@@ -0,0 +1,401 @@
+# encoding: utf-8
+"""
+REPL worker process.
+
+The interactive console used to run on the Tornado IOLoop thread, which meant a single long running cell blocked
+`/ping`, `/file`, `/endpoints` and every other request made to the kernel. The console now lives in a separate
+worker process that owns the namespace. The kernel server talks to it over a `multiprocessing.Pipe`:
+
+    server -> worker: {'type': 'execute', 'cellId': ..., 'channel': ..., 'code': ...}
+    worker -> server: {'type': 'stream', 'cellId': ..., 'channel': ..., 'streamType': 'stdout', 'data': ...}
+    worker -> server: {'type': 'result', 'cellId': ..., 'channel': ..., 'usage': {...}}
+    server -> worker: {'type': 'reload', 'paths': [...]}
+    worker -> server: {'type': 'reloaded', 'modules': [...], 'errors': {...}}
+    server -> worker: {'type': 'snapshot' | 'restore', 'requestId': ..., 'path': ...}
+    worker -> server: {'type': 'snapshot' | 'restore', 'requestId': ..., 'summary': {...}, 'error': ...}
+
+Jobs are executed in the order they are received, so the namespace semantics are the same as before. Reloads of
+changed code files are queued the same way and run between cells (see `module_reloader`).
+
+Output is no longer collected until the cell finishes. `StreamingWriter` replaces stdout/stderr while a cell runs and
+sends its buffer to the server whenever it fills up or has been held for longer than the flush interval, so a long
+training loop shows its progress as it happens and a cell printing gigabytes keeps the worker memory flat.
+
+The worker is started in a fresh interpreter by `kernel_process`, without the modules of the kernel in `sys.modules`,
+and the file path root comes first on `sys.path`, so cells import the code files of the user even when they are
+named like a kernel module (`metrics`, `jobs` ...).
+"""
+import io
+import os
+import sys
+import code
+import time
+import signal
+import resource
+import contextlib
+import asyncio
+import logging
+import multiprocessing
+import threading
+
+import tornado.ioloop
+
+from kernel_process import start_process
+from usage import make_usage
+from module_reloader import ModuleReloader
+from snapshot import take_snapshot, restore_snapshot
+
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+logger = logging.getLogger(__name__)
+
+
+# Maximum number of characters held by a writer before it is flushed
+STREAM_BUFFER_SIZE = 64 * 1024
+
+# Maximum number of seconds output is held by a writer before it is flushed
+STREAM_FLUSH_INTERVAL = 0.1
+
+# Maximum number of worker messages waiting to be handled on the IOLoop. The reader thread stops reading from the
+# pipe when this is reached, which in turn blocks the worker when the pipe is full.
+MAX_PENDING_MESSAGES = 64
+
+
+class StreamingWriter(io.TextIOBase):
+    """A text stream that forwards everything written to it to the server in bounded chunks"""
+    def __init__(self, send, job, stream_type, buffer_size=STREAM_BUFFER_SIZE, flush_interval=STREAM_FLUSH_INTERVAL):
+        super().__init__()
+        self._send = send
+        self._job = job
+        self._stream_type = stream_type
+        self._buffer_size = buffer_size
+        self._flush_interval = flush_interval
+        self._buffer = []
+        self._size = 0
+        # Time at which the oldest character in the buffer was written
+        self._held_since = None
+        self._lock = threading.RLock()
+        # The other stream of the cell. Its buffer is flushed before ours is written to so that the
+        # interleaving of stdout and stderr is preserved.
+        self.sibling = None
+
+    @property
+    def encoding(self):
+        return 'utf-8'
+
+    def writable(self):
+        return True
+
+    def write(self, s):
+        if not isinstance(s, str):
+            raise TypeError('write() argument must be str, not {}'.format(type(s).__name__))
+        written = len(s)
+        if self.sibling is not None:
+            self.sibling.flush()
+        with self._lock:
+            # Never hold more than `buffer_size` characters, flush as soon as the buffer is full
+            while s:
+                if self._held_since is None:
+                    self._held_since = time.monotonic()
+                chunk = s[:self._buffer_size - self._size]
+                s = s[len(chunk):]
+                self._buffer.append(chunk)
+                self._size += len(chunk)
+                if self._size >= self._buffer_size:
+                    self._flush()
+            if self._size and time.monotonic() - self._held_since >= self._flush_interval:
+                self._flush()
+        return written
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def flush_if_stale(self):
+        """Flush if output has been held for longer than the flush interval"""
+        with self._lock:
+            if self._size and time.monotonic() - self._held_since >= self._flush_interval:
+                self._flush()
+
+    def _flush(self):
+        self._held_since = None
+        if not self._size:
+            return
+        data = ''.join(self._buffer)
+        self._buffer = []
+        self._size = 0
+        self._send({
+            'type': 'stream',
+            'cellId': self._job['cellId'],
+            'channel': self._job['channel'],
+            'streamType': self._stream_type,
+            'data': data
+        })
+
+
+class _Flusher(threading.Thread):
+    """Periodically flush the writers of the running cell, so output is delivered even when a cell goes quiet"""
+    def __init__(self, interval=STREAM_FLUSH_INTERVAL):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.writers = ()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            for writer in self.writers:
+                writer.flush_if_stale()
+
+
+def _measure(started, before):
+    """Usage of the worker, and the processes it waited for, since `started` and the `before` rusages"""
+    after = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    return make_usage(
+        time.monotonic() - started,
+        sum(a.ru_utime - b.ru_utime for a, b in zip(after, before)),
+        sum(a.ru_stime - b.ru_stime for a, b in zip(after, before)),
+        # Linux reports kilobytes
+        max(usage.ru_maxrss for usage in after) * 1024)
+
+
+def _execute(console, job, send, flusher):
+    """Execute the code in job, streaming its output with `send`"""
+    started = time.monotonic()
+    before = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    out = StreamingWriter(send, job, 'stdout')
+    err = StreamingWriter(send, job, 'stderr')
+    out.sibling = err
+    err.sibling = out
+    flusher.writers = (out, err)
+    try:
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            try:
+                # SIGINT raises `KeyboardInterrupt` only while user code runs, so that a late interrupt can not
+                # break the main loop of the worker
+                signal.signal(signal.SIGINT, signal.default_int_handler)
+                try:
+                    console.runcode(job['code'])
+                finally:
+                    signal.signal(signal.SIGINT, signal.SIG_IGN)
+            except (SystemExit, KeyboardInterrupt):
+                # `exit()` inside a cell must not take down the worker. `KeyboardInterrupt` is usually handled by
+                # the console, unless it arrives right after the code returned.
+                console.showtraceback()
+    finally:
+        flusher.writers = ()
+        out.flush()
+        err.flush()
+    send({
+        'type': 'result',
+        'cellId': job['cellId'],
+        'channel': job['channel'],
+        'usage': _measure(started, before)
+    })
+
+
+def _reload(console, reloader, job, send):
+    """Reload the modules affected by the changed code files of job"""
+    modules, errors = reloader.reload(job['paths'], console.locals)
+    send({
+        'type': 'reloaded',
+        'modules': modules,
+        'errors': errors
+    })
+
+
+def _snapshot(console, job, send):
+    """Save the namespace to, or restore it from, the snapshot file of job"""
+    reply = {
+        'type': job['type'],
+        'requestId': job['requestId']
+    }
+    try:
+        if job['type'] == 'snapshot':
+            reply['summary'] = take_snapshot(console.locals, job['path'])
+        else:
+            reply['summary'] = restore_snapshot(console.locals, job['path'])
+    except Exception as e:
+        reply['error'] = '{}: {}'.format(type(e).__name__, e)
+    send(reply)
+
+
+def run_console(conn, file_path_root=None):
+    """Main loop of the worker process. Receive jobs over `conn` until the pipe is closed."""
+    console = code.InteractiveConsole()
+    reloader = None
+    if file_path_root is not None:
+        # Code files can be imported by cells, and are reloaded when they change. They take precedence over the
+        # directory of the kernel, like the directory of a script does.
+        sys.path.insert(0, file_path_root)
+        reloader = ModuleReloader(file_path_root)
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    flusher = _Flusher()
+    flusher.start()
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        if job['type'] == 'execute':
+            _execute(console, job, send, flusher)
+        elif job['type'] == 'reload' and reloader is not None:
+            _reload(console, reloader, job, send)
+        elif job['type'] in ('snapshot', 'restore'):
+            _snapshot(console, job, send)
+    conn.close()
+
+
+class REPLWorker:
+    """Server side handle of the REPL worker process.
+
+    Messages received from the worker are handed to `on_message` on the IOLoop thread, so callers never
+    have to deal with thread safety.
+    """
+    def __init__(self, on_message, on_restart=None, file_path_root=None):
+        self._on_message = on_message
+        self._on_restart = on_restart
+        self.file_path_root = file_path_root
+        self._conn = None
+        self._process = None
+        self._io_loop = None
+        self._send_lock = threading.Lock()
+        self._backlog = threading.BoundedSemaphore(MAX_PENDING_MESSAGES)
+        self._closing = False
+        # Jobs sent to the worker that have not returned a result yet
+        self.pending = {}
+        # Futures resolved when the pending jobs finish, keyed by cell id
+        self._waiters = {}
+        # Futures resolved with the replies of the worker to requests, keyed by request id
+        self._requests = {}
+        self._request_count = 0
+
+    @property
+    def pid(self):
+        return self._process.pid if self._process else None
+
+    def start(self):
+        """Start the worker process and start reading its results"""
+        self._io_loop = tornado.ioloop.IOLoop.current()
+        self._conn, child_conn = multiprocessing.Pipe()
+        self._process = start_process('repl_worker', 'run_console', child_conn, self.file_path_root)
+        child_conn.close()
+        reader = threading.Thread(target=self._read_messages, args=(self._conn,), daemon=True)
+        reader.start()
+        logger.info('Started REPL worker {}'.format(self._process.pid))
+
+    def stop(self):
+        self._closing = True
+        if self._conn is not None:
+            with self._send_lock:
+                self._conn.send(None)
+        if self._process is not None:
+            self._process.join(timeout=1)
+            if self._process.is_alive():
+                self._process.terminate()
+
+    def submit(self, cell_id, channel, code):
+        """Queue code for execution. Returns a future resolved with `True` once the code has run, `False` if the
+        worker exited while running it.
+        """
+        job = {
+            'type': 'execute',
+            'cellId': cell_id,
+            'channel': channel,
+            'code': code
+        }
+        self.pending[cell_id] = job
+        future = asyncio.get_event_loop().create_future()
+        self._waiters[cell_id] = future
+        with self._send_lock:
+            self._conn.send(job)
+        return future
+
+    def request(self, message):
+        """Send a message the worker replies to, once the queued cells have run. Returns a future resolved with the
+        reply, `None` if the worker exited first.
+        """
+        self._request_count += 1
+        message = dict(message, requestId=self._request_count)
+        future = asyncio.get_event_loop().create_future()
+        self._requests[message['requestId']] = future
+        with self._send_lock:
+            self._conn.send(message)
+        return future
+
+    def reload(self, paths):
+        """Reload the modules of the changed code files once the queued cells have run"""
+        if self._conn is None:
+            return
+        with self._send_lock:
+            self._conn.send({
+                'type': 'reload',
+                'paths': list(paths)
+            })
+
+    def send_signal(self, signum):
+        """Signal the worker while it runs a job. SIGINT and SIGTERM raise `KeyboardInterrupt` in the running cell,
+        SIGKILL kills the worker, which is then restarted with a fresh namespace.
+        """
+        if not self.pending or self._process is None or not self._process.is_alive():
+            return
+        os.kill(self._process.pid, signal.SIGKILL if signum == signal.SIGKILL else signal.SIGINT)
+
+    def _resolve(self, cell_id, result):
+        future = self._waiters.pop(cell_id, None)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def _read_messages(self, conn):
+        """Runs in a background thread. Relay worker messages to the IOLoop."""
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            self._backlog.acquire()
+            self._io_loop.add_callback(self._dispatch, message)
+        self._io_loop.add_callback(self._worker_exited, conn)
+
+    def _dispatch(self, message):
+        try:
+            if 'requestId' in message:
+                future = self._requests.pop(message['requestId'], None)
+                if future is not None and not future.done():
+                    future.set_result(message)
+                return
+            if message['type'] == 'result':
+                self.pending.pop(message['cellId'], None)
+            self._on_message(message)
+            if message['type'] == 'result':
+                self._resolve(message['cellId'], True)
+        finally:
+            self._backlog.release()
+
+    def _worker_exited(self, conn):
+        if self._closing or conn is not self._conn:
+            return
+        # The worker died (segfault, os._exit, OOM kill ...). Start a fresh one so the kernel remains usable,
+        # and let the caller know which jobs were lost.
+        logger.error('REPL worker {} exited unexpectedly. Restarting.'.format(self.pid))
+        lost = list(self.pending.values())
+        self.pending = {}
+        self._conn.close()
+        self.start()
+        if self._on_restart:
+            self._on_restart(lost)
+        for job in lost:
+            self._resolve(job['cellId'], False)
+        requests, self._requests = self._requests, {}
+        for future in requests.values():
+            if not future.done():
+                future.set_result(None)
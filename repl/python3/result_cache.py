@@ -0,0 +1,130 @@
+# encoding: utf-8
+"""
+Content-addressed cache of endpoint results.
+
+Endpoints that are pure lookups are hit by dashboards every few seconds, and every request used to evaluate the
+signature again. An endpoint opts into caching through its config:
+
+    {"name": "users", "path": "/<int:user_id>", "signature": "get_user(user_id)", "cache": true, "cacheTtl": 30}
+
+The key of a result is the hash of the endpoint source, its signature, the code files it imports from the file path
+root and the parsed arguments. Editing any of these files yields new keys, so stale results are never served and
+simply age out. Results expire after `cacheTtl` seconds, and the least recently used ones are evicted once the cache
+holds more than `max_bytes` of output. Only successful results are cached.
+"""
+import os
+import json
+import time
+import hashlib
+
+from collections import OrderedDict
+
+from endpoint_worker import content_digest
+
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+DEFAULT_CACHE_TTL = 60
+
+DEFAULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def parse_cache_config(config):
+    """Return the TTL of cached results of the endpoint, `None` if caching is off. Raises `ValueError`."""
+    if not config.get('cache'):
+        return None
+    ttl = config.get('cacheTtl', DEFAULT_CACHE_TTL)
+    if isinstance(ttl, bool) or not isinstance(ttl, (int, float)) or ttl <= 0:
+        raise ValueError('cacheTtl must be a positive number of seconds')
+    return ttl
+
+
+class FileDigests:
+    """Digests of code files, read again only when their mtime or size changes"""
+    def __init__(self):
+        self._digests = {}
+
+    def get(self, path):
+        """Return the digest of the file, `None` if it does not exist"""
+        try:
+            stat = os.stat(path)
+            stat = stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            stat = None
+        cached = self._digests.get(path)
+        if cached is not None and cached[0] == stat:
+            return cached[1]
+        try:
+            with open(path, 'rb') as f:
+                digest = content_digest(f.read())
+        except FileNotFoundError:
+            digest = None
+        self._digests[path] = (stat, digest)
+        return digest
+
+    def dependency_digest(self, worker):
+        """Combined digest of the files imported by the endpoint worker.
+
+        Returns `None` if one of them changed since the worker imported it, i.e. the worker runs stale code.
+        """
+        parts = []
+        for path in worker.imported_files:
+            digest = self.get(path)
+            # The digest seen first is the one the worker imported
+            if worker.import_digests.setdefault(path, digest) != digest:
+                return None
+            parts.append('{}:{}'.format(path, digest))
+        return content_digest('\n'.join(parts))
+
+
+def cache_key(endpoint, dependency_digest, args):
+    """Key of the result of the endpoint, an entry of the endpoint registry, for the parsed args"""
+    key = json.dumps([endpoint.digest, endpoint.signature, dependency_digest, args], sort_keys=True, default=str)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """LRU cache of endpoint outputs with a TTL per entry and a cap on the total size of the outputs"""
+    def __init__(self, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        # key -> (expires_at, output, size in bytes), least recently used first
+        self._entries = OrderedDict()
+
+    @classmethod
+    def from_environ(cls, environ=None):
+        environ = os.environ if environ is None else environ
+        return cls(int(environ.get('KERNEL_ENDPOINT_CACHE_MAX_BYTES', DEFAULT_CACHE_MAX_BYTES)))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        self.size -= self._entries.pop(key)[2]
+
+    def get(self, key):
+        """Return the cached output, `None` on a miss"""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, output, ttl):
+        if key in self._entries:
+            self._remove(key)
+        size = len(output.encode('utf-8'))
+        if size > self.max_bytes:
+            # Caching it would evict everything else
+            return
+        self._entries[key] = (time.monotonic() + ttl, output, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
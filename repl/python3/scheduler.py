@@ -0,0 +1,166 @@
+# encoding: utf-8
+"""
+Execution scheduler of the kernel.
+
+REPL cells, shell cells, file runs and endpoint requests used to start as soon as they were received, so a burst of
+endpoint traffic competed with the cells a user was typing. Every job now takes a slot from the `Scheduler` before
+it runs:
+
+* Each job class has a priority and a concurrency limit. Waiting cell runs are started before waiting endpoint
+  requests, and endpoint requests can never take the slots of the REPL or the shell.
+* A global limit caps the number of jobs running at once.
+* Within a class, waiting jobs are queued per key (the Socket.IO channel of a cell, the name of an endpoint) and the
+  keys take turns, so one channel queueing many cells does not starve the others.
+
+Limits are read from the environment by `Scheduler.from_environ`:
+
+    KERNEL_MAX_RUNNING_JOBS          Maximum number of jobs running at once. (10)
+    KERNEL_FILE_MAX_CONCURRENCY      Maximum number of files running at once. (4)
+    KERNEL_ENDPOINT_MAX_CONCURRENCY  Maximum number of endpoint requests running at once. (4)
+
+The REPL and the shell run one job at a time.
+"""
+import os
+import asyncio
+
+from collections import OrderedDict, deque
+
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+# Job classes, highest priority first
+REPL = 'repl'
+SHELL = 'shell'
+FILE = 'file'
+ENDPOINT = 'endpoint'
+
+
+class JobClass:
+    """Limit, priority and fair queue of a class of jobs"""
+    def __init__(self, name, priority, max_running):
+        self.name = name
+        self.priority = priority
+        self.max_running = max_running
+        self.running = 0
+        self.queued = 0
+        # key -> waiting futures. The key served last is moved to the end.
+        self._queues = OrderedDict()
+
+    def push(self, key, future):
+        self._queues.setdefault(key, deque()).append(future)
+        self.queued += 1
+
+    def pop(self):
+        """Return the next waiting future, taking turns between keys"""
+        key, queue = next(iter(self._queues.items()))
+        future = queue.popleft()
+        if queue:
+            self._queues.move_to_end(key)
+        else:
+            del self._queues[key]
+        self.queued -= 1
+        return future
+
+    def remove(self, key, future):
+        queue = self._queues.get(key)
+        if queue is None or future not in queue:
+            return
+        queue.remove(future)
+        if not queue:
+            del self._queues[key]
+        self.queued -= 1
+
+    def status(self):
+        return {
+            'running': self.running,
+            'queued': self.queued,
+            'maxRunning': self.max_running,
+            'queuedByKey': {str(key): len(queue) for key, queue in self._queues.items()}
+        }
+
+
+class _Slot:
+    """Async context manager holding a slot of the scheduler"""
+    def __init__(self, scheduler, job_class, key):
+        self._scheduler = scheduler
+        self._job_class = job_class
+        self._key = key
+
+    async def __aenter__(self):
+        await self._scheduler.acquire(self._job_class, self._key)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._scheduler.release(self._job_class)
+
+
+class Scheduler:
+    """Hand out execution slots by priority, per class limits and fair queueing between keys"""
+    def __init__(self, max_running=10, file_max_running=4, endpoint_max_running=4):
+        self.max_running = max_running
+        self.running = 0
+        self._classes = OrderedDict((job_class.name, job_class) for job_class in [
+            JobClass(REPL, 0, 1),
+            JobClass(SHELL, 0, 1),
+            JobClass(FILE, 1, file_max_running),
+            JobClass(ENDPOINT, 2, endpoint_max_running),
+        ])
+
+    @classmethod
+    def from_environ(cls, environ=None):
+        environ = os.environ if environ is None else environ
+        return cls(
+            max_running=int(environ.get('KERNEL_MAX_RUNNING_JOBS', 10)),
+            file_max_running=int(environ.get('KERNEL_FILE_MAX_CONCURRENCY', 4)),
+            endpoint_max_running=int(environ.get('KERNEL_ENDPOINT_MAX_CONCURRENCY', 4))
+        )
+
+    def slot(self, job_class, key=None):
+        """Return an async context manager that waits for a slot of job_class and holds it"""
+        return _Slot(self, job_class, key)
+
+    async def acquire(self, name, key=None):
+        """Wait until a job of class name, queued under key, may run"""
+        job_class = self._classes[name]
+        future = asyncio.get_event_loop().create_future()
+        job_class.push(key, future)
+        self._schedule()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over before the waiter went away
+                self.release(name)
+            else:
+                job_class.remove(key, future)
+            raise
+
+    def release(self, name):
+        job_class = self._classes[name]
+        self.running -= 1
+        job_class.running -= 1
+        self._schedule()
+
+    def _schedule(self):
+        """Start waiting jobs, highest priority first, while there are free slots"""
+        for job_class in sorted(self._classes.values(), key=lambda c: c.priority):
+            while job_class.queued and job_class.running < job_class.max_running:
+                if self.running >= self.max_running:
+                    # Keep the free slots for this class, lower priority jobs wait
+                    return
+                future = job_class.pop()
+                if future.done():
+                    continue
+                self.running += 1
+                job_class.running += 1
+                future.set_result(None)
+
+    def status(self):
+        """Running and queued jobs, overall and per class"""
+        return {
+            'running': self.running,
+            'queued': sum(job_class.queued for job_class in self._classes.values()),
+            'maxRunning': self.max_running,
+            'classes': {name: job_class.status() for name, job_class in self._classes.items()}
+        }
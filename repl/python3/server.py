@@ -11,25 +11,39 @@ be redirected to cell log output.
 
 """
 import os
-import re
 import sys
-import code
+import json
 import time
+import signal
 import asyncio
-import contextlib
-import json
-import requests
 
 import logging
 import tornado.ioloop
 import tornado.web
 import tornado.escape
 
-from io import StringIO
-from subprocess import Popen, PIPE
-from asyncio.subprocess import PIPE
 from flask_socketio import SocketIO
-from urllib.parse import urlparse
+
+# Modules shared with the other kernels and the app, mounted at `/opt/common` next to the kernel
+sys.path.append(os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common')))
+
+from repl_worker import REPLWorker
+from file_pool import WarmInterpreterPool
+from file_runner import FileRunner
+from shell import BashCoprocess
+from endpoint_worker import EndpointWorker, content_digest
+from endpoint_registry import EndpointRegistry
+from code_file_store import CodeFileStore
+from file_delta import split_chunks, chunk_hash, apply_delta
+from result_cache import ResultCache, FileDigests, cache_key
+from scheduler import Scheduler, REPL, SHELL, FILE, ENDPOINT
+from jobs import JobTable, DEQUEUED
+from usage import UsageHistory
+from metrics import register_kernel_collector
+from kernel_metrics import observe_execution, observe_emit, render_metrics
+from output_spool import OutputSpools
+from frames import ChannelFraming
+from snapshot import KernelSnapshots
 
 
 __author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
@@ -37,120 +51,110 @@ __author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
 
 socketio = SocketIO(message_queue='redis://redis:6379')
 
-SERVER_URI = os.environ['SERVER_URI']
-
+# Output of executions past the live preview is spooled to disk
+output_spools = OutputSpools.from_environ()
 
-def secure_file_path(file_path, root_dir):
-    """Return a secure version of file path"""
-    return os.path.abspath(os.path.join(root_dir, os.path.relpath(file_path.replace('~', ''), root_dir))).lstrip(os.sep)
+# Channels may ask for binary `code_result` frames
+channel_framing = ChannelFraming.from_environ()
 
 
-# https://stackoverflow.com/questions/17190221/subprocess-popen-cloning-stdout-and-stderr-both-to-terminal-and-variables/25960956#25960956
-async def read_stream_and_display(stream, display, stream_type, logging_interval=1):
-    """Read from stream line by line until EOF, capture lines and call display method."""
-    # Emit logs every x seconds
-    start = time.time()
-    lines = []
-    while True:
-        line = await stream.readline()
-        if logging_interval == 0:
-            if not line:
-                break
-            else:
-                display([line.decode('utf-8')], stream_type)
-                continue
-        if not line:
-            if len(lines):
-                display(lines, stream_type)
-            break
-        time_elapsed = time.time() - start
-        if time_elapsed > logging_interval:
-            # Stream to socket using variable
-            display(lines, stream_type)
-            lines = []
-            start = time.time()
-        else:
-            lines.append(line.decode('utf-8'))
-    return True
+def set_channel_framing(channel, framing):
+    """Use the framing requested by an execution for its channel"""
+    try:
+        channel_framing.set(channel, framing)
+    except ValueError as e:
+        raise tornado.web.HTTPError(400, reason=str(e))
+
+
+def _emit(cell_id, channel, output='', error='', **extra):
+    payload = {
+        'id': cell_id,
+        'output': output,
+        'error': error,
+    }
+    payload.update(extra)
+    started = time.monotonic()
+    data = channel_framing.encode(channel, payload)
+    socketio.emit('code_result', data, room=channel, namespace='/cells')
+    observe_emit(started, data)
+
+
+def emit_code_result(cell_id, channel, output='', error='', **extra):
+    """Emit a `code_result` event for the cell to the given socket channel"""
+    if output:
+        output = output_spools.write(cell_id, 'stdout', output)
+    if error:
+        error = output_spools.write(cell_id, 'stderr', error)
+    if extra.get('done'):
+        tail, spool = output_spools.finish(cell_id)
+        if spool is not None:
+            # The middle of the output is left in the spool, send its end before closing the execution
+            for stream_type, text in tail:
+                if stream_type == 'stdout':
+                    _emit(cell_id, channel, output=text)
+                else:
+                    _emit(cell_id, channel, error=text)
+            extra['spool'] = spool
+    elif not output and not error:
+        return
+    _emit(cell_id, channel, output, error, **extra)
 
 
-async def read_and_display(payload, filename, *cmd):
-    """Capture cmd's stdout, stderr while displaying them as they arrive
-    (line by line).
+def secure_file_path(file_path, root_dir):
+    """Return a secure version of file path"""
+    return os.path.abspath(os.path.join(root_dir, os.path.relpath(file_path.replace('~', ''), root_dir))).lstrip(os.sep)
 
-    """
-    # start process
-    process = await asyncio.create_subprocess_exec(*cmd, stdout=PIPE, stderr=PIPE)
 
-    def post_line_to_server(lines, stream_type):
-        socketio.emit('code_result', {
-            'id': payload['cellId'],
-            'output': ''.join(lines).replace(filename, 'sh') if stream_type == 'stdout' else '',
-            'error': ''.join(lines).replace(filename, 'sh') if stream_type == 'stderr' else '',
-        }, room=payload['channel'], namespace='/cells')
-    # read child's stdout/stderr concurrently (capture and display)
+def get_int_argument(handler, name, default, minimum=0):
+    """Return the query argument as an integer, raising a 400 if it is not one or is less than minimum"""
+    value = handler.get_query_argument(name, None)
+    if value is None:
+        return default
     try:
-        await asyncio.gather(
-            read_stream_and_display(process.stdout, post_line_to_server, 'stdout', 0),
-            read_stream_and_display(process.stderr, post_line_to_server, 'stderr', 0))
-    except Exception as e:
-        process.kill()
-        post_line_to_server([str(e)], 'stderr')
-    finally:
-        # wait for the process to exit
-        rc = await process.wait()
-    return rc
-
-
-def capture_logs(payload, filename, *cmd):
-    # run the event loop
-    if os.name == 'nt':
-        loop = asyncio.ProactorEventLoop() # for subprocess' pipes on Windows
-        asyncio.set_event_loop(loop)
-    else:
-        loop = asyncio.get_event_loop()
-    if loop.is_running():
-        # Tornado runs a default event loop
-        # This is python 3.5.1 !!
-        asyncio.run_coroutine_threadsafe(read_and_display(payload, filename, *cmd), loop)
-    else:
-        loop.run_until_complete(read_and_display(payload, filename, *cmd))
+        value = int(value)
+    except ValueError:
+        raise tornado.web.HTTPError(400, reason='{} must be an integer'.format(name))
+    if value < minimum:
+        raise tornado.web.HTTPError(400, reason='{} must be at least {}'.format(name, minimum))
+    return value
 
 
 class REPLExecutionHandler(tornado.web.RequestHandler):
     """A request handler for executing repl code"""
-    def initialize(self, console):
-        self.console = console
-
-    def create_temporary_shell_file(self, cell_id, code):
-        filename = '/tmp/.file_{}.sh'.format(cell_id)
-        with open(filename, 'w') as f:
-            f.write(code)
-        os.system('chmod +x ./{}'.format(filename))
-        return filename
+    def initialize(self, repl_worker, shell, scheduler, jobs, usage_history):
+        self.repl_worker = repl_worker
+        self.shell = shell
+        self.scheduler = scheduler
+        self.jobs = jobs
+        self.usage_history = usage_history
+
+    async def run_repl(self, job, code):
+        """Run the code provided in cell with specified id on the REPL worker once the scheduler allows it"""
+        async with self.scheduler.slot(REPL, job.channel):
+            job.attach(self.repl_worker)
+            # The worker emits the result through `Python3REPLServer.on_repl_message` once the code has run
+            await self.repl_worker.submit(job.cell_id, job.channel, code)
 
     def execute_repl(self, code, cell_id, channel):
-        """Execute the code provided in cell with specified id"""
-        # Execute code and on receiving input/output pipe them to server using callback_url
-        out = StringIO()
-        err = StringIO()
-        try:
-            with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
-                self.console.runcode(code)
-        except SyntaxError:
-            self.console.showsyntaxerror()
-        except:
-            self.console.showtraceback()
-        socketio.emit('code_result', {
-            'id': cell_id,
-            'output': out.getvalue(),
-            'error': err.getvalue(),
-        }, room=channel, namespace='/cells')
+        self.jobs.add(cell_id, channel, self.run_repl, code)
+
+    async def run_shell(self, job, code):
+        """Run the code on the shell of the kernel, streaming its output to the cell"""
+        def display(lines, stream_type):
+            if stream_type == 'stdout':
+                emit_code_result(job.cell_id, job.channel, output=''.join(lines))
+            else:
+                emit_code_result(job.cell_id, job.channel, error=''.join(lines))
+
+        async with self.scheduler.slot(SHELL, job.channel):
+            returncode, usage = await self.shell.execute(code, display, on_start=job.attach)
+        self.usage_history.record('shell', job.cell_id, job.channel, usage, returncode)
+        observe_execution('shell', usage['wallTime'])
+        emit_code_result(job.cell_id, job.channel, done=True, returncode=returncode, usage=usage)
 
     def execute_shell(self, payload, code):
-        filename = self.create_temporary_shell_file(payload['cellId'], code)
-        # args = shlex.split()
-        capture_logs(payload, filename, *['bash', filename])
+        # Run on the IOLoop, the output is streamed to the cell as it arrives
+        self.jobs.add(payload['cellId'], payload['channel'], self.run_shell, code)
 
     def execute_code(self, language, cell_id, channel, code):
         if language == 'shell':
@@ -168,6 +172,7 @@ class REPLExecutionHandler(tornado.web.RequestHandler):
         language = self.get_query_argument('language')
         channel = self.get_query_argument('channel')
         cell_id = self.get_query_argument('cellId')
+        set_channel_framing(channel, self.get_query_argument('framing', None))
         return self.execute_code(
             language,
             cell_id,
@@ -181,6 +186,7 @@ class REPLExecutionHandler(tornado.web.RequestHandler):
         code = data['code']
         channel = data['channel']
         cell_id = data['cellId']
+        set_channel_framing(channel, data.get('framing'))
         return self.execute_code(
             language,
             cell_id,
@@ -191,50 +197,259 @@ class REPLExecutionHandler(tornado.web.RequestHandler):
 
 class FileExecutionHandler(tornado.web.RequestHandler):
     """A request handler for executing python files"""
-    def initialize(self, file_path_root):
+    def initialize(self, file_path_root, file_runner, file_store, scheduler, jobs, usage_history):
         self.file_path_root = file_path_root
-
-    def execute_file(self, file_path):
-        """Execute the code provided by the file path"""
-        p = Popen([sys.executable, file_path], env={
-            # Module discovery
-            'PYTHONPATH': self.file_path_root
-        }, stdout=PIPE, stderr=PIPE, cwd=self.file_path_root)
-        stdout, stderr = p.communicate()
-        return stderr.decode('utf-8'), stdout.decode('utf-8')
-
-    def get(self):
-        file_path = self.get_query_argument('path')
-        err, out = self.execute_file(secure_file_path(file_path, self.file_path_root))
+        self.file_runner = file_runner
+        self.file_store = file_store
+        self.scheduler = scheduler
+        self.jobs = jobs
+        self.usage_history = usage_history
+
+    async def execute_file(self, file_path, timeout=None):
+        """Execute the code provided by the file path and return its output and usage"""
+        out = []
+        err = []
+
+        def collect(lines, stream_type):
+            (out if stream_type == 'stdout' else err).extend(lines)
+
+        async with self.scheduler.slot(FILE, self.request.remote_ip):
+            returncode, usage = await self.file_runner.run(file_path, collect, timeout)
+        self.usage_history.record('file', None, None, usage, returncode)
+        observe_execution('file', usage['wallTime'])
+        return ''.join(err), ''.join(out), usage
+
+    async def stream_file(self, job, file_path, timeout=None):
+        """Execute the code provided by the file path, streaming its output to the cell"""
+        def display(lines, stream_type):
+            if stream_type == 'stdout':
+                emit_code_result(job.cell_id, job.channel, output=''.join(lines))
+            else:
+                emit_code_result(job.cell_id, job.channel, error=''.join(lines))
+
+        async with self.scheduler.slot(FILE, job.channel):
+            job.leave_queue()
+            returncode, usage = await self.file_runner.run(file_path, display, timeout, on_start=job.attach)
+        self.usage_history.record('file', job.cell_id, job.channel, usage, returncode)
+        observe_execution('file', usage['wallTime'])
+        emit_code_result(job.cell_id, job.channel, done=True, returncode=returncode, usage=usage)
+
+    async def get(self):
+        file_path = secure_file_path(self.get_query_argument('path'), self.file_path_root)
+        timeout = self.get_query_argument('timeout', None)
+        timeout = float(timeout) if timeout else None
+        cell_id = self.get_query_argument('cellId', None)
+        channel = self.get_query_argument('channel', None)
+        if cell_id and channel:
+            set_channel_framing(channel, self.get_query_argument('framing', None))
+            # Return right away, the output is streamed to the cell as it arrives
+            self.jobs.add(cell_id, channel, self.stream_file, file_path, timeout)
+            return self.write('Ok')
+        err, out, usage = await self.execute_file(file_path, timeout)
         self.write(json.dumps({
             'error': err,
-            'output': out
+            'output': out,
+            'usage': usage
         }))
 
     def post(self):
         file_data = tornado.escape.json_decode(self.request.body)
         file_path = secure_file_path(file_data['filePath'], self.file_path_root)
         file_content = file_data['content']
-        full_path = os.path.normpath(os.path.join(self.file_path_root, file_path))
-        base_dir = os.path.dirname(full_path)
-        if not os.path.exists(base_dir):
-            os.makedirs(base_dir)
-        with open(full_path, 'w', encoding='utf-8') as f:
-            f.write(file_content)
+        self.file_store.write(file_path, file_content)
         return self.write(file_path)
 
 
+def _read_code_file(full_path):
+    """Return the content of the code file, `None` if it does not exist"""
+    try:
+        # Keep line endings as they are, they are part of the digest
+        with open(full_path, 'r', encoding='utf-8', newline='') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+class FileChunksHandler(tornado.web.RequestHandler):
+    """Report the digest and chunk hashes of a code file, the base of a delta update (see `file_delta`)"""
+    def initialize(self, file_path_root, file_store):
+        self.file_path_root = file_path_root
+        self.file_store = file_store
+
+    def get(self):
+        file_path = secure_file_path(self.get_query_argument('path'), self.file_path_root)
+        content = _read_code_file(self.file_store.full_path(file_path))
+        self.set_header('Content-Type', 'application/json')
+        return self.write(json.dumps({
+            'filePath': file_path,
+            'digest': None if content is None else content_digest(content),
+            'chunks': [] if content is None else [chunk_hash(chunk) for chunk in split_chunks(content)]
+        }))
+
+
+class FileDeltaHandler(tornado.web.RequestHandler):
+    """Apply a delta update to a code file"""
+    def initialize(self, file_path_root, file_store):
+        self.file_path_root = file_path_root
+        self.file_store = file_store
+
+    def post(self):
+        body = tornado.escape.json_decode(self.request.body)
+        file_path = secure_file_path(body['filePath'], self.file_path_root)
+        base_content = _read_code_file(self.file_store.full_path(file_path))
+        if base_content is None or content_digest(base_content) != body['baseDigest']:
+            raise tornado.web.HTTPError(409, reason='File changed since its chunks were read')
+        try:
+            content = apply_delta(base_content, body['ops'])
+        except (ValueError, TypeError, IndexError) as e:
+            raise tornado.web.HTTPError(400, reason=str(e))
+        if content_digest(content) != body['digest']:
+            raise tornado.web.HTTPError(409, reason='Digest mismatch after applying delta')
+        self.file_store.write(file_path, content)
+        return self.write(file_path)
+
+
+class FilesHandler(tornado.web.RequestHandler):
+    """Write a batch of code files in one request"""
+    def initialize(self, file_path_root, file_store):
+        self.file_path_root = file_path_root
+        self.file_store = file_store
+
+    def post(self):
+        # The body may be gzip compressed (`Content-Encoding: gzip`), it is decompressed by Tornado
+        body = tornado.escape.json_decode(self.request.body)
+        files = [
+            (secure_file_path(item['filePath'], self.file_path_root), item['content'])
+            for item in body['files']
+        ]
+        results = self.file_store.write_many(files)
+        self.set_header('Content-Type', 'application/json')
+        return self.write(json.dumps({
+            'files': [
+                {'filePath': file_path, 'written': written}
+                for (file_path, _), (_, written) in zip(files, results)
+            ],
+            'written': sum(1 for _, written in results if written),
+            'skipped': sum(1 for _, written in results if not written)
+        }))
+
+
 class PingHandler(tornado.web.RequestHandler):
     """A request handler for health status checks"""
     def get(self):
         return self.write('pong')
 
 
+class CellSignalHandler(tornado.web.RequestHandler):
+    """Interrupt or cancel the execution of a cell"""
+    def initialize(self, jobs, action):
+        self.jobs = jobs
+        self.action = action
+
+    def _signal(self):
+        cell_id = self.get_query_argument('cellId')
+        job = self.jobs.get(cell_id)
+        outcome = getattr(self.jobs, self.action)(cell_id)
+        if outcome is None:
+            raise tornado.web.HTTPError(404, reason='Cell {} is not running'.format(cell_id))
+        if outcome == DEQUEUED:
+            # The job never ran, close the execution of the cell here
+            emit_code_result(cell_id, job.channel, error='Execution was cancelled before it started\n', done=True)
+        self.set_header('Content-Type', 'application/json')
+        return self.write(json.dumps({
+            'cellId': cell_id,
+            'status': outcome
+        }))
+
+    def get(self):
+        return self._signal()
+
+    def post(self):
+        return self._signal()
+
+
+class OutputHandler(tornado.web.RequestHandler):
+    """Serve ranges of the spooled output of a cell"""
+    def initialize(self, output_spools):
+        self.output_spools = output_spools
+
+    def get(self, cell_id):
+        output = self.output_spools.get(cell_id)
+        token = self.get_query_argument('token', None)
+        if output is None or not output.spooled or token is not None and token != output.token:
+            raise tornado.web.HTTPError(404, reason='No spooled output for cell {}'.format(cell_id))
+        offset = get_int_argument(self, 'offset', 0)
+        length = get_int_argument(self, 'length', 64 * 1024, minimum=1)
+        if offset > output.size:
+            raise tornado.web.HTTPError(400, reason='Offset {} is out of range'.format(offset))
+        data, next_offset = output.read(offset, length)
+        self.set_header('Content-Type', 'application/json')
+        return self.write(json.dumps({
+            'cellId': cell_id,
+            'token': output.token,
+            'offset': offset,
+            'next': next_offset,
+            'size': output.size,
+            'done': output.done,
+            'data': data
+        }))
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    """Serve the metrics of the kernel in the Prometheus text format"""
+    def get(self):
+        content_type, body = render_metrics()
+        self.set_header('Content-Type', content_type)
+        return self.write(body)
+
+
+class UsageHandler(tornado.web.RequestHandler):
+    """Report the resource usage of the last executions of the kernel"""
+    def initialize(self, usage_history):
+        self.usage_history = usage_history
+
+    def get(self):
+        limit = get_int_argument(self, 'limit', 0) or None
+        self.set_header('Content-Type', 'application/json')
+        return self.write(json.dumps({
+            'summary': self.usage_history.summary(),
+            'executions': self.usage_history.entries(limit)
+        }))
+
+
+class StatusHandler(tornado.web.RequestHandler):
+    """Report running and queued jobs of the kernel"""
+    def initialize(self, scheduler):
+        self.scheduler = scheduler
+
+    def get(self):
+        self.set_header('Content-Type', 'application/json')
+        return self.write(json.dumps(self.scheduler.status()))
+
+
+class SnapshotHandler(tornado.web.RequestHandler):
+    """Snapshot the REPL namespace to the file path root, or restore it"""
+    def initialize(self, snapshots, action):
+        self.snapshots = snapshots
+        self.action = action
+
+    async def post(self):
+        try:
+            summary = await getattr(self.snapshots, self.action)()
+        except RuntimeError as e:
+            raise tornado.web.HTTPError(500, reason=str(e))
+        if summary is None:
+            raise tornado.web.HTTPError(404, reason='There is no namespace snapshot')
+        self.set_header('Content-Type', 'application/json')
+        return self.write(json.dumps(summary))
+
+
 class EndpointsHandler(tornado.web.RequestHandler):
     """Handle endpoint related requests"""
 
-    def initialize(self, file_path_root):
+    def initialize(self, file_path_root, endpoint_registry):
         self.file_path_root = file_path_root
+        self.endpoint_registry = endpoint_registry
 
     def post(self):
         # An endpoint is like a dynamic route. We execute the endpoint by storing the config in a certain location.
@@ -248,20 +463,23 @@ class EndpointsHandler(tornado.web.RequestHandler):
 
         config['filePath'] = file_path
 
-        full_path = os.path.normpath(os.path.join(self.file_path_root, 'endpoints', '{}.config'.format(config['name'])))
-        base_dir = os.path.dirname(full_path)
-        if not os.path.exists(base_dir):
-            os.makedirs(base_dir)
-        # The endpoint configuration, which we will write to a file (or load from store later on)
-        with open(full_path, 'w') as f:
-            f.write(json.dumps(body['config']))
+        # The registry stores the configuration and compiles its path and query templates once, so requests are
+        # parsed without leaving the kernel
+        try:
+            self.endpoint_registry.register(config)
+        except ValueError as e:
+            raise tornado.web.HTTPError(400, reason=str(e))
         return self.write('Ok')
 
 
 class EndpointsExecutionHandler(tornado.web.RequestHandler):
 
-    def initialize(self, file_path_root):
-        self.file_path_root = file_path_root
+    def initialize(self, endpoint_registry, repl_server):
+        self.endpoint_registry = endpoint_registry
+        self.repl_server = repl_server
+        self.result_cache = repl_server.result_cache
+        self.file_digests = repl_server.file_digests
+        self.scheduler = repl_server.scheduler
 
     def write_error(self, status_code, **kwargs):
         self.set_header('Content-Type', 'application/json')
@@ -272,136 +490,252 @@ class EndpointsExecutionHandler(tornado.web.RequestHandler):
             }
         }))
 
-    def _execute_endpoint(self, file_path):
-        """Execute the code provided by the file path"""
-        p = Popen([sys.executable, file_path], env={
-            # Module discovery
-            'PYTHONPATH': self.file_path_root
-        }, stdout=PIPE, stderr=PIPE, cwd=self.file_path_root)
-        stdout, stderr = p.communicate()
-        return stderr.decode('utf-8'), stdout.decode('utf-8')
-
-    def _get_config(self, endpoint_name):
-        full_path = os.path.normpath(os.path.join(self.file_path_root, 'endpoints', '{}.config'.format(endpoint_name)))
-
-        if not os.path.exists(full_path):
+    def _get_endpoint(self, endpoint_name):
+        try:
+            return self.endpoint_registry.get(endpoint_name)
+        except KeyError:
             raise tornado.web.HTTPError(404, reason='Missing endpoint configuration for {}. Please check if endpoint is defined.'.format(endpoint_name))
-        with open(full_path, 'r') as f:
-            return json.loads(f.read())
-
-    def _write_endpoint_file(self, config):
-        file_path = config['filePath']
-
-        full_path = os.path.normpath(os.path.join(self.file_path_root, file_path))
-
-        if not os.path.exists(full_path):
-            raise tornado.web.HTTPError(404, reason='Missing endpoint configuration for {}. Please check if endpoint is defined.'.format(config['name']))
 
-        with open(full_path, 'r') as f:
-            content = f.read()
-
-            # Use the server to parse the request arguments
-            response = requests.post(SERVER_URI + '/api/v1/cells/internal-endpoints/parse', json={
-                'config': config,
-                'requestUri': self.request.uri
-            })
-            
-            if response.status_code == 400:
-                raise tornado.web.HTTPError(reason=response.json()['message'], status_code=400)
-            elif response.status_code == 200:
-                response_body = response.json()
-
-                query_args = response_body['query']
-                path_args = response_body['path']
-
-                variable_sets = ['{} = "{}"'.format(k, v) if isinstance(v, str) else '{} = {}'.format(k, v) for k, v in path_args.items()]
-
-                # Map them out in file as well
-                variable_sets += ['{} = "{}"'.format(k, v) if isinstance(v, str) else '{} = {}'.format(k, v) for k, v in query_args.items()]
-
-                file_postfix_content = '\n'.join(variable_sets)
-
-                content += '\n' + file_postfix_content
-
-                content += '\n\nprint({})'.format(config['signature'])
-
-                # Write to endpoint specific file
-                endpoint_file = full_path.replace('.py', '') + '--endpoint.py'
-                with open(endpoint_file, 'w') as wf:
-                    wf.write(content + '\n')
-
-                return endpoint_file
-            else:
-                raise tornado.web.HTTPError(reason='Error while attempting to parse endpoint {}'.format(
-                    re.sub(r'\r\n', '', response.text)))
+    def _parse_arguments(self, endpoint):
+        """Return the path and query arguments of the request, keyed by argument name"""
+        try:
+            return endpoint.route.match(self.request.uri)
+        except ValueError as e:
+            raise tornado.web.HTTPError(reason=str(e), status_code=400)
 
-    def get(self, endpoint_name):
+    async def _execute_endpoint(self, endpoint_name):
         # Run the specified endpoint using signature
-        config = self._get_config(endpoint_name)
-        # Create endpoint_file and execute endpoint file
-
-        endpoint_file = self._write_endpoint_file(config)
-
-        err, output = self._execute_endpoint(endpoint_file)
+        endpoint = self._get_endpoint(endpoint_name)
+        args = self._parse_arguments(endpoint)
+
+        if endpoint.cache_ttl is not None:
+            # Look up the cache before getting a worker, which may start or restart one. The key only needs the files
+            # imported by the current worker, without one the result cannot be cached yet.
+            current = self.repl_server.current_endpoint_worker(endpoint)
+            if current is not None:
+                output = self.result_cache.get(cache_key(endpoint, self.file_digests.dependency_digest(current), args))
+                if output is not None:
+                    # Answered without running any code
+                    self.set_header('X-Cache', 'HIT')
+                    return self.write(output)
+            self.set_header('X-Cache', 'MISS')
+
+        # The worker has the endpoint file imported already, only the signature is evaluated
+        worker = self.repl_server.execute_endpoint(endpoint)
+        # A worker replaced by a newer one while the request waits or runs is stopped once the request is done
+        with worker.serving():
+            return await self._call_endpoint(endpoint, worker, args)
+
+    async def _call_endpoint(self, endpoint, worker, args):
+        # Endpoint requests take turns per endpoint, behind the cells users are running
+        async with self.scheduler.slot(ENDPOINT, endpoint.name):
+            started = time.monotonic()
+            err, output = await tornado.ioloop.IOLoop.current().run_in_executor(None, worker.call, args)
+            observe_execution('endpoint', time.monotonic() - started)
 
         if err and len(err):
             self.set_status(500)
             return self.write(err)
         else:
+            if endpoint.cache_ttl is not None:
+                # The worker may have imported more files while running, compute the key again
+                dependency_digest = self.file_digests.dependency_digest(worker)
+                if dependency_digest is not None:
+                    self.result_cache.put(cache_key(endpoint, dependency_digest, args), output, endpoint.cache_ttl)
             self.set_status(200)
             return self.write(output)
 
-    def post(self, endpoint_name):
-        config = self._get_config(endpoint_name)
-        endpoint_file = self._write_endpoint_file(config)
+    async def get(self, endpoint_name):
+        return await self._execute_endpoint(endpoint_name)
 
-        err, output = self._execute_endpoint(endpoint_file)
-
-        if err and len(err):
-            self.set_status(500)
-            return self.write(err)
-        else:
-            self.set_status(200)
-            return self.write(output)
+    async def post(self, endpoint_name):
+        return await self._execute_endpoint(endpoint_name)
 
 
 class Python3REPLServer:
     """The Python3 REPl server"""
     def __init__(self, file_path_root='/tmp/code-files'):
-        # Setup the console
-        self.console = code.InteractiveConsole()
+        # The console runs in a worker process that owns the namespace, so that the IOLoop stays responsive
+        self.repl_worker = REPLWorker(self.on_repl_message, on_restart=self.on_repl_restart,
+                                      file_path_root=file_path_root)
+
+        # Shell cells run on a single bash process, which keeps its working directory and variables between cells
+        self.shell = BashCoprocess()
+
+        # Every job takes a slot from the scheduler, which runs cells ahead of endpoint requests
+        self.scheduler = Scheduler.from_environ()
+
+        # Queued and running cell executions, so that they can be interrupted or cancelled
+        self.jobs = JobTable.from_environ(on_failure=self.on_job_failure)
+
+        # Resource usage of the last executions
+        self.usage_history = UsageHistory.from_environ()
+
+        # The namespace survives restarts of the kernel through snapshots in the file path root
+        self.snapshots = KernelSnapshots.from_environ(self.repl_worker, file_path_root)
 
         # File path root will help with script execution
         self.file_path_root = file_path_root
 
+        # Pre-forked interpreters used to run files, configured through the environment
+        self.file_pool = WarmInterpreterPool.from_environ()
+        self.file_runner = FileRunner.from_environ(file_path_root, self.file_pool)
+
         # Create file path root
         if not os.path.exists(file_path_root):
             os.makedirs(file_path_root)
 
-        # Each endpoint will run in a separate Thread. Otherwise the event loop will block the new server endpoints.
+        # Each endpoint runs in a separate worker process. Otherwise the event loop will block the new server endpoints.
         # We ideally expect a single kernel to have few endpoints. Creating lots of endpoints is not performant.
         # The server will proxy requests/responses to/from the endpoint processes.
-        self._endpoint_threads = {}
-
-    def execute_endpoint(self, cell_id, file_path):
-        """Spawn a separate process that acts as a server endpoint."""
-        # The server should maintain a state about the forked process.
-        # If the code at file_path changes, the server must restart the process
-        # so this is stateful
-        raise NotImplementedError()
+        self._endpoint_workers = {}
+
+        # Configs, compiled routes and source digests of the registered endpoints
+        self.endpoint_registry = EndpointRegistry(file_path_root)
+
+        # Results of endpoints that opted into caching, and the digests of the files the endpoints import
+        self.result_cache = ResultCache.from_environ()
+        self.file_digests = FileDigests()
+
+        # All code file writes go through the store, which keeps the endpoint registry up to date
+        self.file_store = CodeFileStore(file_path_root, self.file_digests)
+        self.file_store.add_listener(self.endpoint_registry.on_files_changed)
+        # and reloads the code files the REPL imported
+        if os.environ.get('KERNEL_MODULE_RELOAD', '1') != '0':
+            self.file_store.add_listener(self.repl_worker.reload)
+
+    def current_endpoint_worker(self, endpoint):
+        """Return the running worker of the endpoint if it serves the current code, `None` otherwise"""
+        worker = self._endpoint_workers.get(endpoint.name)
+        if worker and worker.alive and worker.digest == endpoint.digest and worker.signature == endpoint.signature \
+                and self.file_digests.dependency_digest(worker) is not None:
+            return worker
+        return None
+
+    def execute_endpoint(self, endpoint):
+        """Return the worker process serving the endpoint, an entry of the endpoint registry.
+
+        The worker imports the endpoint file once. It is restarted when the content of the file, or of a code file it
+        imported, changes.
+        """
+        if endpoint.digest is None:
+            raise tornado.web.HTTPError(404, reason='Missing endpoint configuration for {}. Please check if endpoint is defined.'.format(endpoint.name))
+
+        worker = self.current_endpoint_worker(endpoint)
+        if worker is not None:
+            return worker
+        worker = self._endpoint_workers.get(endpoint.name)
+        if worker:
+            worker.stop()
+        worker = EndpointWorker(endpoint.name, endpoint.source_path, self.file_path_root, endpoint.signature,
+                                endpoint.digest)
+        worker.start()
+        self._endpoint_workers[endpoint.name] = worker
+        return worker
+
+    def on_repl_message(self, message):
+        """Relay messages from the REPL worker to the cells namespace"""
+        if message['type'] == 'stream':
+            if message['streamType'] == 'stdout':
+                emit_code_result(message['cellId'], message['channel'], output=message['data'])
+            else:
+                emit_code_result(message['cellId'], message['channel'], error=message['data'])
+        elif message['type'] == 'result':
+            # Output has already been streamed, mark the end of the execution
+            self.usage_history.record('repl', message['cellId'], message['channel'], message['usage'])
+            observe_execution('repl', message['usage']['wallTime'])
+            emit_code_result(message['cellId'], message['channel'], done=True, usage=message['usage'])
+        elif message['type'] == 'reloaded':
+            if message['modules']:
+                logging.info('Reloaded modules {}'.format(', '.join(message['modules'])))
+            for name, error in message['errors'].items():
+                logging.warning('Could not reload module {}\n{}'.format(name, error))
+
+    def on_job_failure(self, job, error):
+        """Close the cell of a job that raised, it will not emit its result"""
+        try:
+            emit_code_result(job.cell_id, job.channel, error=error, done=True)
+        finally:
+            # The spool of the execution is closed even if the frame could not be emitted
+            output_spools.finish(job.cell_id)
+
+    def on_repl_restart(self, lost_jobs):
+        for job in lost_jobs:
+            emit_code_result(job['cellId'], job['channel'],
+                             error='The REPL worker exited unexpectedly. The namespace has been reset.\n', done=True)
+
+    async def stop(self):
+        """Snapshot the namespace and stop the kernel"""
+        await self.snapshots.snapshot_before_exit()
+        tornado.ioloop.IOLoop.current().stop()
+
+    def _handle_sigterm(self, io_loop):
+        def handler(signum, frame):
+            io_loop.add_callback_from_signal(lambda: asyncio.ensure_future(self.stop()))
+        signal.signal(signal.SIGTERM, handler)
 
     def start(self):
         """Start a new REPL server"""
+        # Workers run in fresh interpreters (see `kernel_process`), they inherit neither the modules nor the sockets
+        # of the server
+        self.repl_worker.start()
+        self.file_pool.start()
+        register_kernel_collector(self)
+        # Docker stops the container with SIGTERM, snapshot the namespace first
+        self.snapshots.start()
+        self._handle_sigterm(tornado.ioloop.IOLoop.current())
         app = tornado.web.Application([
             (r"/ping", PingHandler),
-            (r"/repl", REPLExecutionHandler, dict(console=self.console)),
-            (r"/file", FileExecutionHandler, dict(file_path_root=self.file_path_root)),
-            (r"/endpoints", EndpointsHandler, dict(file_path_root=self.file_path_root)),
-            (r"/endpoints/(?P<endpoint_name>[\w\-\d]+).*", EndpointsExecutionHandler, dict(file_path_root=self.file_path_root))
+            (r"/metrics", MetricsHandler),
+            (r"/status", StatusHandler, dict(scheduler=self.scheduler)),
+            (r"/usage", UsageHandler, dict(usage_history=self.usage_history)),
+            (r"/output/(?P<cell_id>[^/]+)", OutputHandler, dict(output_spools=output_spools)),
+            (r"/interrupt", CellSignalHandler, dict(jobs=self.jobs, action='interrupt')),
+            (r"/cancel", CellSignalHandler, dict(jobs=self.jobs, action='cancel')),
+            (r"/snapshot", SnapshotHandler, dict(snapshots=self.snapshots, action='snapshot')),
+            (r"/restore", SnapshotHandler, dict(snapshots=self.snapshots, action='restore')),
+            (r"/repl", REPLExecutionHandler, dict(
+                repl_worker=self.repl_worker,
+                shell=self.shell,
+                scheduler=self.scheduler,
+                jobs=self.jobs,
+                usage_history=self.usage_history
+            )),
+            (r"/file", FileExecutionHandler, dict(
+                file_path_root=self.file_path_root,
+                file_runner=self.file_runner,
+                file_store=self.file_store,
+                scheduler=self.scheduler,
+                jobs=self.jobs,
+                usage_history=self.usage_history
+            )),
+            (r"/file/chunks", FileChunksHandler, dict(
+                file_path_root=self.file_path_root,
+                file_store=self.file_store
+            )),
+            (r"/file/delta", FileDeltaHandler, dict(
+                file_path_root=self.file_path_root,
+                file_store=self.file_store
+            )),
+            (r"/files", FilesHandler, dict(
+                file_path_root=self.file_path_root,
+                file_store=self.file_store
+            )),
+            (r"/endpoints", EndpointsHandler, dict(
+                file_path_root=self.file_path_root,
+                endpoint_registry=self.endpoint_registry
+            )),
+            (r"/endpoints/(?P<endpoint_name>[\w\-\d]+).*", EndpointsExecutionHandler, dict(
+                endpoint_registry=self.endpoint_registry,
+                repl_server=self
+            ))
         ])
-        app.listen(1111)
+        # Batches of code files may be sent gzip compressed
+        app.listen(1111, decompress_request=True)
         logging.info('Started Python 3 Kernel...')
         tornado.ioloop.IOLoop.current().start()
+        self.repl_worker.stop()
+        self.file_pool.stop()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,183 @@
+# encoding: utf-8
+"""
+Persistent bash coprocess for shell cells.
+
+Every shell cell used to be written to `/tmp/.file_<cellId>.sh`, made executable with `os.system('chmod +x ...')`
+and run by a fresh `bash`. Each kernel now keeps one long lived bash process instead. Cells are sent over its stdin:
+
+    IFS= read -r -d '' __runbook_cell <<'<marker>' || true
+    <code>
+    <marker>
+    __runbook_run < /dev/null
+    printf '\n<marker> %d\n' $?
+    printf '\n<marker>\n' >&2
+
+where `__runbook_run` is a function evaluating `$__runbook_cell`, defined once when bash starts. `read` and `eval` are
+builtins, so a cell costs no process spawn besides the commands it runs. Running the cell with `eval` keeps syntax
+errors local to the cell, and redirecting its stdin keeps commands from reading the protocol. The marker, unique per
+cell, tells where the output of the cell ends on stdout and stderr, and carries its exit code. Working directory and
+variables are kept between cells, except for variables declared with `declare` or `local`, which are local to the
+function. If a cell makes bash exit, a new bash is started for the next cell.
+
+Bash runs in its own process group. Interrupting a cell sends SIGINT (SIGTERM to cancel it) to the whole group: the
+running command gets the signal, and the trap of bash returns from `__runbook_run`, which aborts the rest of the cell
+without losing the state of the shell. A signal that arrives before bash reaches `__runbook_run` is recorded by the
+trap, and the cell returns at once when it starts.
+"""
+import os
+import time
+import uuid
+import asyncio
+import logging
+
+import tornado.locks
+
+from asyncio.subprocess import PIPE
+
+from streams import OutputCoalescer, READ_CHUNK_SIZE
+from usage import make_usage, read_process_times
+
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+logger = logging.getLogger(__name__)
+
+
+# Sent once to every new bash
+SHELL_PRELUDE = (
+    "__runbook_run() {\n"
+    "    if [ -n \"$__runbook_signalled\" ]; then\n"
+    "        set -- $__runbook_signalled\n"
+    "        __runbook_signalled=\n"
+    "        return $1\n"
+    "    fi\n"
+    "    eval \"$__runbook_cell\"\n"
+    "    set -- $?\n"
+    "    __runbook_signalled=\n"
+    "    return $1\n"
+    "}\n"
+    "trap 'return 130 2>/dev/null || __runbook_signalled=130' INT\n"
+    "trap 'return 143 2>/dev/null || __runbook_signalled=143' TERM\n"
+)
+
+CELL_TEMPLATE = (
+    "IFS= read -r -d '' __runbook_cell <<'{marker}' || true\n"
+    "{code}\n"
+    "{marker}\n"
+    "__runbook_run < /dev/null\n"
+    "printf '\\n{marker} %d\\n' $?\n"
+    "printf '\\n{marker}\\n' >&2\n"
+)
+
+
+async def _read_until_marker(stream, marker, output):
+    """Feed output from stream to the coalescer until the marker. Returns the rest of the marker line, `None` on EOF."""
+    # The protocol prefixes the marker with a newline, in case the output of the cell does not end with one
+    token = ('\n' + marker).encode('utf-8')
+    buffer = b''
+    while True:
+        chunk = await stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            output.feed(buffer)
+            return None
+        buffer += chunk
+        index = buffer.find(token)
+        if index != -1:
+            output.feed(buffer[:index])
+            rest = buffer[index + len(token):]
+            while b'\n' not in rest:
+                chunk = await stream.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                rest += chunk
+            return rest.split(b'\n', 1)[0].decode('utf-8').strip()
+        # Hold back the end of the buffer if it could be the start of the marker
+        start = buffer.rfind(b'\n', max(0, len(buffer) - len(token) + 1))
+        if start != -1 and token.startswith(buffer[start:]):
+            output.feed(buffer[:start])
+            buffer = buffer[start:]
+        else:
+            output.feed(buffer)
+            buffer = b''
+
+
+class BashCoprocess:
+    """A bash process kept alive between shell cells"""
+    def __init__(self):
+        self._process = None
+        # Cells run one at a time
+        self._lock = tornado.locks.Lock()
+        self._running = False
+
+    @property
+    def alive(self):
+        return self._process is not None and self._process.returncode is None
+
+    @property
+    def pid(self):
+        return self._process.pid if self._process else None
+
+    async def start(self):
+        self._process = await asyncio.create_subprocess_exec(
+            'bash', '--noprofile', '--norc',
+            stdin=PIPE, stdout=PIPE, stderr=PIPE,
+            # Own process group, so signals sent to the kernel do not reach it
+            start_new_session=True)
+        self._process.stdin.write(SHELL_PRELUDE.encode('utf-8'))
+        logger.info('Started bash coprocess {}'.format(self._process.pid))
+
+    def stop(self):
+        if self.alive:
+            self._process.kill()
+
+    def send_signal(self, signum):
+        """Signal the process group of bash while a cell runs. SIGKILL kills bash, which is restarted."""
+        if not self._running or not self.alive:
+            return
+        try:
+            os.killpg(self._process.pid, signum)
+        except ProcessLookupError:
+            pass
+
+    async def execute(self, code, display, on_start=None):
+        """Run code, calling `display(lines, stream_type)` as output arrives.
+
+        `on_start(shell)` is called once the cell is sent to bash, from then on it can be signalled with `send_signal`.
+        Returns the exit code of the cell and its usage (see `usage`).
+        """
+        async with self._lock:
+            if not self.alive:
+                await self.start()
+            process = self._process
+            marker = '__RUNBOOK_CELL_{}__'.format(uuid.uuid4().hex)
+            started = time.monotonic()
+            times_before = read_process_times(process.pid)
+            process.stdin.write(CELL_TEMPLATE.format(marker=marker, code=code).encode('utf-8'))
+            await process.stdin.drain()
+            stdout = OutputCoalescer(display, 'stdout')
+            stderr = OutputCoalescer(display, 'stderr')
+            self._running = True
+            if on_start is not None:
+                on_start(self)
+            try:
+                status, _ = await asyncio.gather(
+                    _read_until_marker(process.stdout, marker, stdout),
+                    _read_until_marker(process.stderr, marker, stderr))
+            finally:
+                self._running = False
+                stdout.close()
+                stderr.close()
+            if status is None:
+                # The cell made bash exit, e.g. with `exit`. A new bash is started for the next cell.
+                returncode = await process.wait()
+                display(['Shell exited with code {}. Working directory and variables were reset.\n'.format(
+                    returncode)], 'stderr')
+                return returncode, make_usage(time.monotonic() - started)
+            times_after = read_process_times(process.pid)
+            if times_before is None or times_after is None:
+                return int(status), make_usage(time.monotonic() - started)
+            return int(status), make_usage(
+                time.monotonic() - started,
+                times_after[0] - times_before[0],
+                times_after[1] - times_before[1])
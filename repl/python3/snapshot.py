@@ -0,0 +1,212 @@
+# encoding: utf-8
+"""
+Snapshots of the REPL namespace.
+
+A kernel container that is stopped and started again used to come back with an empty namespace, and users re-ran
+their setup cells for minutes. The REPL worker can now write its namespace to a snapshot file below the file path
+root and load it back:
+
+* `POST /snapshot` pickles every variable of the console that can be pickled. Modules are recorded by name and
+  imported again on restore. Variables that can not be pickled, e.g. open files or functions defined in cells, are
+  listed in the response with the reason.
+* `POST /restore` loads the snapshot into the namespace, replacing the variables it holds.
+* The kernel restores the snapshot when it boots, before running any cell, and takes one when it is stopped (on
+  SIGTERM), interrupting the running cell if any. Snapshots can also be taken periodically while the REPL is idle.
+
+Variables are pickled one at a time so that one failure does not lose the others. Two names bound to the same object
+are therefore restored as two copies. Snapshots are loaded by the same interpreter that wrote them, so they are only
+as trustworthy as the file path root they live in.
+
+Configuration is read from the environment:
+
+    KERNEL_SNAPSHOT_ON_BOOT   Set to `0` to start with an empty namespace. (1)
+    KERNEL_SNAPSHOT_INTERVAL  Seconds between snapshots of the idle REPL, `0` for none. (0)
+    KERNEL_SNAPSHOT_TIMEOUT   Seconds to wait for the snapshot taken when the kernel is stopped. (8)
+"""
+import os
+import time
+import types
+import pickle
+import signal
+import asyncio
+import logging
+import importlib
+
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+logger = logging.getLogger(__name__)
+
+
+# Name of the snapshot file below the file path root
+SNAPSHOT_FILE_NAME = '.kernel-snapshot.pickle'
+
+SNAPSHOT_VERSION = 1
+
+
+def _variables(namespace):
+    for name, value in list(namespace.items()):
+        # `__builtins__`, `__name__` ...
+        if not name.startswith('__'):
+            yield name, value
+
+
+def take_snapshot(namespace, path):
+    """Write the variables of namespace to path. Returns a summary of what was saved and skipped.
+
+    The file is a sequence of pickled records, `('module', name, module_name)`, `('value', name, data)` and
+    `('skipped', name, reason)`, after a header. Only one variable is held in memory in its pickled form at a time.
+    """
+    started = time.monotonic()
+    saved = []
+    modules = []
+    skipped = {}
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        pickle.dump({'version': SNAPSHOT_VERSION, 'created': time.time()}, f)
+        for name, value in _variables(namespace):
+            if isinstance(value, types.ModuleType):
+                pickle.dump(('module', name, value.__name__), f)
+                modules.append(name)
+                continue
+            try:
+                data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                skipped[name] = '{}: {}'.format(type(e).__name__, e)
+                pickle.dump(('skipped', name, skipped[name]), f)
+                continue
+            pickle.dump(('value', name, data), f, pickle.HIGHEST_PROTOCOL)
+            saved.append(name)
+    os.replace(tmp_path, path)
+    return {
+        'saved': saved,
+        'modules': modules,
+        'skipped': skipped,
+        'size': os.path.getsize(path),
+        'duration': round(time.monotonic() - started, 6)
+    }
+
+
+def restore_snapshot(namespace, path):
+    """Load the variables of the snapshot at path into namespace. Returns a summary of what was restored."""
+    started = time.monotonic()
+    restored = []
+    failed = {}
+    # Skipped when the snapshot was taken
+    skipped = {}
+    with open(path, 'rb') as f:
+        header = pickle.load(f)
+        if header.get('version') != SNAPSHOT_VERSION:
+            raise ValueError('Unsupported snapshot version {}'.format(header.get('version')))
+        while True:
+            try:
+                kind, name, value = pickle.load(f)
+            except EOFError:
+                break
+            try:
+                if kind == 'module':
+                    namespace[name] = importlib.import_module(value)
+                elif kind == 'value':
+                    namespace[name] = pickle.loads(value)
+                else:
+                    skipped[name] = value
+                    continue
+                restored.append(name)
+            except Exception as e:
+                failed[name] = '{}: {}'.format(type(e).__name__, e)
+    return {
+        'restored': restored,
+        'failed': failed,
+        'skipped': skipped,
+        'created': header.get('created'),
+        'duration': round(time.monotonic() - started, 6)
+    }
+
+
+class KernelSnapshots:
+    """Take and restore snapshots of the namespace of the REPL worker"""
+    def __init__(self, repl_worker, path, restore_on_boot=True, interval=0, timeout=8.0):
+        self.repl_worker = repl_worker
+        self.path = path
+        self.restore_on_boot = restore_on_boot
+        self.interval = interval
+        self.timeout = timeout
+        self._periodic = None
+
+    @classmethod
+    def from_environ(cls, repl_worker, file_path_root, environ=None):
+        environ = os.environ if environ is None else environ
+        return cls(
+            repl_worker,
+            os.path.join(file_path_root, SNAPSHOT_FILE_NAME),
+            environ.get('KERNEL_SNAPSHOT_ON_BOOT', '1') != '0',
+            float(environ.get('KERNEL_SNAPSHOT_INTERVAL', 0)),
+            float(environ.get('KERNEL_SNAPSHOT_TIMEOUT', 8)))
+
+    def _send(self, message_type):
+        """Send the request to the worker right away. Returns the future of its reply."""
+        return self.repl_worker.request({
+            'type': message_type,
+            'path': self.path
+        })
+
+    async def _summary(self, message_type, reply):
+        reply = await reply
+        if reply is None:
+            raise RuntimeError('The REPL worker exited during the {}'.format(message_type))
+        if reply.get('error'):
+            raise RuntimeError(reply['error'])
+        return reply['summary']
+
+    async def snapshot(self):
+        """Snapshot the namespace, once the cells queued before have run"""
+        return await self._summary('snapshot', self._send('snapshot'))
+
+    async def restore(self):
+        """Restore the last snapshot, before the cells queued after. Returns `None` if there is none."""
+        if not os.path.exists(self.path):
+            return None
+        return await self._summary('restore', self._send('restore'))
+
+    async def _restore_on_boot(self, reply):
+        try:
+            summary = await self._summary('restore', reply)
+        except Exception:
+            logger.exception('Could not restore the namespace snapshot')
+            return
+        logger.info('Restored {} variables from the namespace snapshot in {}s'.format(
+            len(summary['restored']), summary['duration']))
+
+    async def _snapshot_if_idle(self):
+        if self.repl_worker.pending:
+            return
+        try:
+            await self.snapshot()
+        except Exception:
+            logger.exception('Could not snapshot the namespace')
+
+    async def _snapshot_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._snapshot_if_idle()
+
+    def start(self):
+        """Restore the snapshot of the previous run and schedule periodic snapshots. Call after the worker started."""
+        if self.restore_on_boot and os.path.exists(self.path):
+            # Queued on the worker before any cell can be
+            asyncio.ensure_future(self._restore_on_boot(self._send('restore')))
+        if self.interval > 0:
+            self._periodic = asyncio.ensure_future(self._snapshot_periodically())
+
+    async def snapshot_before_exit(self):
+        """Snapshot the namespace as the kernel stops, interrupting the running cell so it does not wait for it"""
+        if self._periodic is not None:
+            self._periodic.cancel()
+        if self.repl_worker.pending:
+            self.repl_worker.send_signal(signal.SIGINT)
+        try:
+            summary = await asyncio.wait_for(self.snapshot(), self.timeout)
+            logger.info('Saved {} variables to the namespace snapshot'.format(len(summary['saved'])))
+        except Exception:
+            logger.exception('Could not snapshot the namespace before exiting')
@@ -1,7 +1,7 @@
 #!/bin/bash
 
-pip install tornado==5.0.0
-pip install requests
-pip install flask-socketio==3.3.2
-pip install redis==2.10.6
-python /opt/current/server.py
+# Kernel runtime images come with the dependencies installed, plain base images install them on every start
+python -c 'import tornado, requests, flask_socketio, redis, prometheus_client, msgpack' 2>/dev/null \
+    || pip install -r /opt/current/requirements.txt
+# exec, so that the server receives the SIGTERM of `docker stop` and can snapshot the namespace
+exec python /opt/current/server.py
@@ -0,0 +1,89 @@
+# encoding: utf-8
+"""
+Helpers to relay the output of child processes to cells.
+
+Relaying every line as its own `code_result` emit floods the message queue and the browser as soon as a build
+prints a few thousand lines. Output is read in raw chunks instead, and an `OutputCoalescer` batches it into frames:
+
+* A frame is emitted as soon as `max_bytes` of output are waiting.
+* Output arriving after a quiet period is emitted after `min_latency`, so interactive output still feels instant.
+* While output keeps coming, at most one frame is emitted every `max_latency` seconds.
+
+Output therefore shows up as live as before, while the number of frames per second drops by orders of magnitude.
+"""
+import time
+import codecs
+import asyncio
+
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+# Size of the chunks read from the streams
+READ_CHUNK_SIZE = 64 * 1024
+
+# Output size after which a frame is emitted right away
+COALESCE_MAX_BYTES = 32 * 1024
+
+# Delay before emitting output that follows a quiet period
+COALESCE_MIN_LATENCY = 0.01
+
+# Minimum delay between two frames while output keeps coming
+COALESCE_MAX_LATENCY = 0.1
+
+
+class OutputCoalescer:
+    """Batch output of a stream into frames bounded by size and latency, calling `display([text], stream_type)`"""
+    def __init__(self, display, stream_type, max_bytes=COALESCE_MAX_BYTES, min_latency=COALESCE_MIN_LATENCY,
+                 max_latency=COALESCE_MAX_LATENCY):
+        self.display = display
+        self.stream_type = stream_type
+        self.max_bytes = max_bytes
+        self.min_latency = min_latency
+        self.max_latency = max_latency
+        # Output may be cut in the middle of a multi-byte character
+        self._decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        self._buffer = bytearray()
+        self._timer = None
+        self._last_flush = 0
+
+    def feed(self, data):
+        if not data:
+            return
+        self._buffer.extend(data)
+        if len(self._buffer) >= self.max_bytes:
+            self.flush()
+        elif self._timer is None:
+            now = time.monotonic()
+            if now - self._last_flush >= self.max_latency:
+                delay = self.min_latency
+            else:
+                delay = self._last_flush + self.max_latency - now
+            self._timer = asyncio.get_event_loop().call_later(delay, self.flush)
+
+    def flush(self, final=False):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._last_flush = time.monotonic()
+        text = self._decoder.decode(bytes(self._buffer), final)
+        self._buffer = bytearray()
+        if text:
+            self.display([text], self.stream_type)
+
+    def close(self):
+        self.flush(final=True)
+
+
+async def read_stream_and_display(stream, display, stream_type, **coalescer_options):
+    """Read from stream in chunks until EOF, calling the display method with coalesced frames."""
+    output = OutputCoalescer(display, stream_type, **coalescer_options)
+    try:
+        while True:
+            chunk = await stream.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            output.feed(chunk)
+    finally:
+        output.close()
+    return True
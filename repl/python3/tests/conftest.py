@@ -0,0 +1,24 @@
+# encoding: utf-8
+import os
+import sys
+import asyncio
+
+import pytest
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+# Kernel modules are not packaged. They are mounted into the kernel container and imported from the directory
+# of the server script, so make that directory importable for the tests. So are the modules shared with the other
+# kernels, see `repl/common`.
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'common')))
+
+
+@pytest.fixture
+def loop():
+    """A new event loop, set as the current one for the test"""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    loop.close()
@@ -0,0 +1,24 @@
+# encoding: utf-8
+import pytest
+
+from code_file_store import CodeFileStore
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+@pytest.mark.unit
+def test_write_many_skips_unchanged_files(tmpdir):
+    store = CodeFileStore(str(tmpdir))
+    notified = []
+    store.add_listener(notified.append)
+    files = [('a.py', 'A = 1\n'), ('pkg/b.py', 'B = 1\n')]
+    assert [written for _, written in store.write_many(files)] == [True, True]
+    assert tmpdir.join('pkg', 'b.py').read() == 'B = 1\n'
+    assert [written for _, written in store.write_many(files)] == [False, False]
+    files[1] = ('pkg/b.py', 'B = 2\n')
+    assert [written for _, written in store.write_many(files)] == [False, True]
+    # One notification per batch with changes
+    assert notified == [
+        [str(tmpdir.join('a.py')), str(tmpdir.join('pkg', 'b.py'))],
+        [str(tmpdir.join('pkg', 'b.py'))]
+    ]
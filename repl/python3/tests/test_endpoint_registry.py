@@ -0,0 +1,102 @@
+# encoding: utf-8
+import os
+
+import pytest
+
+from endpoint_registry import EndpointRegistry
+from endpoint_worker import content_digest
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+def write_file(directory, name, content):
+    path = os.path.join(str(directory), name)
+    with open(path, 'w') as f:
+        f.write(content)
+    return path
+
+
+def config(**overrides):
+    config = {'name': 'users', 'filePath': 'users.py', 'signature': 'get_user(user_id)',
+              'path': '/<int:user_id>', 'query': ''}
+    config.update(overrides)
+    return config
+
+
+@pytest.fixture
+def root(tmpdir):
+    write_file(tmpdir, 'users.py', 'def get_user(user_id):\n    return user_id\n')
+    return tmpdir
+
+
+@pytest.mark.unit
+def test_register(root):
+    registry = EndpointRegistry(str(root))
+    entry = registry.register(config())
+    assert entry.signature == 'get_user(user_id)'
+    assert entry.source_path == os.path.join(str(root), 'users.py')
+    assert entry.digest == content_digest('def get_user(user_id):\n    return user_id\n')
+    assert entry.route.match('/endpoints/users/7') == {'user_id': 7}
+    assert registry.get('users') is entry
+    # Persisted, so that endpoints survive a restart of the kernel
+    assert os.path.exists(os.path.join(str(root), 'endpoints', 'users.config'))
+
+
+@pytest.mark.unit
+def test_lookup_after_restart(root):
+    EndpointRegistry(str(root)).register(config())
+    entry = EndpointRegistry(str(root)).get('users')
+    assert entry.signature == 'get_user(user_id)'
+    assert entry.digest is not None
+
+
+@pytest.mark.unit
+def test_unknown_endpoint(root):
+    with pytest.raises(KeyError):
+        EndpointRegistry(str(root)).get('missing')
+
+
+@pytest.mark.unit
+def test_replace(root):
+    registry = EndpointRegistry(str(root))
+    registry.register(config())
+    registry.register(config(signature='get_user(user_id + 1)'))
+    assert registry.get('users').signature == 'get_user(user_id + 1)'
+    # An invalid config does not replace a valid one
+    with pytest.raises(ValueError):
+        registry.register(config(path='/<unknown:user_id>'))
+    assert registry.get('users').signature == 'get_user(user_id + 1)'
+    assert EndpointRegistry(str(root)).get('users').signature == 'get_user(user_id + 1)'
+
+
+@pytest.mark.unit
+def test_changes_on_disk_are_picked_up(root):
+    registry = EndpointRegistry(str(root), check_interval=0)
+    entry = registry.register(config())
+    digest = entry.digest
+    write_file(root, 'users.py', 'def get_user(user_id):\n    return -user_id\n')
+    assert registry.get('users').digest != digest
+    # The config was changed behind the back of the kernel
+    other = EndpointRegistry(str(root))
+    other.register(config(signature='get_user(0)'))
+    assert registry.get('users').signature == 'get_user(0)'
+
+
+@pytest.mark.unit
+def test_removal(root):
+    registry = EndpointRegistry(str(root), check_interval=0)
+    registry.register(config())
+    os.remove(os.path.join(str(root), 'users.py'))
+    assert registry.get('users').digest is None
+    os.remove(os.path.join(str(root), 'endpoints', 'users.config'))
+    with pytest.raises(KeyError):
+        registry.get('users')
+
+
+@pytest.mark.unit
+def test_files_changed_through_the_kernel(root):
+    registry = EndpointRegistry(str(root), check_interval=3600)
+    entry = registry.register(config())
+    path = write_file(root, 'users.py', 'def get_user(user_id):\n    return 0\n')
+    registry.on_files_changed([path])
+    assert entry.digest == content_digest('def get_user(user_id):\n    return 0\n')
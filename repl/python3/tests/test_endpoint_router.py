@@ -0,0 +1,45 @@
+# encoding: utf-8
+import pytest
+
+from endpoint_router import CompiledEndpoint
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('args', [
+    ('/users/<int:user_id>', '<bool:verbose=false>', '/endpoints/users/users/12?verbose=true',
+     {'user_id': 12, 'verbose': True}),
+    ('/users/<int:user_id>', '<bool:verbose=false>', '/endpoints/users/users/12',
+     {'user_id': 12, 'verbose': False}),
+    ('', '<string:name> <number:ratio=0.5>', '/endpoints/users?name=abc',
+     {'name': 'abc', 'ratio': 0.5}),
+    ('', '<int:id>', '/endpoints/users?id=1&id=2', {'id': [1, 2]})
+])
+def test_compiled_endpoint_match(args):
+    route = CompiledEndpoint({'name': 'users', 'path': args[0], 'query': args[1]})
+    assert route.match(args[2]) == args[3]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('args', [
+    ('/users/<int:user_id>', '', '/endpoints/users/accounts/12'),
+    ('/users/<int:user_id>', '', '/endpoints/users/users/abc'),
+    ('', '<string:name>', '/endpoints/users?other=1')
+])
+def test_compiled_endpoint_match_wrong_inputs(args):
+    route = CompiledEndpoint({'name': 'users', 'path': args[0], 'query': args[1]})
+    with pytest.raises(ValueError):
+        route.match(args[2])
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('args', [
+    ('/<random:a>', ''),
+    ('/<int:a>/<a>', ''),
+    ('/<int:a>', '<a=1>'),
+    ('/users(/<int:a>', '')
+])
+def test_compiled_endpoint_invalid_template(args):
+    with pytest.raises(ValueError):
+        CompiledEndpoint({'name': 'users', 'path': args[0], 'query': args[1]})
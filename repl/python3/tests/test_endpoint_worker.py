@@ -0,0 +1,124 @@
+# encoding: utf-8
+import os
+
+import pytest
+
+from endpoint_worker import EndpointWorker, content_digest
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+ENDPOINT = '''import helpers
+
+GREETING = 'hello'
+started_as = None
+
+if __name__ == '__main__':
+    started_as = 'script'
+    print('printed at import')
+
+
+def greet(name, excited=False):
+    print('greeting', name)
+    return '{} {}{}'.format(GREETING, helpers.decorate(name), '!' if excited else '')
+
+
+def fail():
+    raise ValueError('bad input')
+
+
+def crash():
+    import os
+    os._exit(1)
+'''
+
+HELPERS = '''def decorate(name):
+    return '<{}>'.format(name)
+'''
+
+
+def write_file(directory, name, content):
+    path = os.path.join(str(directory), name)
+    with open(path, 'w') as f:
+        f.write(content)
+    return path
+
+
+@pytest.fixture
+def start_worker(tmpdir):
+    workers = []
+    write_file(tmpdir, 'helpers.py', HELPERS)
+
+    def start(signature, content=ENDPOINT):
+        path = write_file(tmpdir, 'endpoint.py', content)
+        worker = EndpointWorker('e', path, str(tmpdir), signature, content_digest(content))
+        worker.start()
+        workers.append(worker)
+        return worker
+    yield start
+    for worker in workers:
+        worker.stop()
+
+
+@pytest.mark.unit
+def test_call_binds_arguments(start_worker, tmpdir):
+    worker = start_worker('greet(name, excited)')
+    assert worker.call({'name': 'ann', 'excited': True}) == ('', 'greeting ann\nhello <ann>!\n')
+    # The namespace is kept between calls
+    assert worker.call({'name': 'bob', 'excited': False}) == ('', 'greeting bob\nhello <bob>\n')
+    assert worker.imported_files == [os.path.join(str(tmpdir), 'helpers.py')]
+
+
+@pytest.mark.unit
+def test_arguments_shadow_module_names(start_worker):
+    worker = start_worker('GREETING')
+    assert worker.call({}) == ('', 'hello\n')
+    assert worker.call({'GREETING': 'hi'}) == ('', 'hi\n')
+
+
+@pytest.mark.unit
+def test_file_runs_as_main_once(start_worker):
+    worker = start_worker('started_as')
+    # Output printed at import is not part of the responses
+    assert worker.call({}) == ('', 'script\n')
+
+
+@pytest.mark.unit
+def test_errors_are_returned(start_worker):
+    worker = start_worker('fail()')
+    error, output = worker.call({})
+    assert output == ''
+    assert error.startswith('Traceback')
+    assert 'ValueError: bad input' in error
+    # The frame of the worker is not shown
+    assert 'endpoint_worker.py' not in error
+    assert worker.alive
+
+
+@pytest.mark.unit
+def test_load_errors_are_returned_for_every_call(start_worker):
+    worker = start_worker('greet(name)', content='def greet(name):\n    return name +\n')
+    for _ in range(2):
+        error, output = worker.call({'name': 'ann'})
+        assert output == ''
+        assert 'SyntaxError' in error
+
+
+@pytest.mark.unit
+def test_crashed_worker(start_worker):
+    worker = start_worker('crash()')
+    error, output = worker.call({})
+    assert (error, output) == ('Endpoint worker for e exited unexpectedly\n', '')
+    worker._process.join(timeout=5)
+    assert not worker.alive
+
+
+@pytest.mark.unit
+def test_stop_waits_for_requests(start_worker):
+    worker = start_worker('greet(name)')
+    with worker.serving():
+        worker.stop()
+        assert worker.alive
+        assert worker.call({'name': 'ann'}) == ('', 'greeting ann\nhello <ann>\n')
+    worker._process.join(timeout=5)
+    assert not worker.alive
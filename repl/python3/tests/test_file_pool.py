@@ -0,0 +1,132 @@
+# encoding: utf-8
+import os
+import time
+import signal
+
+import pytest
+
+from file_pool import WarmInterpreterPool
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+@pytest.fixture
+def pool():
+    pool = WarmInterpreterPool(size=1, preload=['json'])
+    pool.start()
+    yield pool
+    pool.stop()
+
+
+def write_file(directory, name, content):
+    path = os.path.join(str(directory), name)
+    with open(path, 'w') as f:
+        f.write(content)
+    return path
+
+
+def run_file(pool, path, env=None):
+    process = pool.spawn(path, os.path.dirname(path), env)
+    stdout, stderr = process.communicate()
+    return process, stdout.decode('utf-8'), stderr.decode('utf-8')
+
+
+@pytest.mark.unit
+def test_spawn_runs_file_like_python(pool, tmpdir):
+    # Named like a kernel module, the file must still get its own
+    write_file(tmpdir, 'metrics.py', "WHO = 'user metrics'\n")
+    path = write_file(tmpdir, 'main.py', (
+        "import os, sys, metrics\n"
+        "print(__name__, metrics.WHO, os.getcwd() == os.path.dirname(sys.argv[0]), os.environ['GREETING'])\n"
+        "print('oops', file=sys.stderr)\n"
+    ))
+    process, stdout, stderr = run_file(pool, path, {'GREETING': 'hello'})
+    assert process.returncode == 0
+    assert stdout == '__main__ user metrics True hello\n'
+    assert stderr == 'oops\n'
+    assert process.rusage['maxRss'] > 0
+
+
+@pytest.mark.unit
+def test_spawn_reports_failures(pool, tmpdir):
+    process, _, stderr = run_file(pool, write_file(tmpdir, 'fail.py', "raise ValueError('bad')\n"))
+    assert process.returncode == 1
+    assert stderr.startswith('Traceback')
+    assert 'ValueError: bad' in stderr
+    # Children are single use, nothing is left over for the next run
+    process, stdout, _ = run_file(pool, write_file(tmpdir, 'exit.py', "import sys\nprint('x')\nsys.exit(3)\n"))
+    assert (process.returncode, stdout) == (3, 'x\n')
+
+
+@pytest.mark.unit
+def test_restart_replaces_zygote(pool, tmpdir):
+    path = write_file(tmpdir, 'main.py', "print('ran')\n")
+    zygote = pool._process
+    pool.restart()
+    assert pool._process is not zygote
+    assert pool._process.pid != zygote.pid
+    zygote.join(timeout=5)
+    assert not zygote.is_alive()
+    assert run_file(pool, path)[1] == 'ran\n'
+
+
+@pytest.mark.unit
+def test_zygote_is_replaced_after_max_executions(tmpdir):
+    pool = WarmInterpreterPool(size=1, max_executions=1)
+    pool.start()
+    try:
+        path = write_file(tmpdir, 'main.py', "print('ran')\n")
+        assert run_file(pool, path)[1] == 'ran\n'
+        zygote = pool._process
+        assert run_file(pool, path)[1] == 'ran\n'
+        assert pool._process is not zygote
+    finally:
+        pool.stop()
+
+
+@pytest.mark.unit
+def test_dead_zygote_is_restarted(pool, tmpdir):
+    path = write_file(tmpdir, 'main.py', "print('ran')\n")
+    zygote = pool._process
+    os.kill(zygote.pid, signal.SIGKILL)
+    zygote.join(timeout=5)
+    assert not pool.alive
+    assert run_file(pool, path)[1] == 'ran\n'
+    assert pool._process is not zygote
+
+
+@pytest.mark.unit
+def test_spawn_does_not_leak_the_environment_of_the_kernel(monkeypatch, tmpdir):
+    monkeypatch.setenv('KERNEL_SECRET', 'x')
+    pool = WarmInterpreterPool(size=1)
+    pool.start()
+    try:
+        path = write_file(tmpdir, 'main.py', "import os\nprint(sorted(os.environ))\n")
+        assert run_file(pool, path, {'PYTHONPATH': str(tmpdir)})[1] == "['PYTHONPATH']\n"
+    finally:
+        pool.stop()
+
+
+@pytest.mark.unit
+def test_stuck_zygote_times_out_and_is_replaced(tmpdir):
+    pool = WarmInterpreterPool(size=1, start_timeout=0.5)
+    pool.start()
+    try:
+        marker = os.path.join(str(tmpdir), 'ran')
+        path = write_file(tmpdir, 'main.py', "import time\ntime.sleep(0.5)\nopen({!r}, 'w').close()\n".format(marker))
+        zygote = pool._process
+        os.kill(zygote.pid, signal.SIGSTOP)
+        try:
+            with pytest.raises(TimeoutError):
+                pool.spawn(path, str(tmpdir))
+            assert pool._process is not zygote
+        finally:
+            os.kill(zygote.pid, signal.SIGCONT)
+        # The run given up on is killed if the old zygote starts it after all
+        zygote.join(timeout=5)
+        assert not zygote.is_alive()
+        time.sleep(1)
+        assert not os.path.exists(marker)
+        assert run_file(pool, write_file(tmpdir, 'other.py', "print('ran')\n"))[1] == 'ran\n'
+    finally:
+        pool.stop()
@@ -0,0 +1,79 @@
+# encoding: utf-8
+import signal
+import asyncio
+import pytest
+
+from jobs import JobTable, DEQUEUED, SIGNALLED
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+class FakeProcess:
+    def __init__(self):
+        self.signals = []
+
+    def send_signal(self, signum):
+        self.signals.append(signum)
+
+
+async def _run(job, started, process=None):
+    await started.wait()
+    if process is not None:
+        job.attach(process)
+    await asyncio.sleep(10)
+
+
+@pytest.mark.unit
+def test_queued_job_is_dequeued(loop):
+    jobs = JobTable()
+    jobs.add('a', 'c', _run, asyncio.Event())
+    loop.run_until_complete(asyncio.sleep(0))
+    assert jobs.interrupt('a') == DEQUEUED
+    loop.run_until_complete(asyncio.sleep(0))
+    assert jobs.get('a') is None
+    assert jobs.interrupt('a') is None
+
+
+@pytest.mark.unit
+def test_cancel_escalates_to_sigkill(loop):
+    jobs = JobTable(grace_period=0.01)
+    started = asyncio.Event()
+    process = FakeProcess()
+    job = jobs.add('a', 'c', _run, started, process)
+    started.set()
+    loop.run_until_complete(asyncio.sleep(0))
+    assert jobs.interrupt('a') == SIGNALLED
+    assert jobs.cancel('a') == SIGNALLED
+    loop.run_until_complete(asyncio.sleep(0.05))
+    assert process.signals == [signal.SIGINT, signal.SIGTERM, signal.SIGKILL]
+    job.task.cancel()
+    loop.run_until_complete(asyncio.sleep(0))
+    assert len(jobs) == 0
+
+
+@pytest.mark.unit
+def test_signal_while_starting_is_delivered_on_attach(loop):
+    jobs = JobTable()
+    job = jobs.add('a', 'c', _run, asyncio.Event())
+    job.leave_queue()
+    assert jobs.interrupt('a') == SIGNALLED
+    process = FakeProcess()
+    job.attach(process)
+    assert process.signals == [signal.SIGINT]
+    job.task.cancel()
+    loop.run_until_complete(asyncio.sleep(0))
+
+
+@pytest.mark.unit
+def test_failed_job_is_reported(loop):
+    failures = []
+    jobs = JobTable(on_failure=lambda job, error: failures.append((job.cell_id, error)))
+
+    async def fail(job):
+        raise RuntimeError('bash is gone')
+    jobs.add('a', 'c', fail)
+    loop.run_until_complete(asyncio.sleep(0))
+    assert len(failures) == 1
+    assert failures[0][0] == 'a'
+    assert 'RuntimeError: bash is gone' in failures[0][1]
+    assert len(jobs) == 0
@@ -0,0 +1,41 @@
+# encoding: utf-8
+import os
+import pytest
+
+prometheus_client = pytest.importorskip('prometheus_client')
+
+from metrics import KernelCollector, resident_memory  # noqa: E402
+from scheduler import Scheduler  # noqa: E402
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+class FakeWorker:
+    def __init__(self, pid, alive=True):
+        self.pid = pid
+        self.alive = alive
+
+
+class FakeServer:
+    def __init__(self):
+        self.scheduler = Scheduler()
+        self.repl_worker = FakeWorker(os.getpid())
+        self.shell = FakeWorker(None, alive=False)
+        self._endpoint_workers = {'e': FakeWorker(os.getpid())}
+
+
+@pytest.mark.unit
+def test_kernel_collector():
+    metrics = {metric.name: metric for metric in KernelCollector(FakeServer()).collect()}
+    queued = {sample[1]['job_class']: sample[2] for sample in metrics['kernel_jobs_queued'].samples}
+    assert queued == {'repl': 0, 'shell': 0, 'file': 0, 'endpoint': 0}
+    subprocesses = {sample[1]['kind']: sample[2] for sample in metrics['kernel_subprocesses'].samples}
+    assert subprocesses == {'repl': 1, 'shell': 0, 'endpoint': 1, 'file': 0}
+    if os.path.exists('/proc/self/statm'):
+        workers = {sample[1]['worker'] for sample in metrics['kernel_worker_resident_memory_bytes'].samples}
+        assert workers == {'repl', 'endpoint:e'}
+
+
+@pytest.mark.unit
+def test_resident_memory_of_missing_process():
+    assert resident_memory(2 ** 22 + 1) is None
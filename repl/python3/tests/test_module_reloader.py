@@ -0,0 +1,85 @@
+# encoding: utf-8
+import os
+import sys
+import pytest
+import importlib
+
+from module_reloader import ModuleReloader
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+@pytest.fixture
+def code_files(tmpdir):
+    """A file path root with a package of modules importing each other"""
+    root = str(tmpdir)
+    files = {
+        'reload_pkg/__init__.py': '',
+        'reload_pkg/config.py': 'SCALE = 2\n',
+        'reload_pkg/ops.py': 'from .config import SCALE\n\n\ndef scale(x):\n    return x * SCALE\n',
+        'reload_pkg/model.py': 'from reload_pkg import ops\n\n\ndef predict(x):\n    return ops.scale(x) + 1\n',
+        'reload_other.py': 'VALUE = 1\n'
+    }
+    for path, content in files.items():
+        write(root, path, content)
+    sys.path.insert(0, root)
+    importlib.invalidate_caches()
+    yield root
+    sys.path.remove(root)
+    for name in list(sys.modules):
+        if name.startswith('reload_'):
+            del sys.modules[name]
+
+
+def write(root, path, content):
+    full_path = os.path.join(root, path)
+    if not os.path.exists(os.path.dirname(full_path)):
+        os.makedirs(os.path.dirname(full_path))
+    with open(full_path, 'w') as f:
+        f.write(content)
+    return full_path
+
+
+@pytest.mark.unit
+def test_dependency_graph(code_files):
+    importlib.import_module('reload_pkg.model')
+    importlib.import_module('reload_other')
+    reloader = ModuleReloader(code_files)
+    assert set(reloader.tracked_modules()) == {'reload_pkg', 'reload_pkg.config', 'reload_pkg.ops',
+                                               'reload_pkg.model', 'reload_other'}
+    graph = reloader.dependency_graph()
+    assert graph['reload_pkg.ops'] == {'reload_pkg', 'reload_pkg.config'}
+    assert graph['reload_pkg.model'] == {'reload_pkg', 'reload_pkg.ops'}
+    assert graph['reload_other'] == set()
+
+    config_path = os.path.join(code_files, 'reload_pkg', 'config.py')
+    assert reloader.affected_modules([config_path]) == ['reload_pkg.config', 'reload_pkg.ops', 'reload_pkg.model']
+    assert reloader.affected_modules([os.path.join(code_files, 'unknown.py')]) == []
+
+
+@pytest.mark.unit
+def test_reload_rebinds_namespace(code_files):
+    namespace = {}
+    exec('from reload_pkg.model import predict\nimport reload_other\nkept = reload_other.VALUE', namespace)
+    assert namespace['predict'](3) == 7
+
+    path = write(code_files, 'reload_pkg/config.py', 'SCALE = 3\n')
+    reloaded, errors = ModuleReloader(code_files).reload([path], namespace)
+    assert reloaded == ['reload_pkg.config', 'reload_pkg.ops', 'reload_pkg.model']
+    assert errors == {}
+    assert namespace['predict'](3) == 10
+    # Unrelated modules are left alone
+    assert namespace['kept'] == 1
+
+
+@pytest.mark.unit
+def test_reload_error_skips_dependents(code_files):
+    namespace = {}
+    exec('from reload_pkg.model import predict', namespace)
+
+    path = write(code_files, 'reload_pkg/config.py', 'SCALE = \n')
+    reloaded, errors = ModuleReloader(code_files).reload([path], namespace)
+    assert reloaded == []
+    assert list(errors) == ['reload_pkg.config']
+    assert 'SyntaxError' in errors['reload_pkg.config']
+    assert namespace['predict'](3) == 7
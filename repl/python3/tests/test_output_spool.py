@@ -0,0 +1,59 @@
+# encoding: utf-8
+import os
+import pytest
+
+from output_spool import OutputSpools
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+@pytest.fixture
+def spools(tmpdir):
+    return OutputSpools(str(tmpdir), preview_size=10, tail_size=4, kept=2)
+
+
+@pytest.mark.unit
+def test_small_output_is_emitted(spools):
+    assert spools.write('a', 'stdout', 'hello') == 'hello'
+    assert spools.write('a', 'stderr', 'oops') == 'oops'
+    assert spools.finish('a') == ([], None)
+    assert spools.get('a') is None
+
+
+@pytest.mark.unit
+def test_large_output_is_spooled(spools):
+    assert spools.write('a', 'stdout', '0123456') == '0123456'
+    assert spools.write('a', 'stdout', '789abcdef') == '789'
+    assert spools.write('a', 'stderr', 'ghi') == ''
+    assert spools.write('a', 'stdout', 'jkl') == ''
+    output = spools.get('a')
+    assert output.read(0, 100) == ('0123456789abcdefghijkl', 22)
+
+    tail, spool = spools.finish('a')
+    # Only the last characters are emitted, with their stream
+    assert tail == [('stderr', 'i'), ('stdout', 'jkl')]
+    assert spool == {'token': output.token, 'size': 22, 'headBytes': 10, 'tailOffset': 18}
+    assert output.read(spool['headBytes'], spool['tailOffset'] - spool['headBytes']) == ('abcdefgh', 18)
+
+
+@pytest.mark.unit
+def test_read_keeps_whole_characters(spools):
+    spools.write('a', 'stdout', 'é' * 20)
+    output = spools.get('a')
+    # Cut in the middle of a character at both ends
+    assert output.read(1, 5) == ('éé', 6)
+    assert output.read(2, 5) == ('éé', 6)
+    tail, spool = spools.finish('a')
+    assert output.read(38, 100) == ('é', 40)
+
+
+@pytest.mark.unit
+def test_old_spools_are_deleted(spools):
+    paths = []
+    for cell_id in ('a', 'b', 'a', 'c'):
+        spools.write(cell_id, 'stdout', 'x' * 20)
+        paths.append(spools.get(cell_id).path)
+        spools.finish(cell_id)
+    # The second run of a replaced the first, b was evicted
+    assert [os.path.exists(path) for path in paths] == [False, False, True, True]
+    assert spools.get('b') is None
@@ -0,0 +1,101 @@
+# encoding: utf-8
+import os
+import signal
+import asyncio
+
+import pytest
+
+pytest.importorskip('tornado')
+
+from repl_worker import REPLWorker
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+class Recorder:
+    """Messages and restarts reported by a worker"""
+    def __init__(self):
+        self.messages = []
+        self.lost = []
+
+    def on_message(self, message):
+        self.messages.append(message)
+
+    def on_restart(self, lost_jobs):
+        self.lost.extend(lost_jobs)
+
+    def streams(self, cell_id, stream_type='stdout'):
+        return [message['data'] for message in self.messages
+                if message['type'] == 'stream' and message['cellId'] == cell_id
+                and message['streamType'] == stream_type]
+
+
+@pytest.fixture
+def recorder():
+    return Recorder()
+
+
+@pytest.fixture
+def worker(loop, recorder):
+    worker = REPLWorker(recorder.on_message, on_restart=recorder.on_restart)
+    worker.start()
+    yield worker
+    worker.stop()
+
+
+def run(loop, future, timeout=10):
+    return loop.run_until_complete(asyncio.wait_for(future, timeout))
+
+
+async def _wait_for(condition, timeout=10):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError('Condition not met within {} seconds'.format(timeout))
+
+
+@pytest.mark.unit
+def test_cells_run_in_the_worker_and_share_the_namespace(loop, worker, recorder):
+    assert worker.pid != os.getpid()
+    run(loop, worker.submit('a', 'c', 'x = 41'))
+    assert run(loop, worker.submit('b', 'c', "import sys\nprint(x + 1)\nprint('oops', file=sys.stderr)")) is True
+    assert recorder.streams('b') == ['42\n']
+    assert recorder.streams('b', 'stderr') == ['oops\n']
+
+
+@pytest.mark.unit
+def test_output_is_streamed_while_the_cell_runs(loop, worker, recorder):
+    future = worker.submit('a', 'c', "import sys, time\nprint('first')\ntime.sleep(0.5)\nprint('oops', file=sys.stderr)")
+    # The first line arrives while the cell is still sleeping
+    loop.run_until_complete(_wait_for(lambda: recorder.streams('a')))
+    assert not future.done()
+    assert recorder.streams('a') == ['first\n']
+    assert run(loop, future) is True
+    assert recorder.streams('a', 'stderr') == ['oops\n']
+    assert recorder.messages[-1]['type'] == 'result'
+    assert recorder.messages[-1]['usage']['wallTime'] >= 0.5
+
+
+@pytest.mark.unit
+def test_sigint_interrupts_the_cell_and_keeps_the_namespace(loop, worker, recorder):
+    run(loop, worker.submit('a', 'c', 'x = 41'))
+    future = worker.submit('b', 'c', "print('started', flush=True)\nwhile True:\n    pass")
+    loop.run_until_complete(_wait_for(lambda: recorder.streams('b')))
+    worker.send_signal(signal.SIGINT)
+    assert run(loop, future) is True
+    assert 'KeyboardInterrupt' in ''.join(recorder.streams('b', 'stderr'))
+    run(loop, worker.submit('c', 'c', 'print(x + 1)'))
+    assert recorder.streams('c') == ['42\n']
+
+
+@pytest.mark.unit
+def test_worker_is_restarted_after_it_dies(loop, worker, recorder):
+    run(loop, worker.submit('a', 'c', 'x = 41'))
+    pid = worker.pid
+    assert run(loop, worker.submit('b', 'c', 'import os\nos._exit(1)')) is False
+    assert [job['cellId'] for job in recorder.lost] == ['b']
+    assert worker.pid != pid
+    # The new worker starts with an empty namespace
+    run(loop, worker.submit('c', 'c', "print('x' in globals())"))
+    assert recorder.streams('c') == ['False\n']
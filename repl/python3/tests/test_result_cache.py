@@ -0,0 +1,72 @@
+# encoding: utf-8
+import time
+import pytest
+
+from result_cache import ResultCache, FileDigests, parse_cache_config
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+class FakeWorker:
+    def __init__(self, imported_files):
+        self.imported_files = imported_files
+        self.import_digests = {}
+
+
+@pytest.mark.unit
+def test_parse_cache_config():
+    assert parse_cache_config({'name': 'a'}) is None
+    assert parse_cache_config({'cache': True}) == 60
+    assert parse_cache_config({'cache': True, 'cacheTtl': 5}) == 5
+    with pytest.raises(ValueError):
+        parse_cache_config({'cache': True, 'cacheTtl': 0})
+    with pytest.raises(ValueError):
+        parse_cache_config({'cache': True, 'cacheTtl': '5'})
+
+
+@pytest.mark.unit
+def test_result_cache_expires_entries():
+    cache = ResultCache()
+    cache.put('a', 'output', 0.01)
+    assert cache.get('a') == 'output'
+    time.sleep(0.02)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+    assert cache.size == 0
+
+
+@pytest.mark.unit
+def test_result_cache_evicts_least_recently_used():
+    cache = ResultCache(max_bytes=10)
+    cache.put('a', 'aaaa', 60)
+    cache.put('b', 'bbbb', 60)
+    # Make b the least recently used
+    cache.get('a')
+    cache.put('c', 'cccc', 60)
+    assert cache.get('b') is None
+    assert cache.get('a') == 'aaaa'
+    assert cache.get('c') == 'cccc'
+    assert cache.size == 8
+    # Larger than the whole cache
+    cache.put('d', 'd' * 11, 60)
+    assert cache.get('d') is None
+
+
+@pytest.mark.unit
+def test_result_cache_from_environ():
+    assert ResultCache.from_environ({'KERNEL_ENDPOINT_CACHE_MAX_BYTES': '10'}).max_bytes == 10
+
+
+@pytest.mark.unit
+def test_dependency_digest_detects_changed_imports(tmpdir):
+    helper = tmpdir.join('helper.py')
+    helper.write('FACTOR = 2\n')
+    digests = FileDigests()
+    worker = FakeWorker([str(helper)])
+    first = digests.dependency_digest(worker)
+    assert first is not None
+    assert digests.dependency_digest(worker) == first
+    helper.write('FACTOR = 30\n')
+    assert digests.dependency_digest(worker) is None
+    # A new worker imports the new content
+    assert digests.dependency_digest(FakeWorker([str(helper)])) not in (None, first)
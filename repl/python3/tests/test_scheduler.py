@@ -0,0 +1,74 @@
+# encoding: utf-8
+import asyncio
+import pytest
+
+from scheduler import Scheduler, REPL, FILE, ENDPOINT
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+async def _job(scheduler, job_class, key, started, release):
+    async with scheduler.slot(job_class, key):
+        started.append(key)
+        await release.wait()
+
+
+def _run_jobs(loop, scheduler, jobs, steps):
+    """Start jobs, then release them one at a time. Returns the order in which they started."""
+    started = []
+    releases = []
+    tasks = []
+    for job_class, key in jobs:
+        release = asyncio.Event()
+        releases.append(release)
+        tasks.append(loop.create_task(_job(scheduler, job_class, key, started, release)))
+    loop.run_until_complete(asyncio.sleep(0))
+    for index in steps:
+        releases[index].set()
+        loop.run_until_complete(asyncio.sleep(0.01))
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.sleep(0))
+    return started
+
+
+@pytest.mark.unit
+def test_class_limits(loop):
+    scheduler = Scheduler(file_max_running=2)
+    tasks = [loop.create_task(scheduler.acquire(FILE, key)) for key in 'abc']
+    loop.run_until_complete(asyncio.sleep(0))
+    assert [task.done() for task in tasks] == [True, True, False]
+    assert scheduler.status()['classes']['file']['queued'] == 1
+    scheduler.release(FILE)
+    loop.run_until_complete(asyncio.sleep(0))
+    assert tasks[2].done()
+
+
+@pytest.mark.unit
+def test_keys_take_turns(loop):
+    scheduler = Scheduler()
+    jobs = [(REPL, 'busy'), (REPL, 'busy'), (REPL, 'busy'), (REPL, 'other')]
+    started = _run_jobs(loop, scheduler, jobs, [0, 1, 3])
+    assert started == ['busy', 'busy', 'other', 'busy']
+
+
+@pytest.mark.unit
+def test_cells_run_ahead_of_endpoints(loop):
+    scheduler = Scheduler(max_running=1)
+    jobs = [(ENDPOINT, 'e1'), (ENDPOINT, 'e2'), (FILE, 'f'), (REPL, 'r')]
+    started = _run_jobs(loop, scheduler, jobs, [0, 3, 2])
+    assert started == ['e1', 'r', 'f', 'e2']
+
+
+@pytest.mark.unit
+def test_cancelled_waiter_leaves_queue(loop):
+    scheduler = Scheduler(file_max_running=1)
+    first = loop.create_task(scheduler.acquire(FILE, 'a'))
+    second = loop.create_task(scheduler.acquire(FILE, 'b'))
+    loop.run_until_complete(asyncio.sleep(0))
+    second.cancel()
+    loop.run_until_complete(asyncio.sleep(0))
+    assert first.done()
+    assert scheduler.status()['queued'] == 0
+    scheduler.release(FILE)
+    assert scheduler.status()['running'] == 0
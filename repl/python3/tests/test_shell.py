@@ -0,0 +1,105 @@
+# encoding: utf-8
+import gc
+import signal
+import asyncio
+
+import pytest
+
+pytest.importorskip('tornado')
+
+from jobs import Job
+from shell import BashCoprocess
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+class Display:
+    """Output of the cells, by stream type"""
+    def __init__(self):
+        self.output = {'stdout': '', 'stderr': ''}
+
+    def __call__(self, lines, stream_type):
+        self.output[stream_type] += ''.join(lines)
+
+
+@pytest.fixture
+def shell(loop):
+    shell = BashCoprocess()
+    yield shell
+    shell.stop()
+    if shell.pid is not None:
+        loop.run_until_complete(shell._process.wait())
+    # Transports of the bash processes that exited are closed while the loop is still open
+    gc.collect()
+
+
+def execute(loop, shell, code):
+    display = Display()
+    returncode, usage = loop.run_until_complete(asyncio.wait_for(shell.execute(code, display), 10))
+    return returncode, display.output['stdout'], display.output['stderr']
+
+
+@pytest.mark.unit
+def test_state_is_kept_between_cells(loop, shell):
+    assert execute(loop, shell, 'cd /tmp\nX=5\nfalse') == (1, '', '')
+    assert execute(loop, shell, 'echo $PWD $X') == (0, '/tmp 5\n', '')
+
+
+@pytest.mark.unit
+def test_marker_protocol(loop, shell):
+    # Output without a final newline, quotes and heredocs in the cell, a command reading stdin
+    code = "printf 'no newline'\necho \"it's\" >&2\ncat <<'EOF'\n$HOME\nEOF\ncat\nexit_code=7"
+    assert execute(loop, shell, code) == (0, 'no newline$HOME\n', "it's\n")
+    # Nothing of the protocol is left over for the next cell
+    assert execute(loop, shell, 'echo $exit_code') == (0, '7\n', '')
+
+
+@pytest.mark.unit
+def test_syntax_error_is_local_to_the_cell(loop, shell):
+    execute(loop, shell, 'X=1')
+    returncode, _, stderr = execute(loop, shell, 'if then')
+    assert returncode != 0
+    assert 'syntax error' in stderr
+    assert execute(loop, shell, 'echo $X') == (0, '1\n', '')
+
+
+@pytest.mark.unit
+def test_exit_starts_a_new_bash(loop, shell):
+    execute(loop, shell, 'X=1')
+    pid = shell.pid
+    returncode, _, stderr = execute(loop, shell, 'exit 3')
+    assert returncode == 3
+    assert 'Shell exited with code 3' in stderr
+    assert execute(loop, shell, 'echo "[$X]"') == (0, '[]\n', '')
+    assert shell.pid != pid
+
+
+@pytest.mark.unit
+def test_interrupt_aborts_the_cell_and_keeps_the_shell(loop, shell):
+    display = Display()
+    task = asyncio.ensure_future(shell.execute('X=5\necho started\nwhile true; do sleep 1; done\necho after', display))
+
+    async def interrupt():
+        while 'started' not in display.output['stdout']:
+            await asyncio.sleep(0.01)
+        shell.send_signal(signal.SIGINT)
+        return await asyncio.wait_for(task, 5)
+    returncode, _ = loop.run_until_complete(asyncio.wait_for(interrupt(), 10))
+    assert returncode == 130
+    assert 'after' not in display.output['stdout']
+    assert execute(loop, shell, 'echo $X') == (0, '5\n', '')
+
+
+@pytest.mark.unit
+def test_signal_before_the_cell_starts_is_not_lost(loop, shell):
+    execute(loop, shell, 'X=5')
+    # Interrupted while waiting for the shell, the job delivers the signal once the cell is sent to bash
+    job = Job('a', 'c')
+    job.send_signal(signal.SIGINT)
+    display = Display()
+    returncode, _ = loop.run_until_complete(asyncio.wait_for(
+        shell.execute('sleep 1\necho after', display, on_start=job.attach), 10))
+    assert returncode == 130
+    assert display.output['stdout'] == ''
+    # Only that cell is aborted
+    assert execute(loop, shell, 'echo $X') == (0, '5\n', '')
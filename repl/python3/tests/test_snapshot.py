@@ -0,0 +1,49 @@
+# encoding: utf-8
+import os
+import json
+import pytest
+import threading
+
+from snapshot import take_snapshot, restore_snapshot
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+@pytest.mark.unit
+def test_snapshot_round_trip(tmpdir):
+    path = str(tmpdir.join('snapshot.pickle'))
+    namespace = {
+        '__name__': '__console__',
+        'json': json,
+        'data': {'a': [1, 2, 3]},
+        'lock': threading.Lock(),
+        'square': lambda x: x * x
+    }
+    summary = take_snapshot(namespace, path)
+    assert summary['saved'] == ['data']
+    assert summary['modules'] == ['json']
+    assert sorted(summary['skipped']) == ['lock', 'square']
+    assert summary['size'] == os.path.getsize(path)
+
+    restored = {'__name__': '__console__', 'data': None, 'other': 1}
+    summary = restore_snapshot(restored, path)
+    assert sorted(summary['restored']) == ['data', 'json']
+    assert sorted(summary['skipped']) == ['lock', 'square']
+    assert summary['failed'] == {}
+    assert restored == {'__name__': '__console__', 'data': {'a': [1, 2, 3]}, 'json': json, 'other': 1}
+
+
+@pytest.mark.unit
+def test_restore_reports_failures(tmpdir):
+    path = str(tmpdir.join('snapshot.pickle'))
+    take_snapshot({'json': json, 'value': 1}, path)
+    with open(path, 'rb') as f:
+        content = f.read()
+    # The module is gone by the time the snapshot is restored
+    with open(path, 'wb') as f:
+        f.write(content.replace(b'json', b'gone'))
+    restored = {}
+    summary = restore_snapshot(restored, path)
+    assert summary['restored'] == ['value']
+    assert list(summary['failed']) == ['gone']
+    assert restored == {'value': 1}
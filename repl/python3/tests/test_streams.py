@@ -0,0 +1,54 @@
+# encoding: utf-8
+import asyncio
+import pytest
+
+from streams import OutputCoalescer, read_stream_and_display
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+def _reader(loop, chunks):
+    reader = asyncio.StreamReader()
+    for chunk in chunks:
+        reader.feed_data(chunk)
+    reader.feed_eof()
+    return reader
+
+
+@pytest.mark.unit
+def test_read_stream_and_display_coalesces_lines(loop):
+    frames = []
+    stream = _reader(loop, [b'line\n'] * 1000)
+    loop.run_until_complete(read_stream_and_display(stream, lambda lines, t: frames.append(''.join(lines)), 'stdout'))
+    assert ''.join(frames) == 'line\n' * 1000
+    assert len(frames) == 1
+
+
+@pytest.mark.unit
+def test_coalescer_flushes_on_byte_budget(loop):
+    frames = []
+    output = OutputCoalescer(lambda lines, t: frames.append(''.join(lines)), 'stdout', max_bytes=10)
+    output.feed(b'0123456789abc')
+    assert frames == ['0123456789abc']
+
+
+@pytest.mark.unit
+def test_coalescer_flushes_on_deadline(loop):
+    frames = []
+    output = OutputCoalescer(lambda lines, t: frames.append(''.join(lines)), 'stdout', min_latency=0.01)
+    output.feed(b'a')
+    output.feed(b'b')
+    assert frames == []
+    loop.run_until_complete(asyncio.sleep(0.05))
+    assert frames == ['ab']
+
+
+@pytest.mark.unit
+def test_coalescer_keeps_split_characters(loop):
+    frames = []
+    data = 'é'.encode('utf-8')
+    output = OutputCoalescer(lambda lines, t: frames.append(''.join(lines)), 'stdout', max_bytes=1)
+    output.feed(data[:1])
+    output.feed(data[1:])
+    output.close()
+    assert ''.join(frames) == 'é'
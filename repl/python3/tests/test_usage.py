@@ -0,0 +1,36 @@
+# encoding: utf-8
+import os
+import pytest
+
+from usage import UsageHistory, make_usage, read_process_times
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+@pytest.mark.unit
+def test_history_keeps_last_executions():
+    history = UsageHistory(size=2)
+    for cell_id in 'abc':
+        history.record('repl', cell_id, 'c', make_usage(1))
+    assert [entry['cellId'] for entry in history.entries()] == ['b', 'c']
+    assert [entry['cellId'] for entry in history.entries(limit=1)] == ['c']
+
+
+@pytest.mark.unit
+def test_history_summary():
+    history = UsageHistory()
+    history.record('file', 'a', 'c', make_usage(1.5, 1, 0.25, 100), 0)
+    history.record('file', 'b', 'c', make_usage(0.5, 0.5, 0.25, 300), 1)
+    history.record('shell', 's', 'c', make_usage(2))
+    summary = history.summary()
+    assert summary['file'] == {'count': 2, 'wallTime': 2.0, 'cpuUser': 1.5, 'cpuSystem': 0.5, 'maxRss': 300}
+    assert summary['shell']['maxRss'] is None
+
+
+@pytest.mark.unit
+def test_read_process_times():
+    if not os.path.exists('/proc/self/stat'):
+        pytest.skip('No procfs')
+    user, system = read_process_times(os.getpid())
+    assert user >= 0 and system >= 0
+    assert read_process_times(2 ** 22 + 1) is None
@@ -0,0 +1,102 @@
+# encoding: utf-8
+"""
+Resource accounting of cell executions.
+
+Every execution reports its usage on the final `code_result` frame of the cell, the one with `done` set:
+
+    {'wallTime': 1.52, 'cpuUser': 1.31, 'cpuSystem': 0.08, 'maxRss': 104857600}
+
+Times are in seconds and `maxRss` in bytes. Where a figure can not be measured it is `None`:
+
+* REPL cells are measured by the worker with `resource.getrusage`, including the processes the cell waited for.
+  `maxRss` is the peak of the worker process, which keeps the namespace of every cell.
+* Shell cells are measured from `/proc/<pid>/stat` of bash, which includes the commands it waited for. There is no
+  peak RSS for them.
+* Files run in the pool are measured by `os.wait4` when the run exits. Without the pool only the wall time is known.
+
+The last executions are also kept in a `UsageHistory`, served by the kernel at `/usage`, to find expensive
+notebooks and size containers from real numbers. Its size is read from the environment:
+
+    KERNEL_USAGE_HISTORY_SIZE  Number of executions kept. (1000)
+"""
+import os
+import time
+
+from collections import deque
+
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+def make_usage(wall_time, cpu_user=None, cpu_system=None, max_rss=None):
+    """Return the usage of an execution in the shape sent to cells"""
+    return {
+        'wallTime': round(wall_time, 6),
+        'cpuUser': None if cpu_user is None else round(cpu_user, 6),
+        'cpuSystem': None if cpu_system is None else round(cpu_system, 6),
+        'maxRss': max_rss
+    }
+
+
+def read_process_times(pid):
+    """Return the user and system CPU seconds of the process and its waited-for children, `None` if unavailable"""
+    try:
+        with open('/proc/{}/stat'.format(pid), 'r') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name may contain spaces, the fields we need come after it. utime is the 14th field.
+    fields = stat.rsplit(')', 1)[1].split()
+    utime, stime, cutime, cstime = (int(value) for value in fields[11:15])
+    ticks = os.sysconf('SC_CLK_TCK')
+    return (utime + cutime) / ticks, (stime + cstime) / ticks
+
+
+class UsageHistory:
+    """Rolling history of the usage of the last executions of the kernel"""
+    def __init__(self, size=1000):
+        self._entries = deque(maxlen=size)
+
+    @classmethod
+    def from_environ(cls, environ=None):
+        environ = os.environ if environ is None else environ
+        return cls(int(environ.get('KERNEL_USAGE_HISTORY_SIZE', 1000)))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def record(self, kind, cell_id, channel, usage, returncode=None):
+        self._entries.append({
+            'kind': kind,
+            'cellId': cell_id,
+            'channel': channel,
+            # Wall clock time at which the execution finished
+            'finishedAt': time.time(),
+            'returncode': returncode,
+            'usage': usage
+        })
+
+    def entries(self, limit=None):
+        """Return the recorded executions, most recent last"""
+        entries = list(self._entries)
+        return entries[-limit:] if limit else entries
+
+    def summary(self):
+        """Totals of the recorded executions per kind"""
+        summary = {}
+        for entry in self._entries:
+            usage = entry['usage']
+            totals = summary.setdefault(entry['kind'], {
+                'count': 0,
+                'wallTime': 0.0,
+                'cpuUser': 0.0,
+                'cpuSystem': 0.0,
+                'maxRss': None
+            })
+            totals['count'] += 1
+            totals['wallTime'] += usage['wallTime']
+            totals['cpuUser'] += usage['cpuUser'] or 0
+            totals['cpuSystem'] += usage['cpuSystem'] or 0
+            if usage['maxRss'] is not None:
+                totals['maxRss'] = max(totals['maxRss'] or 0, usage['maxRss'])
+        return summary
@@ -0,0 +1,194 @@
+# encoding: utf-8
+"""
+Persistent connections to the Redis server of the kernel.
+
+Tornado creates a handler per request, and the handler used to open a new socket to Redis in `initialize`, so every
+cell paid for `getaddrinfo` and a TCP connect, and the socket was never closed. `RedisREPLServer` now owns a
+`ConnectionPool` and handlers borrow a connection for the duration of a cell:
+
+* Idle connections are kept, up to `max_idle`, and handed out again.
+* A connection is checked before it is handed out. One closed by Redis, or with unread data left over from a reply
+  nobody read, is dropped and replaced by a new one.
+* If sending a command on a reused connection fails, the command is sent again on a fresh connection. Nothing was
+  executed in that case, so the retry is safe.
+
+Connections are Tornado `IOStream`s, so waiting for Redis does not block the IO loop: a slow command (`KEYS *`,
+`DEBUG SLEEP`) runs on its own connection while other cells and `/ping` are served. At most `max_connections` are
+open at once, further cells wait for one to be returned.
+
+Replies are read with `resp.RespParser`, so a connection knows when a reply is complete. Configuration is read from the
+environment:
+
+    KERNEL_REDIS_POOL_SIZE        Number of idle connections kept. (4)
+    KERNEL_REDIS_MAX_CONNECTIONS  Number of connections open at once. (32)
+    KERNEL_REDIS_REPLY_TIMEOUT    Seconds to wait for Redis to send more of a reply. (30)
+"""
+import os
+import select
+import logging
+
+from datetime import timedelta
+
+import tornado.gen
+import tornado.locks
+
+from tornado.iostream import StreamClosedError
+from tornado.tcpclient import TCPClient
+
+from resp import RespParser, INCOMPLETE
+
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+logger = logging.getLogger(__name__)
+
+
+# Read whatever has arrived, up to this many bytes at a time
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class RedisConnection:
+    """A stream connected to Redis"""
+    def __init__(self, stream, reply_timeout=30.0):
+        self.stream = stream
+        self.reply_timeout = reply_timeout
+        self.stream.set_nodelay(True)
+
+    @classmethod
+    async def connect(cls, host, port, reply_timeout=30.0, connect_timeout=5.0):
+        try:
+            stream = await TCPClient().connect(host, int(port), timeout=connect_timeout)
+        except tornado.gen.TimeoutError:
+            raise ConnectionError('Timed out connecting to Redis at {}:{}'.format(host, port))
+        return cls(stream, reply_timeout)
+
+    @property
+    def closed(self):
+        return self.stream.closed()
+
+    def healthy(self):
+        """Return `False` if Redis closed the connection or data is waiting to be read"""
+        if self.closed:
+            return False
+        try:
+            readable, _, _ = select.select([self.stream.socket], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        # Readable while idle means EOF, an error, or the end of a reply nobody waited for
+        return not readable
+
+    async def send(self, data):
+        await self.stream.write(data)
+
+    async def read_replies(self, count):
+        """Read and parse count replies. Raises `tornado.gen.TimeoutError` if Redis is quiet for longer than the reply
+        timeout.
+        """
+        parser = RespParser()
+        replies = []
+        while len(replies) < count:
+            reply = parser.gets()
+            if reply is not INCOMPLETE:
+                replies.append(reply)
+                continue
+            try:
+                data = await tornado.gen.with_timeout(
+                    timedelta(seconds=self.reply_timeout),
+                    self.stream.read_bytes(READ_CHUNK_SIZE, partial=True),
+                    quiet_exceptions=(StreamClosedError,))
+            except StreamClosedError:
+                if replies:
+                    # Redis answers a protocol error and closes the connection
+                    break
+                raise ConnectionError('Redis closed the connection')
+            parser.feed(data)
+        if parser.buffered:
+            # More than was asked for, the connection is out of step with its replies
+            self.close()
+        return replies
+
+    def close(self):
+        self.stream.close()
+
+
+class ConnectionPool:
+    """Idle connections to Redis, handed out to one user at a time"""
+    def __init__(self, host, port, max_idle=4, reply_timeout=30.0, max_connections=32):
+        self.host = host
+        self.port = port
+        self.max_idle = max_idle
+        self.reply_timeout = reply_timeout
+        self.max_connections = max_connections
+        self._idle = []
+        self._slots = tornado.locks.Semaphore(max_connections)
+        # Connections handed out and not returned yet
+        self.in_use = 0
+
+    @classmethod
+    def from_environ(cls, host, port, environ=None):
+        environ = os.environ if environ is None else environ
+        return cls(
+            host,
+            port,
+            int(environ.get('KERNEL_REDIS_POOL_SIZE', 4)),
+            float(environ.get('KERNEL_REDIS_REPLY_TIMEOUT', 30)),
+            int(environ.get('KERNEL_REDIS_MAX_CONNECTIONS', 32)))
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+    async def acquire(self):
+        """Return a healthy connection, reusing an idle one if possible. Returns `(connection, reused)`."""
+        await self._slots.acquire()
+        try:
+            while self._idle:
+                connection = self._idle.pop()
+                if connection.healthy():
+                    self.in_use += 1
+                    return connection, True
+                logger.info('Dropping stale Redis connection')
+                connection.close()
+            connection = await RedisConnection.connect(self.host, self.port, self.reply_timeout)
+        except BaseException:
+            self._slots.release()
+            raise
+        self.in_use += 1
+        return connection, False
+
+    def release(self, connection):
+        """Return a connection to the pool, closing it if it is broken or the pool is full"""
+        self.in_use -= 1
+        self._slots.release()
+        if not connection.healthy() or len(self._idle) >= self.max_idle:
+            connection.close()
+        else:
+            self._idle.append(connection)
+
+    async def execute(self, command, count=1):
+        """Send commands on a borrowed connection and return their count replies, parsed by `resp`"""
+        for attempt in range(2):
+            connection, reused = await self.acquire()
+            try:
+                try:
+                    await connection.send(command)
+                except StreamClosedError:
+                    connection.close()
+                    if reused and attempt == 0:
+                        # Redis closed the idle connection in the meantime, nothing was executed
+                        logger.info('Reconnecting to Redis')
+                        continue
+                    raise ConnectionError('Redis closed the connection')
+                return await connection.read_replies(count)
+            except BaseException:
+                # Whatever is left of the reply must not be read by the next user of the connection
+                connection.close()
+                raise
+            finally:
+                self.release(connection)
+
+    def close(self):
+        for connection in self._idle:
+            connection.close()
+        self._idle = []
@@ -0,0 +1,241 @@
+# encoding: utf-8
+"""
+An incremental parser of the replies of Redis (RESP).
+
+The kernel used to read from Redis until the socket was quiet for 250 ms and split the bytes on CRLF, so every command
+took at least 250 ms, replies that arrived slowly were cut off and bulk strings containing CRLF were mangled. Replies
+are now parsed as the bytes arrive: `RespParser.gets` returns a reply as soon as its last byte has been fed, using the
+lengths of bulk strings and arrays rather than delimiters.
+
+Replies are returned as Python values:
+
+    +OK          'OK'
+    -ERR ...     RespError('ERR ...')
+    :1           1
+    $3 foo       b'foo'
+    $-1, *-1     None
+    *2 ...       [..., ...]
+
+`render_replies` turns them into the `output`/`error` of a cell.
+
+Cells are sent to Redis as a pipeline: `split_args` tokenizes each line of a cell like `redis-cli` does, and
+`encode_command` turns the arguments into a RESP multibulk request. All commands go out in one write and the replies
+come back in the order of the commands.
+"""
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+# Returned by `RespParser.gets` until a reply is complete
+INCOMPLETE = object()
+
+# Drop parsed bytes from the buffer once this many have piled up
+COMPACT_SIZE = 64 * 1024
+
+
+class ProtocolError(ValueError):
+    """Raised for bytes that are not RESP"""
+
+
+class RespError:
+    """An error reply"""
+    def __init__(self, message):
+        self.message = message
+
+    def __eq__(self, other):
+        return isinstance(other, RespError) and other.message == self.message
+
+    def __repr__(self):
+        return 'RespError({!r})'.format(self.message)
+
+
+class _ArrayHeader:
+    def __init__(self, length):
+        self.length = length
+
+
+class RespParser:
+    """Parse replies from bytes fed in chunks of any size"""
+    def __init__(self):
+        self._buffer = bytearray()
+        self._pos = 0
+        # Arrays being read, innermost last, as `[items, length]`
+        self._arrays = []
+
+    def feed(self, data):
+        self._buffer += data
+
+    @property
+    def buffered(self):
+        """`True` if bytes of a reply that is not complete yet have been fed"""
+        return self._pos < len(self._buffer) or bool(self._arrays)
+
+    def _line(self):
+        end = self._buffer.find(b'\r\n', self._pos)
+        if end < 0:
+            return None
+        line = bytes(self._buffer[self._pos:end])
+        self._pos = end + 2
+        return line
+
+    def _value(self):
+        """Read the next value, or the header of an array. Nothing is consumed if it is incomplete."""
+        start = self._pos
+        line = self._line()
+        if line is None:
+            return INCOMPLETE
+        if not line:
+            raise ProtocolError('Empty reply line')
+        kind, rest = line[:1], line[1:]
+        if kind == b'+':
+            return rest.decode('utf-8', 'replace')
+        if kind == b'-':
+            return RespError(rest.decode('utf-8', 'replace'))
+        try:
+            length = int(rest)
+        except ValueError:
+            raise ProtocolError('Invalid reply line {!r}'.format(line))
+        if kind == b':':
+            return length
+        if kind == b'$':
+            if length < 0:
+                return None
+            end = self._pos + length
+            if len(self._buffer) < end + 2:
+                # Wait for the rest of the bulk string, it may contain CRLF
+                self._pos = start
+                return INCOMPLETE
+            value = bytes(self._buffer[self._pos:end])
+            self._pos = end + 2
+            return value
+        if kind == b'*':
+            return None if length < 0 else _ArrayHeader(length)
+        raise ProtocolError('Invalid reply line {!r}'.format(line))
+
+    def _compact(self):
+        if self._pos >= COMPACT_SIZE or self._pos == len(self._buffer):
+            del self._buffer[:self._pos]
+            self._pos = 0
+
+    def gets(self):
+        """Return the next complete reply, or `INCOMPLETE` if more bytes are needed"""
+        while True:
+            value = self._value()
+            if value is INCOMPLETE:
+                self._compact()
+                return INCOMPLETE
+            if isinstance(value, _ArrayHeader):
+                if value.length:
+                    self._arrays.append([[], value.length])
+                    continue
+                value = []
+            # Add the value to the arrays it completes
+            while self._arrays:
+                items, length = self._arrays[-1]
+                items.append(value)
+                if len(items) < length:
+                    break
+                self._arrays.pop()
+                value = items
+            else:
+                self._compact()
+                return value
+
+
+def _flatten(reply, parts):
+    """Append the text of the values of reply to parts. Returns `True` if reply holds an error."""
+    if isinstance(reply, list):
+        is_error = False
+        for item in reply:
+            is_error = _flatten(item, parts) or is_error
+        return is_error
+    if isinstance(reply, RespError):
+        parts.append(reply.message)
+        return True
+    if reply is None:
+        parts.append('nil')
+    elif isinstance(reply, bytes):
+        parts.append(reply.decode('utf-8', 'replace'))
+    else:
+        parts.append(str(reply))
+    return False
+
+
+def render_replies(replies):
+    """Return `(result, is_error)` for the replies of a cell.
+
+    A single scalar reply renders as a string and anything else as a flat list of strings, nil as `'nil'`.
+    """
+    if not replies:
+        return 'Error executing command. There was no result.', True
+    parts = []
+    is_error = False
+    for reply in replies:
+        is_error = _flatten(reply, parts) or is_error
+    if len(replies) == 1 and not isinstance(replies[0], list):
+        return parts[0], is_error
+    return parts, is_error
+
+
+_ESCAPES = {'n': '\n', 'r': '\r', 't': '\t', 'b': '\b', 'a': '\a'}
+
+_HEX_DIGITS = '0123456789abcdefABCDEF'
+
+
+def split_args(line):
+    """Split a command line into arguments, as bytes, like `redis-cli` does.
+
+    Arguments are separated by whitespace. Double quotes allow the escapes `\\n`, `\\r`, `\\t`, `\\b`, `\\a` and
+    `\\xHH`, single quotes only `\\'`. Raises `ProtocolError` for unbalanced quotes.
+    """
+    args = []
+    i = 0
+    n = len(line)
+    while True:
+        while i < n and line[i].isspace():
+            i += 1
+        if i == n:
+            return args
+        arg = bytearray()
+        quote = None
+        while True:
+            if i == n:
+                if quote:
+                    raise ProtocolError('Unbalanced quotes in {!r}'.format(line))
+                break
+            c = line[i]
+            if quote == '"' and c == '\\' and i + 3 < n and line[i + 1] == 'x' \
+                    and line[i + 2] in _HEX_DIGITS and line[i + 3] in _HEX_DIGITS:
+                arg.append(int(line[i + 2:i + 4], 16))
+                i += 4
+                continue
+            if quote == '"' and c == '\\' and i + 1 < n:
+                i += 1
+                arg += _ESCAPES.get(line[i], line[i]).encode('utf-8')
+            elif quote == "'" and c == '\\' and i + 1 < n and line[i + 1] == "'":
+                i += 1
+                arg += b"'"
+            elif quote and c == quote:
+                # A closing quote must end the argument
+                if i + 1 < n and not line[i + 1].isspace():
+                    raise ProtocolError('Closing quote must be followed by a space in {!r}'.format(line))
+                i += 1
+                break
+            elif not quote and c.isspace():
+                break
+            elif not quote and c in '"\'':
+                quote = c
+            else:
+                arg += c.encode('utf-8')
+            i += 1
+        args.append(bytes(arg))
+
+
+def encode_command(args):
+    """Encode the arguments of a command as a RESP multibulk request"""
+    parts = [b'*' + str(len(args)).encode('ascii') + b'\r\n']
+    for arg in args:
+        parts.append(b'$' + str(len(arg)).encode('ascii') + b'\r\n')
+        parts.append(arg)
+        parts.append(b'\r\n')
+    return b''.join(parts)
@@ -1,7 +1,7 @@
 #!/bin/bash
 
-pip install tornado==5.0.0
-pip install flask-socketio==3.3.2
-pip install redis==2.10.6
+# Kernel runtime images come with the dependencies installed, plain base images install them on every start
+python -c 'import tornado, flask_socketio, redis, prometheus_client, msgpack' 2>/dev/null \
+    || pip install -r /opt/current/requirements.txt
 
 python /opt/current/redis_server.py
@@ -0,0 +1,192 @@
+# encoding: utf-8
+import time
+import socket
+import select
+import asyncio
+import threading
+
+import pytest
+
+tornado = pytest.importorskip('tornado')
+
+from connection_pool import ConnectionPool
+from resp import ProtocolError
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+class FakeRedis:
+    """Answers every command with `+OK`, after a second for `SLOW` and with garbage for `GARBAGE`, counting the
+    connections made to it
+    """
+    def __init__(self):
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(8)
+        self.port = self.server.getsockname()[1]
+        self.connections = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            self.connections.append(conn)
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        while True:
+            try:
+                data = conn.recv(1024)
+            except OSError:
+                return
+            if not data:
+                return
+            if data.startswith(b'SLOW'):
+                time.sleep(1)
+            if b'GARBAGE' in data:
+                conn.sendall(b'?what\r\n+OK\r\n')
+                continue
+            conn.sendall(b'+OK\r\n')
+
+    def close(self):
+        self.server.close()
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+@pytest.fixture
+def redis():
+    server = FakeRedis()
+    yield server
+    server.close()
+
+
+@pytest.mark.unit
+def test_connection_is_reused(redis):
+    async def scenario():
+        pool = ConnectionPool('127.0.0.1', redis.port, reply_timeout=1)
+        assert await pool.execute(b'SET a 1\r\n') == ['OK']
+        assert await pool.execute(b'GET a\r\n') == ['OK']
+        assert pool.idle == 1
+        assert pool.in_use == 0
+    run(scenario())
+    assert len(redis.connections) == 1
+
+
+@pytest.mark.unit
+def test_idle_connections_are_bounded(redis):
+    async def scenario():
+        pool = ConnectionPool('127.0.0.1', redis.port, max_idle=2, reply_timeout=1)
+        connections = []
+        for _ in range(3):
+            connection, reused = await pool.acquire()
+            connections.append(connection)
+        assert pool.in_use == 3
+        for connection in connections:
+            pool.release(connection)
+        assert pool.idle == 2
+        assert connections[2].closed
+    run(scenario())
+
+
+@pytest.mark.unit
+def test_slow_command_does_not_block_others(redis):
+    async def scenario():
+        pool = ConnectionPool('127.0.0.1', redis.port, reply_timeout=5)
+        finished = []
+
+        async def execute(command):
+            await pool.execute(command)
+            finished.append(command)
+        await asyncio.gather(execute(b'SLOW\r\n'), execute(b'PING\r\n'))
+        assert finished == [b'PING\r\n', b'SLOW\r\n']
+    run(scenario())
+    assert len(redis.connections) == 2
+
+
+@pytest.mark.unit
+def test_connections_are_bounded(redis):
+    async def scenario():
+        pool = ConnectionPool('127.0.0.1', redis.port, reply_timeout=1, max_connections=1)
+        replies = await asyncio.gather(*[pool.execute(b'PING\r\n') for _ in range(5)])
+        assert replies == [['OK']] * 5
+    run(scenario())
+    assert len(redis.connections) == 1
+
+
+@pytest.mark.unit
+def test_reply_timeout(redis):
+    async def scenario():
+        pool = ConnectionPool('127.0.0.1', redis.port, reply_timeout=0.1)
+        with pytest.raises(tornado.gen.TimeoutError):
+            await pool.execute(b'SLOW\r\n')
+        # The late reply must not be read by the next command
+        assert pool.idle == 0
+        assert await pool.execute(b'PING\r\n') == ['OK']
+    run(scenario())
+
+
+@pytest.mark.unit
+def test_closed_connection_is_replaced(redis):
+    async def scenario():
+        pool = ConnectionPool('127.0.0.1', redis.port, reply_timeout=1)
+        await pool.execute(b'PING\r\n')
+        # Redis dropped the idle connection, e.g. after its `timeout`
+        redis.connections[0].shutdown(socket.SHUT_RDWR)
+        redis.connections[0].close()
+        assert await pool.execute(b'PING\r\n') == ['OK']
+    run(scenario())
+    assert len(redis.connections) == 2
+
+
+@pytest.mark.unit
+def test_connection_with_unread_reply_is_replaced(redis):
+    async def scenario():
+        pool = ConnectionPool('127.0.0.1', redis.port, reply_timeout=1)
+        await pool.execute(b'PING\r\n')
+        connection = pool._idle[0]
+        # A reply nobody read, e.g. to a command that was not counted
+        redis.connections[0].sendall(b'+LATE\r\n')
+        select.select([connection.stream.socket], [], [], 1)
+        assert await pool.execute(b'PING\r\n') == ['OK']
+        assert connection.closed
+    run(scenario())
+    assert len(redis.connections) == 2
+
+
+@pytest.mark.unit
+def test_invalid_reply_closes_the_connection(redis):
+    async def scenario():
+        pool = ConnectionPool('127.0.0.1', redis.port, reply_timeout=1)
+        with pytest.raises(ProtocolError):
+            await pool.execute(b'GARBAGE\r\n')
+        # What followed the invalid reply is not read by the next command
+        assert (pool.idle, pool.in_use) == (0, 0)
+        assert await pool.execute(b'PING\r\n') == ['OK']
+    run(scenario())
+    assert len(redis.connections) == 2
+
+
+@pytest.mark.unit
+def test_unreachable_redis_raises():
+    # A port nothing listens on
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    async def scenario():
+        pool = ConnectionPool('127.0.0.1', port, reply_timeout=1)
+        with pytest.raises(OSError):
+            await pool.execute(b'PING\r\n')
+        assert pool.in_use == 0
+    run(scenario())
@@ -0,0 +1,71 @@
+# encoding: utf-8
+import asyncio
+from urllib.parse import urlencode
+
+import pytest
+
+tornado = pytest.importorskip('tornado')
+pytest.importorskip('flask_socketio')
+pytest.importorskip('prometheus_client')
+
+import tornado.web
+import tornado.testing
+import tornado.httpserver
+import tornado.httpclient
+
+import redis_server
+from connection_pool import ConnectionPool
+from test_connection_pool import FakeRedis
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+@pytest.fixture
+def redis():
+    server = FakeRedis()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def emitted(monkeypatch):
+    emitted = []
+    monkeypatch.setattr(redis_server.socketio, 'emit', lambda event, message, **kwargs: emitted.append(message))
+    return emitted
+
+
+def execute(pool, code):
+    """Run a cell through the handler, returning the response"""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        sock, port = tornado.testing.bind_unused_port()
+        app = tornado.web.Application([(r'/repl', redis_server.REPLExecutionHandler, dict(pool=pool))])
+        server = tornado.httpserver.HTTPServer(app)
+        server.add_sockets([sock])
+        query = urlencode({'code': code, 'channel': 'c', 'cellId': 'a'})
+        response = loop.run_until_complete(tornado.httpclient.AsyncHTTPClient().fetch(
+            'http://127.0.0.1:{}/repl?{}'.format(port, query), raise_error=False))
+        server.stop()
+        return response
+    finally:
+        loop.close()
+        asyncio.set_event_loop(None)
+
+
+@pytest.mark.unit
+def test_replies_are_emitted(redis, emitted):
+    response = execute(ConnectionPool('127.0.0.1', redis.port, reply_timeout=1), '\nSET a 1\n')
+    assert response.code == 200
+    assert emitted == [{'id': 'a', 'output': 'OK', 'error': ''}]
+
+
+@pytest.mark.unit
+def test_invalid_reply_is_an_error_of_the_cell(redis, emitted):
+    pool = ConnectionPool('127.0.0.1', redis.port, reply_timeout=1)
+    response = execute(pool, 'GARBAGE')
+    assert response.code == 200
+    message = emitted[0]
+    assert message['output'] == ''
+    assert message['error'] == "ERR Protocol error: Invalid reply line b'?what'"
+    assert pool.idle == 0
@@ -0,0 +1,120 @@
+# encoding: utf-8
+import pytest
+
+from resp import RespParser, RespError, ProtocolError, INCOMPLETE, render_replies, split_args, encode_command
+
+__author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
+
+
+def parse(data):
+    parser = RespParser()
+    parser.feed(data)
+    return parser.gets()
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('data, reply', [
+    (b'+OK\r\n', 'OK'),
+    (b'-ERR unknown command\r\n', RespError('ERR unknown command')),
+    (b':42\r\n', 42),
+    (b':-1\r\n', -1),
+    (b'$5\r\nhello\r\n', b'hello'),
+    (b'$0\r\n\r\n', b''),
+    (b'$-1\r\n', None),
+    (b'*-1\r\n', None),
+    (b'*0\r\n', []),
+    (b'$6\r\na\r\nb\r\n\r\n', b'a\r\nb\r\n'),
+    (b'*2\r\n$1\r\na\r\n*2\r\n:1\r\n$-1\r\n', [b'a', [1, None]]),
+    (b'*2\r\n*0\r\n*1\r\n*0\r\n', [[], [[]]]),
+])
+def test_parse_reply(data, reply):
+    assert parse(data) == reply
+
+
+@pytest.mark.unit
+def test_reply_is_complete_with_its_last_byte():
+    data = b'*3\r\n$3\r\nfoo\r\n$4\r\nb\r\nr\r\n:7\r\n'
+    parser = RespParser()
+    for i in range(len(data) - 1):
+        parser.feed(data[i:i + 1])
+        assert parser.gets() is INCOMPLETE
+    parser.feed(data[-1:])
+    assert parser.gets() == [b'foo', b'b\r\nr', 7]
+    assert parser.gets() is INCOMPLETE
+
+
+@pytest.mark.unit
+def test_replies_in_one_chunk():
+    parser = RespParser()
+    parser.feed(b'+OK\r\n:1\r\n$1\r\n')
+    assert parser.gets() == 'OK'
+    assert parser.gets() == 1
+    assert parser.gets() is INCOMPLETE
+    parser.feed(b'x\r\n')
+    assert parser.gets() == b'x'
+
+
+@pytest.mark.unit
+def test_large_bulk_string():
+    value = b'x' * 300000
+    parser = RespParser()
+    data = b'$300000\r\n' + value + b'\r\n'
+    for i in range(0, len(data), 65536):
+        assert parser.gets() is INCOMPLETE
+        parser.feed(data[i:i + 65536])
+    assert parser.gets() == value
+
+
+@pytest.mark.unit
+def test_invalid_reply():
+    with pytest.raises(ProtocolError):
+        parse(b'?what\r\n')
+    with pytest.raises(ProtocolError):
+        parse(b'$abc\r\n')
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('replies, rendered', [
+    (['OK'], ('OK', False)),
+    ([3], ('3', False)),
+    ([None], ('nil', False)),
+    ([b'caf\xc3\xa9'], ('café', False)),
+    ([RespError('ERR wrong')], ('ERR wrong', True)),
+    ([[b'a', None, [1, b'b']]], (['a', 'nil', '1', 'b'], False)),
+    ([[b'a']], (['a'], False)),
+    ([[]], ([], False)),
+    (['OK', RespError('ERR wrong')], (['OK', 'ERR wrong'], True)),
+    ([], ('Error executing command. There was no result.', True)),
+])
+def test_render_replies(replies, rendered):
+    assert render_replies(replies) == rendered
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('line, args', [
+    ('', []),
+    ('   ', []),
+    ('PING', [b'PING']),
+    ('  SET  key   value\r', [b'SET', b'key', b'value']),
+    ('SET key "hello world"', [b'SET', b'key', b'hello world']),
+    ('SET key "a\\nb\\t\\"c\\\\"', [b'SET', b'key', b'a\nb\t"c\\']),
+    ('SET key "\\x00\\xff\\xZZ"', [b'SET', b'key', b'\x00\xffxZZ']),
+    ("SET key 'it\\'s \\n'", [b'SET', b'key', b"it's \\n"]),
+    ('SET key ""', [b'SET', b'key', b'']),
+    ('SET k"ey" café', [b'SET', b'key', 'café'.encode('utf-8')]),
+])
+def test_split_args(line, args):
+    assert split_args(line) == args
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('line', ['SET key "value', "SET key 'value", 'SET key "a"b'])
+def test_split_args_invalid(line):
+    with pytest.raises(ProtocolError):
+        split_args(line)
+
+
+@pytest.mark.unit
+def test_encode_command():
+    assert encode_command([b'SET', b'key', b'a\r\nb']) == b'*3\r\n$3\r\nSET\r\n$3\r\nkey\r\n$4\r\na\r\nb\r\n'
+    assert encode_command([b'SET', b'k', b'']) == b'*3\r\n$3\r\nSET\r\n$1\r\nk\r\n$0\r\n\r\n'